@@ -0,0 +1,243 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Measure the overhead of SOCAD, over loopback, without a Virtuoso license.
+
+The server of the example (``cadence.serve()``) runs in this process, with
+several clients and a fake Cadence (socad.fake), and socad.Client threads
+send it simulations with a number of design variables. Each case is run for
+a fixed time, and its throughput and round-trip latency are reported, for:
+
+    - the path of the requests: answered by the server from its cache of
+      results ("cache") or simulated by the fake Cadence ("cadence");
+    - the codec negotiated by the clients;
+    - the payload size (number of design variables);
+    - the number of concurrent clients.
+
+The cache is kept in memory, so the "cadence" requests (whose variables are
+all different) include the cache lookup and store of a real server with a
+cache. E.g.:
+
+    python benchmarks/loopback.py --sizes 1 1000 --clients 1 4 --save base.json
+    python benchmarks/loopback.py --sizes 1 1000 --clients 1 4 --compare base.json
+
+With "--compare", it exits with code 1 if the throughput of any case falls
+more than the tolerance below the saved one, so it can run in CI.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+EXAMPLE_DIR = os.path.join(ROOT_DIR, 'example', 'socad_cadence')
+
+sys.path.insert(0, ROOT_DIR)
+
+from socad import Client, Server, log  # noqa: E402 pylint: disable=wrong-import-position
+from socad.fake import FakeCadence  # noqa: E402 pylint: disable=wrong-import-position
+from socad.metrics import percentile  # noqa: E402 pylint: disable=wrong-import-position
+
+# Requests sent by each client before the measurements
+WARMUP = 5
+
+# Values of the design variable that makes each simulation different
+_POINTS = itertools.count()
+
+
+def start_server(latency):
+    """Start the server of the example with a fake Cadence, in a thread.
+
+    Its project folder is a scratch copy of the example one.
+
+    Arguments:
+        latency (float): time, in seconds, that Cadence takes to run each
+            simulation.
+
+    Returns:
+        tuple: server address.
+    """
+    root_dir = tempfile.mkdtemp(prefix='socad_loopback_')
+    script_dir = os.path.join(root_dir, 'script')
+    shutil.copytree(os.path.join(EXAMPLE_DIR, 'script'), script_dir)
+    os.environ.setdefault('SOCAD_ROOT_DIR', root_dir)
+    os.environ.setdefault('SOCAD_SCRIPT_DIR', script_dir)
+    os.environ['SOCAD_CACHE_FILE'] = ':memory:'
+
+    sys.path.insert(0, EXAMPLE_DIR)
+    import cadence  # pylint: disable=import-outside-toplevel
+
+    server = Server(FakeCadence(latency), skill_framing=True, log_level=log.WARNING)
+    server.listen('localhost', 0)
+
+    # Daemon, so the server goes on when the clients of a case leave
+    thread = threading.Thread(target=cadence.serve, args=(server, True, True))
+    thread.daemon = True
+    thread.start()
+
+    return server.socket.getsockname()
+
+
+def design_point(path, size):
+    """Get the design variables of a simulation.
+
+    Arguments:
+        path (str): 'cache' or 'cadence'.
+        size (int): number of design variables.
+
+    Returns:
+        dict: design variables, always the same for the 'cache' path.
+    """
+    variables = dict(('W{0}'.format(i), 1e-6 * (i + 1)) for i in range(size))
+    if path == 'cadence':
+        variables['W0'] = float(next(_POINTS))
+
+    return variables
+
+
+def run_case(addr, path, codec, size, clients, duration):
+    """Measure the throughput and latency of a case.
+
+    Arguments:
+        addr (tuple): server address.
+        path (str): 'cache' or 'cadence'.
+        codec (str): codec offered by the clients.
+        size (int): number of design variables of each simulation.
+        clients (int): number of concurrent clients.
+        duration (float): time, in seconds, of the measurements.
+
+    Returns:
+        dict: requests per second, and percentiles of the round-trip time
+        (in microseconds).
+    """
+    connections = []
+    for _ in range(clients):
+        client = Client(codecs=[codec])
+        client.run(*addr)
+        connections.append(client)
+
+    latencies = [[] for _ in connections]
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(client, times):
+        for _ in range(WARMUP):
+            client.request('updateAndRun', design_point(path, size))
+        barrier.wait()
+
+        end = time.perf_counter() + duration
+        now = 0
+        while now < end:
+            variables = design_point(path, size)
+            start = time.perf_counter()
+            res = client.request('updateAndRun', variables)
+            now = time.perf_counter()
+            if res['type'] != 'updateAndRun':
+                raise RuntimeError("Simulation failed: {0}".format(res['data']))
+            times.append(now - start)
+
+    threads = [threading.Thread(target=worker, args=args)
+               for args in zip(connections, latencies)]
+    for thread in threads:
+        thread.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    for client in connections:
+        client.send_data(dict(type='info', data='exit'))
+        client.close()
+
+    times = sorted(t for times in latencies for t in times)
+
+    return dict(rate=len(times) / elapsed, p50=percentile(times, 50) * 1e6,
+                p99=percentile(times, 99) * 1e6)
+
+
+def compare(results, baseline, tolerance):
+    """Find the cases whose throughput regressed.
+
+    Arguments:
+        results (dict): results of each case, by name.
+        baseline (dict): saved results of each case, by name.
+        tolerance (float): maximum fraction of the throughput that can be
+            lost, e.g. 0.25.
+
+    Returns:
+        list: names of the cases that regressed.
+    """
+    return [name for name, res in sorted(results.items())
+            if name in baseline and res['rate'] < (1 - tolerance) * baseline[name]['rate']]
+
+
+def main():
+    """Module main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--paths', nargs='+', default=['cache', 'cadence'],
+                        choices=['cache', 'cadence'], help="paths of the requests")
+    parser.add_argument('--codecs', nargs='+', default=['json', 'binary'], help="codecs")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 100, 1000],
+                        help="number of design variables per request")
+    parser.add_argument('--clients', nargs='+', type=int, default=[1, 4],
+                        help="number of concurrent clients")
+    parser.add_argument('--duration', type=float, default=0.5,
+                        help="time, in seconds, of each case")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="time, in seconds, that Cadence takes per simulation")
+    parser.add_argument('--save', help="save the results to a JSON file")
+    parser.add_argument('--compare', help="compare with the results saved in a JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="fraction of the throughput that can be lost (with --compare)")
+    args = parser.parse_args()
+
+    addr = start_server(args.latency)
+    results = {}
+
+    print("{0:8} {1:7} {2:>8} {3:>8} {4:>10} {5:>10} {6:>10}".format(
+        'path', 'codec', 'size', 'clients', 'req/s', 'p50 (us)', 'p99 (us)'))
+
+    for path in args.paths:
+        for codec in args.codecs:
+            for size in args.sizes:
+                for clients in args.clients:
+                    res = run_case(addr, path, codec, size, clients, args.duration)
+                    results['{0}/{1}/{2}/{3}'.format(path, codec, size, clients)] = res
+                    print("{0:8} {1:7} {2:8} {3:8} {4:10.1f} {5:10.1f} {6:10.1f}".format(
+                        path, codec, size, clients, res['rate'], res['p50'], res['p99']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name in regressions:
+            print("[REGRESSION] {0}".format(name))
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Replay a journal recorded by a server against a server, to load it with
+the message mix of a real session.
+
+The journal is recorded by a server started with the ``journal_file``
+argument (SOCAD_JOURNAL_FILE in the example). The requests are replayed at
+their original speed, accelerated (e.g. "--speed 10"), or as fast as the
+server answers them ("--max-rate"). E.g.:
+
+    python benchmarks/replay.py session.journal localhost 3000 --speed 10
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from socad.journal import Replayer  # noqa: E402 pylint: disable=wrong-import-position
+from socad.metrics import percentile  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def main():
+    """Module main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('journal', help="journal file")
+    parser.add_argument('host', help="server address")
+    parser.add_argument('port', type=int, help="server port")
+    speed = parser.add_mutually_exclusive_group()
+    speed.add_argument('--speed', type=float, default=1.0,
+                       help="speed of the replay, relative to the original")
+    speed.add_argument('--max-rate', action='store_true',
+                       help="send each request as soon as possible")
+    parser.add_argument('--codecs', nargs='+', default=['json', 'binary'],
+                        help="codecs offered to the server")
+    args = parser.parse_args()
+
+    replayer = Replayer(args.journal, None if args.max_rate else args.speed)
+    res = replayer.run(args.host, args.port, args.codecs)
+
+    times = sorted(res['latencies'])
+    print("{0} requests from {1} clients in {2:.3f} s ({3:.1f} req/s)".format(
+        res['requests'], len(replayer.sessions), res['duration'],
+        res['requests'] / res['duration']))
+    if times:
+        print("Round-trip time: p50 {0:.1f} us, p99 {1:.1f} us, max {2:.1f} us".format(
+            percentile(times, 50) * 1e6, percentile(times, 99) * 1e6, times[-1] * 1e6))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -22,7 +22,9 @@ import util
 
 # Try to import 'Server' from the global package 'socad'
 try:
-    from socad import Server
+    from socad import Server, psf, skill
+    from socad.cache import ApproximateCache, ResultCache
+    from socad.log import LEVELS as LOG_LEVELS
 except ImportError as err:
     # If can't import from the global package
     try:  # Try to import from server.py
@@ -37,9 +39,277 @@ SIM_FILE = os.environ.get('SOCAD_SCRIPT_DIR') + "/loadSimulator.ocn"
 RUN_FILE = os.environ.get('SOCAD_SCRIPT_DIR') + "/run.ocn"
 VAR_FILE = os.environ.get('SOCAD_SCRIPT_DIR') + '/vars.ocn'
 OUT_FILE = os.environ.get('SOCAD_ROOT_DIR') + "/sim_res"
+RUN_INBAND_FILE = os.environ.get('SOCAD_SCRIPT_DIR') + "/run_inband.ocn"
 
+# Send the variables in the expressions and get the results in the replies,
+# instead of exchanging them through files
+INBAND = os.environ.get('SOCAD_INBAND', '0') == '1'
 
-def process_skill_request(req):
+# Let the clients evaluate any skill expression (e.g. to probe results)
+ALLOW_EVAL = os.environ.get('SOCAD_ALLOW_EVAL', '0') == '1'
+
+# Minimum level of the diagnostics ('debug', 'info', 'warning' or 'error'), and
+# file where they're written instead of being sent to Cadence
+LOG_LEVEL = os.environ.get('SOCAD_LOG_LEVEL', 'debug')
+LOG_FILE = os.environ.get('SOCAD_LOG_FILE', '')
+
+# Journal where the sessions are recorded, to be replayed (see socad.journal)
+JOURNAL_FILE = os.environ.get('SOCAD_JOURNAL_FILE', '')
+
+# Directory where the results of the profilers are written (see PROFILER_REQUESTS)
+PROFILE_DIR = os.environ.get('SOCAD_PROFILE_DIR', '')
+
+# Results directory of the simulations, with the PSF ASCII files written by Spectre
+RESULTS_DIR = os.environ.get('SOCAD_RESULTS_DIR', '')
+
+
+def open_cache():
+    """Open the cache of simulation results, if it's enabled.
+
+    The persistent cache is enabled by setting SOCAD_CACHE_FILE. The
+    approximate cache, which reuses the results of the design points within
+    a tolerance, is enabled by setting SOCAD_CACHE_TOLERANCES, with the
+    tolerances of the variables, e.g. "W1=1e-9,L1=1e-9". When both are
+    enabled, the approximate cache is in front of the persistent one.
+
+    The simulation results depend on the OCEAN scripts that are run (the
+    in-band run script, if INBAND is set) and on the files in
+    SOCAD_MODEL_FILES (model files, netlists, ...), separated by the OS path
+    separator.
+
+    Returns:
+        object -- cache of simulation results, or None if it's disabled
+    """
+    path = os.environ.get('SOCAD_CACHE_FILE')
+    tolerances = os.environ.get('SOCAD_CACHE_TOLERANCES')
+
+    model_files = [fname for fname in os.environ.get('SOCAD_MODEL_FILES', '').split(os.pathsep)
+                   if fname]
+    files = [SIM_FILE, RUN_INBAND_FILE if INBAND else RUN_FILE] + model_files
+    max_entries = int(os.environ.get('SOCAD_CACHE_SIZE', 10000))
+
+    cache = ResultCache(path, files, max_entries) if path else None
+
+    if tolerances:
+        tolerances = dict((name.strip(), float(tol)) for name, tol in
+                          (item.split('=') for item in tolerances.split(',') if item.strip()))
+        cache = ApproximateCache(tolerances, files, max_entries, backend=cache)
+
+    return cache
+
+
+def cache_lookup(req, cache):
+    """Look up the results of the simulations of a request in the cache.
+
+    Arguments:
+        req {dict} -- request object
+        cache {object} -- cache of simulation results
+
+    Returns:
+        tuple -- response object, if all the results are cached (else None),
+                 and the request with the simulations that aren't cached
+    """
+    type_ = req.get('type')
+
+    if type_ == 'updateAndRun':
+        results = cache.get(req['data'])
+        if results is not None:
+            return dict(type=type_, data=results), None
+
+    elif type_ == 'batchUpdateAndRun':
+        results = [cache.get(variables) for variables in req['data']]
+        missing = [variables for variables, res in zip(req['data'], results) if res is None]
+        if not missing:
+            return dict(type=type_, data=results), None
+        # Only the missing simulations are run, and merged with the cached ones
+        return None, dict(req, data=missing, cached=results)
+
+    return None, req
+
+
+def cache_store(req, obj, cache):
+    """Store the results of the simulations of a request in the cache.
+
+    Arguments:
+        req {dict} -- request object, as returned by cache_lookup()
+        obj {object} -- response data
+        cache {object} -- cache of simulation results
+
+    Returns:
+        object -- response data, with the cached results of the request
+    """
+    type_ = req.get('type')
+
+    if type_ == 'updateAndRun':
+        cache.put(req['data'], obj)
+
+    elif type_ == 'batchUpdateAndRun':
+        for variables, results in zip(req['data'], obj):
+            cache.put(variables, results)
+
+        if 'cached' in req:
+            fresh = iter(obj)
+            obj = [res if res is not None else next(fresh) for res in req['cached']]
+
+    return obj
+
+
+def worker_files(worker_id=None):
+    """Get the files where the variables and results of the simulations are stored.
+
+    Each worker of a simulator farm uses its own files, so the workers that
+    share the project folder don't collide.
+
+    Keyword Arguments:
+        worker_id {int} -- worker ID, if the server is part of a farm (default: None)
+
+    Returns:
+        dict -- variables file ('vars') and results file ('results')
+    """
+    if worker_id is None:
+        return dict(vars=VAR_FILE, results=OUT_FILE)
+
+    return dict(vars="{0}/vars_{1}.ocn".format(os.environ.get('SOCAD_SCRIPT_DIR'), worker_id),
+                results="{0}_{1}".format(OUT_FILE, worker_id))
+
+
+def batch_files(files, count):
+    """Get the variables and results files of each simulation in a batch.
+
+    Arguments:
+        files {dict} -- variables and results files of the server
+        count {int} -- number of simulations in the batch
+
+    Returns:
+        tuple -- list of variables files and list of results files
+    """
+    var_root, var_ext = os.path.splitext(files['vars'])
+
+    var_files = ["{0}_b{1}{2}".format(var_root, i, var_ext) for i in range(count)]
+    result_files = ["{0}_b{1}".format(files['results'], i) for i in range(count)]
+
+    return var_files, result_files
+
+
+# Errors raised by invalid client requests (e.g. missing keys or data of the
+# wrong type), answered with an error, so the server goes on
+INVALID_REQUEST = (KeyError, TypeError, AttributeError, ValueError)
+
+# Errors raised by the results of a failed simulation (e.g. an *Error* reply
+# from Cadence, or a missing results file), answered with an error, so the
+# server goes on
+FAILED_SIMULATION = (IOError, TypeError, ValueError, KeyError, IndexError)
+
+# 'info' requests that control the profilers of the server, and the method of
+# socad.profiler.Profiler each one calls
+PROFILER_REQUESTS = {
+    'profileStart': 'start_cpu',
+    'profileStop': 'stop_cpu',
+    'memoryStart': 'start_memory',
+    'memorySnapshot': 'snapshot_memory',
+    'memoryStop': 'stop_memory',
+}
+
+
+def process_local_request(req, files, cache=None, metrics=None, profiler=None):
+    """Process a request from the client that doesn't need Cadence.
+
+    Arguments:
+        req {dict} -- request object
+        files {dict} -- variables and results files of the server (updated
+                        when the server is configured as a worker of a farm)
+
+    Keyword Arguments:
+        cache {object} -- cache of simulation results (default: None)
+        metrics {Metrics} -- latency metrics of the server (default: None)
+        profiler {Profiler} -- profilers of the server (default: None)
+
+    Raises:
+        KeyError -- if the input request format is invalid
+
+    Returns:
+        dict -- response object, or None if the request needs Cadence
+    """
+    try:
+        type_ = req['type']
+        data = req['data']
+    except KeyError as err:  # if the key does not exist
+        raise KeyError(err)
+
+    if type_ == 'info' and data == 'ping':
+        return dict(type='info', data='pong')
+
+    if type_ == 'info' and data == 'cacheStats':
+        return dict(type='info', data=cache.stats() if cache is not None else None)
+
+    if type_ == 'info' and data in PROFILER_REQUESTS and profiler is not None:
+        return control_profiler(profiler, data)
+
+    if type_ == 'configure':
+        # The worker ID goes in the names of the files, so only integers are valid
+        try:
+            worker_id = int(data['worker_id'])
+        except (TypeError, ValueError):
+            return dict(type='error', data="Invalid worker ID: {0!r}".format(data['worker_id']))
+        files.update(worker_files(worker_id))
+        return dict(type='configure', data=worker_id)
+
+    if type_ == 'readResults':
+        return read_results(data)
+
+    if type_ == 'stats' and metrics is not None:
+        # Latency of each phase, as a dict or in the Prometheus text format
+        return dict(type='stats', data=metrics.prometheus() if data == 'prometheus'
+                    else metrics.stats())
+
+    return None
+
+
+def control_profiler(profiler, action):
+    """Start or stop a profiler of the server, or get its results.
+
+    Arguments:
+        profiler {Profiler} -- profilers of the server
+        action {str} -- request data, one of PROFILER_REQUESTS
+
+    Returns:
+        dict -- response object, with the results of the profiler when it's
+                stopped (summary, and pstats or snapshot file), or an error
+                message
+    """
+    try:
+        res = getattr(profiler, PROFILER_REQUESTS[action])()
+    except ValueError as err:
+        return dict(type='error', data=str(err))
+
+    return dict(type='info', data=res if res is not None else action)
+
+
+def read_results(data):
+    """Read the results of the last simulation from the PSF files, without OCEAN.
+
+    Arguments:
+        data {dict} -- name of the analysis (e.g. 'ac') and, optionally, of
+                       the signals to read (default: all of them)
+
+    Returns:
+        dict -- response object, with the values of the signals by name (or
+                an error message, if the request is invalid or the results
+                can't be read)
+    """
+    if not isinstance(data, dict) or 'analysis' not in data:
+        return dict(type='error', data="readResults needs the name of the analysis")
+
+    try:
+        values = psf.read(psf.find(RESULTS_DIR, data['analysis']), data.get('signals'))
+    except (IOError, ValueError, IndexError, KeyError, TypeError) as err:
+        # Only this request fails, the server goes on
+        return dict(type='error', data=str(err))
+
+    return dict(type='readResults', data=values)
+
+
+def process_skill_request(req, files=None):
     """Process a skill request from the client.
 
     Based on the given request object, returns the skill expression to be
@@ -48,6 +318,9 @@ def process_skill_request(req):
     Arguments:
         req {dict} -- request object
 
+    Keyword Arguments:
+        files {dict} -- variables and results files (default: worker_files())
+
     Raises:
         KeyError -- if the input request format is invalid
         TypeError -- if the type parameter of the received object is invalid
@@ -61,35 +334,87 @@ def process_skill_request(req):
     except KeyError as err:  # if the key does not exist
         raise KeyError(err)
 
+    files = files or worker_files()
+
     if type_ == 'info' and data.lower() == 'exit':
         res = 'exit'
 
+    elif type_ == 'info' and data.lower() == 'shutdown':
+        res = 'shutdown'
+
     elif type_ == 'loadSimulator':
-        res = 'loadSimulator( "{0}")'.format(SIM_FILE)
+        res = skill.call('loadSimulator', SIM_FILE)
+
+    elif type_ == 'updateAndRun' and INBAND:
+        # The circuit variables go in the expression, and the results in the reply
+        res = skill.call('updateAndRunInband', RUN_INBAND_FILE, util.vars_to_skill(data))
+
+    elif type_ == 'batchUpdateAndRun' and INBAND:
+        res = skill.call('batchUpdateAndRunInband', RUN_INBAND_FILE,
+                         [util.vars_to_skill(variables) for variables in data])
 
     elif type_ == 'updateAndRun':
         # Store circuit variables in file
-        util.store_vars_in_file(data, VAR_FILE)
-        res = 'updateAndRun("{0}" "{1}" "SOCAD_RESULT_FILE={2}")'.format(RUN_FILE, VAR_FILE, OUT_FILE)
+        util.store_vars_in_file(data, files['vars'])
+        res = skill.call('updateAndRun', RUN_FILE, files['vars'],
+                         "SOCAD_RESULT_FILE=" + files['results'])
+
+    elif type_ == 'batchUpdateAndRun':
+        # Store the circuit variables of each simulation in its own file
+        var_files, result_files = batch_files(files, len(data))
+        for variables, var_file in zip(data, var_files):
+            util.store_vars_in_file(variables, var_file)
+
+        res = skill.call('batchUpdateAndRun', RUN_FILE, var_files,
+                         ["SOCAD_RESULT_FILE=" + fname for fname in result_files])
     else:
         raise TypeError("Invalid object received from the client.")
 
     return res
 
 
-def process_skill_response(msg):
+def process_skill_response(msg, files=None, req=None):
     """Process the skill response from Cadence.
 
     Arguments:
         msg {str} -- cadence response
 
+    Keyword Arguments:
+        files {dict} -- variables and results files (default: worker_files())
+        req {dict} -- request object the response belongs to (default: None)
+
     Raises:
         TypeError -- if the input message format is invalid
 
     Returns:
         tuple -- response type (type_) and response object (obj)
     """
-    if "loadSimulator_OK" in msg:
+    files = files or worker_files()
+
+    if msg.lstrip().startswith('('):
+        # In-band reply, with the function status and the results
+        try:
+            status, obj = skill.parse(msg)
+        except ValueError as err:
+            raise TypeError("Invalid message received from Cadence: {0}".format(err))
+
+        if status == 'batchUpdateAndRunInband_OK':
+            type_ = 'batchUpdateAndRun'
+            # The results of an empty batch are an empty list, i.e. nil
+            obj = [util.get_results_from_skill(results) for results in obj or []]
+        elif status == 'updateAndRunInband_OK':
+            type_ = 'updateAndRun'
+            obj = util.get_results_from_skill(obj)
+        else:
+            raise TypeError("Invalid message received from Cadence.")
+
+    elif "batchUpdateAndRun_OK" in msg:
+        type_ = 'batchUpdateAndRun'
+        # Get the results of each simulation, in the same order of the variables
+        _, result_files = batch_files(files, len(req['data']))
+        obj = [util.get_results_from_file(fname) for fname in result_files]
+
+    elif "loadSimulator_OK" in msg:
         type_ = 'loadSimulator'
         # Get the original circuit variables (user defined) to send
         var = util.get_vars_from_file(VAR_FILE)
@@ -98,7 +423,7 @@ def process_skill_response(msg):
     elif "updateAndRun_OK" in msg:
         type_ = 'updateAndRun'
         # Get the results from file
-        obj = util.get_results_from_file(OUT_FILE)
+        obj = util.get_results_from_file(files['results'])
 
     else:
         raise TypeError("Invalid message received from Cadence.")
@@ -110,45 +435,288 @@ def main():
     """Module main function."""
     try:
         # Start the server
-        server = Server(sys)
+        server = Server(sys, skill_framing=True, log_level=LOG_LEVELS[LOG_LEVEL.lower()],
+                        log_file=LOG_FILE or None, journal_file=JOURNAL_FILE or None,
+                        profile_dir=PROFILE_DIR or None)
     except OSError as err:
         server.send_warn("[SOCKET ERROR] {0}".format(err))
         return 1
 
     host = os.environ.get('SOCAD_CLIENT_ADDR')
     port = int(os.environ.get('SOCAD_CLIENT_PORT'))
+    # Serve several clients, sharing the same Cadence session
+    multi_client = os.environ.get('SOCAD_MULTI_CLIENT', '0') == '1'
+    # Keep Cadence running after the clients leave, until a client shuts it down
+    daemon = os.environ.get('SOCAD_DAEMON', '0') == '1'
 
     try:
-        addr = server.run(host, port)
+        if multi_client:
+            server.listen(host, port)
+            server.send_skill("Waiting for clients on port {0}".format(port))
+        else:
+            addr = server.run(host, port, daemon)
 
-        # Log the connectivity to Cadence
-        log = "Connected to client with address {0}:{1}".format(addr[0], addr[1])
-        server.send_skill(log)
+            # Log the connectivity to Cadence
+            log = "Connected to client with address {0}:{1}".format(addr[0], addr[1])
+            server.send_skill(log)
 
     except IOError as err:  # NOTE: "ConnectionError" nao existe no Python 2 -_-
         server.send_warn("[CONNECTION ERROR] {0}".format(err))
+        server.log.close()  # The warning is sent in the background
         return 2
 
+    code = serve(server, multi_client, daemon)
+
+    # A client that fails (e.g. disconnects without 'exit') doesn't end a daemon
+    while daemon and code:
+        try:
+            next_client(server, multi_client)
+        except IOError as err:
+            server.send_warn("[CONNECTION ERROR] {0}".format(err))
+            break
+        code = serve(server, multi_client, daemon)
+
+    server.close(code)
+    return code
+
+
+def next_client(server, multi_client=False):
+    """Drop the current client of a daemon server, and wait for the next one.
+
+    The simulator stays loaded, and the next client is told so in the
+    handshake (see Server.session).
+
+    Arguments:
+        server {Server} -- running server, in daemon mode
+
+    Keyword Arguments:
+        multi_client {bool} -- if the server has several clients, which are
+                               accepted while it waits for requests
+                               (default: False)
+
+    Raises:
+        IOError -- if there's a communication problem
+    """
+    if multi_client:
+        if server.client is not None:
+            server.drop_client()
+        return
+
+    server.send_skill("Waiting for the next client")
+    addr = server.next_client()
+    server.send_skill("Connected to client with address {0}:{1}".format(addr[0], addr[1]))
+
+
+def slot_files(files, slot):
+    """Get the files of a simulation slot.
+
+    The simulations alternate between two slots, so the variables of the next
+    simulation can be written while Cadence runs the current one, and its
+    results don't overwrite the ones not read yet.
+
+    Arguments:
+        files {dict} -- variables and results files of the server
+        slot {int} -- slot number (0 or 1)
+
+    Returns:
+        dict -- variables and results files of the slot
+    """
+    if not slot:
+        return files
+
+    var_root, var_ext = os.path.splitext(files['vars'])
+
+    return dict(vars="{0}_{1}{2}".format(var_root, slot, var_ext),
+                results="{0}_{1}".format(files['results'], slot))
+
+
+def is_simulation(req):
+    """Check if a request is a simulation, which can be prepared in advance.
+
+    Arguments:
+        req {dict} -- request object
+
+    Returns:
+        bool -- if the request is a simulation
+    """
+    return req.get('type') in ('loadSimulator', 'updateAndRun',
+                               'batchUpdateAndRun') and not req.get('stream')
+
+
+def prepare_simulation(req, files, cache):
+    """Prepare a simulation request to be sent to Cadence.
+
+    The results already in the cache are looked up, and the variables of the
+    remaining simulations are stored in the files (or in the expression).
+
+    Arguments:
+        req {dict} -- request object
+        files {dict} -- variables and results files of the simulation
+        cache {object} -- cache of simulation results, or None
+
+    Raises:
+        KeyError -- if the input request format is invalid
+        TypeError -- if the type parameter of the received object is invalid
+
+    Returns:
+        dict -- prepared simulation, with the response object ('reply') if all
+                the results are cached, or the expression to be evaluated by
+                Cadence ('expr')
+    """
+    sim_req = req
+    if cache is not None:
+        res, sim_req = cache_lookup(req, cache)
+        if res is not None:
+            return dict(req=req, reply=res)
+
+    return dict(req=req, sim_req=sim_req, files=files, expr=process_skill_request(sim_req, files))
+
+
+def recv_request_while_busy(server):
+    """Wait for Cadence to respond, receiving the next client request in the
+    meantime.
+
+    Arguments:
+        server {Server} -- running server
+
+    Returns:
+        dict -- client request, or None if Cadence responded first
+    """
+    while not server.poll_requests():
+        if server.wait_skill():
+            return None
+
+    return server.recv_request()
+
+
+def serve(server, multi_client=False, daemon=False):
+    """Serve the client requests until the client exits.
+
+    While Cadence runs a simulation, the next request is received and
+    prepared, and it's sent to Cadence as soon as Cadence responds, before the
+    response is processed. An invalid request, or a simulation that fails,
+    gets an error reply, and the server goes on.
+
+    Arguments:
+        server {Server} -- running server
+
+    Keyword Arguments:
+        multi_client {bool} -- if the server has several clients (default: False)
+        daemon {bool} -- if the clients that exit are replaced by the next
+                         ones, until a client sends 'shutdown' (default: False)
+
+    Returns:
+        int -- return code
+    """
+    files = worker_files()  # Variables and results files
+    cache = open_cache()  # Results of the simulations already run
+
+    next_req = None  # Request received while Cadence was busy
+    staged = None  # Simulation prepared while Cadence was busy
+    slot = 0  # Slot of the files of the next simulation
+
     code = 0    # Return code
     try:
         while True:
-            # Wait for a client request
-            req = server.recv_data()
-
-            # Process the client request
-            expr = process_skill_request(req)
-
-            if expr == 'exit':
-                break
+            if staged is not None:
+                # The simulation prepared in advance is already running
+                sim, staged = staged, None
+            else:
+                # Wait for a client request (the client may have several requests queued)
+                req = next_req if next_req is not None else server.recv_request()
+                next_req = None
+
+                try:
+                    # Requests that Cadence doesn't need to process
+                    res = process_local_request(req, files, cache, server.metrics, server.profiler)
+                    if res is not None:
+                        server.send_reply(req, res)
+                        continue
+
+                    # Requests whose results are sent as soon as each one is ready
+                    if req.get('stream'):
+                        serve_stream(server, req, files, cache)
+                        continue
+
+                    # Batches of skill expressions
+                    if req.get('type') == 'evalSkill':
+                        server.send_reply(req, eval_skill(server, req))
+                        continue
+
+                    if not is_simulation(req):
+                        # Process the client request (the only ones left are 'exit'
+                        # and 'shutdown')
+                        action = process_skill_request(req, files)
+                        if action not in ('exit', 'shutdown'):
+                            raise TypeError("Invalid object received from the client.")
+                        if action == 'exit' and multi_client:
+                            # Only this client leaves, the others are still served
+                            server.drop_client()
+                            if server.clients or daemon:
+                                continue
+                        elif action == 'exit' and daemon:
+                            # The next client gets the same Cadence session
+                            next_client(server)
+                            continue
+                        break
+
+                    with server.metrics.timer('prepare'):
+                        sim = prepare_simulation(req, slot_files(files, slot), cache)
+                    sim['client'] = server.client
+                    slot = 1 - slot
+
+                    # Simulations that were already run are answered from the cache
+                    if 'reply' in sim:
+                        server.send_reply(req, sim['reply'])
+                        continue
+
+                    # Send the request to Cadence
+                    server.send_skill(sim['expr'], answered=True)
+                except INVALID_REQUEST as err:
+                    # Only the client that sent the invalid request gets the error
+                    reject_request(server, req, err)
+                    continue
+
+            # While Cadence is busy, receive and prepare the next request
+            next_req = recv_request_while_busy(server)
+            if next_req is not None and is_simulation(next_req):
+                try:
+                    with server.metrics.timer('prepare'):
+                        staged = prepare_simulation(next_req, slot_files(files, slot), cache)
+                except INVALID_REQUEST as err:
+                    reject_request(server, next_req, err)
+                else:
+                    staged['client'] = server.client
+                    slot = 1 - slot
+                next_req = None
+
+            # Wait for a response from Cadence
+            res = server.recv_skill()
+
+            # Keep Cadence busy with the next simulation
+            if staged is not None and 'expr' in staged:
+                server.send_skill(staged['expr'], answered=True)
+
+            # Process the Cadence response
+            try:
+                with server.metrics.timer('results'):
+                    typ, obj = process_skill_response(res, sim['files'], sim['sim_req'])
+                if cache is not None and typ == sim['sim_req']['type']:
+                    obj = cache_store(sim['sim_req'], obj, cache)
+            except FAILED_SIMULATION as err:
+                # Only the client of the failed simulation gets the error
+                reply = fail_simulation(server, sim['client'], err)
             else:
-                # Send the request to Cadence
-                server.send_skill(expr)
-                # Wait for a response from Cadence
-                res = server.recv_skill()
-                # Process the Cadence response
-                typ, obj = process_skill_response(res)
-                # Send the processed response to the client
-                server.send_data(dict(type=typ, data=obj))
+                if typ == 'loadSimulator':
+                    # The next clients don't need to load the simulator again
+                    server.session.update(simulator_loaded=True, variables=obj)
+                reply = dict(type=typ, data=obj)
+            # Send the processed response to the client
+            server.send_reply(sim['req'], reply, sim['client'])
+
+            if staged is not None and 'reply' in staged:
+                server.send_reply(staged['req'], staged['reply'], staged['client'])
+                staged = None
 
     except IOError as err:  # NOTE: "ConnectionError" nao existe no Python 2 -_-
         server.send_warn("[CONNECTION ERROR] {0}".format(err))
@@ -159,10 +727,125 @@ def main():
     except KeyError as err:
         server.send_warn("[KEY ERROR] {0}".format(err))
         code = 5
+    finally:
+        if cache is not None:
+            cache.close()
 
-    server.close(code)
     return code
 
 
+def reject_request(server, req, err):
+    """Answer an invalid request with an error, so the server goes on (e.g. a
+    worker of a farm, whose dispatcher would send the request to the other
+    workers if it ended).
+
+    Arguments:
+        server {Server} -- running server, whose current client sent the request
+        req {object} -- request object
+        err {Exception} -- why the request is invalid
+    """
+    server.send_warn("[WARNING] Invalid request from client {0}: {1}\n".format(
+        server.client.addr, err))
+    reply = dict(type='error', data="Invalid request: {0}".format(err))
+    if isinstance(req, dict):
+        server.send_reply(req, reply)
+    else:
+        server.send_reply({}, reply)
+        server.metrics.end_request(req)  # Not matched by the reply, which has no request
+
+
+def fail_simulation(server, client, err):
+    """Log a simulation that failed, so only its client gets the error.
+
+    Arguments:
+        server {Server} -- running server
+        client {Connection} -- client that requested the simulation
+        err {Exception} -- why the simulation failed
+
+    Returns:
+        dict -- error response object
+    """
+    server.send_warn("[WARNING] Simulation of client {0} failed: {1}\n".format(client.addr, err))
+
+    return dict(type='error', data="Simulation failed: {0}".format(err))
+
+
+def eval_skill(server, req):
+    """Evaluate the batch of skill expressions of a request.
+
+    All the expressions are sent to Cadence in a single message, and their
+    results are received in a single message too.
+
+    Arguments:
+        server {Server} -- running server
+        req {dict} -- request object, with the list of expressions
+
+    Raises:
+        KeyError -- if the input request format is invalid
+        TypeError -- if the clients can't evaluate skill expressions
+
+    Returns:
+        dict -- response object, with the result of each expression or, if it
+                fails, a dictionary with the error message
+    """
+    if not ALLOW_EVAL:
+        raise TypeError("Invalid object received from the client.")
+
+    server.send_skill_batch(req['data'])
+    results = server.recv_skill_batch()
+
+    return dict(type='evalSkill', data=[dict(error=str(res)) if isinstance(res, Exception) else res
+                                        for res in results])
+
+
+def serve_stream(server, req, files, cache=None):
+    """Serve a streamed batch of simulations.
+
+    Each simulation of the batch is run on its own, and its results are sent
+    to the client (with the index of the simulation) as soon as it ends,
+    followed by a reply of type 'end' with the number of simulations. A
+    simulation that fails gets an error reply (with its index), and the
+    stream goes on.
+
+    Arguments:
+        server {Server} -- running server
+        req {dict} -- request object
+        files {dict} -- variables and results files
+
+    Keyword Arguments:
+        cache {object} -- cache of simulation results (default: None)
+
+    Raises:
+        KeyError -- if the input request format is invalid
+        TypeError -- if the request type can't be streamed
+    """
+    if req['type'] != 'batchUpdateAndRun':
+        raise TypeError("Invalid object received from the client.")
+
+    for index, variables in enumerate(req['data']):
+        sim_req = dict(type='updateAndRun', data=variables)
+        res = cache_lookup(sim_req, cache)[0] if cache is not None else None
+
+        if res is None:
+            server.send_skill(process_skill_request(sim_req, files), answered=True)
+            msg = server.recv_skill()
+            try:
+                typ, obj = process_skill_response(msg, files)
+                if cache is not None:
+                    obj = cache_store(sim_req, obj, cache)
+            except FAILED_SIMULATION as err:
+                # Only this simulation fails, the stream goes on
+                res = fail_simulation(server, server.client, err)
+            else:
+                res = dict(type=typ, data=obj)
+
+        server.send_reply(req, dict(res, index=index))
+
+        if server.client is None:
+            return  # The client has gone, so the remaining results are useless
+
+    server.send_reply(req, dict(type='end', data=len(req['data'])))
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,122 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Run a dispatcher in front of a farm of Cadence servers.
+
+The backend servers are given as "host:port" arguments, e.g.:
+
+    python dispatcher.py --port 3000 cadence1:4000 cadence2:4000
+
+With "--fake N", N backend servers are started in this process, each one
+with a stand-in for Cadence Virtuoso, so the farm can be tried (and tested)
+without a Virtuoso license.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from socad.dispatcher import Dispatcher
+from socad.fake import FakeCadence
+from socad import Server
+
+
+def start_fake_backends(count, latency):
+    """Start backend servers with a fake Cadence.
+
+    Arguments:
+        count {int} -- number of backend servers
+        latency {float} -- time, in seconds, of each simulation
+
+    Returns:
+        list -- addresses of the backend servers
+    """
+    # The servers share a scratch project folder, like workers on a shared disk
+    root_dir = tempfile.mkdtemp(prefix='socad_farm_')
+    script_dir = os.path.join(root_dir, 'script')
+    shutil.copytree(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'script'),
+                    script_dir)
+    os.environ.setdefault('SOCAD_ROOT_DIR', root_dir)
+    os.environ.setdefault('SOCAD_SCRIPT_DIR', script_dir)
+
+    import cadence  # pylint: disable=import-outside-toplevel
+
+    backends = []
+    for _ in range(count):
+        server = Server(FakeCadence(latency), skill_framing=True)
+        server.listen('localhost', 0)
+        addr = server.socket.getsockname()
+
+        thread = threading.Thread(target=cadence.serve, args=(server, True))
+        thread.daemon = True
+        thread.start()
+
+        backends.append(addr)
+
+    return backends
+
+
+def main():
+    """Module main function."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('backends', nargs='*', help="backend servers (host:port)")
+    parser.add_argument('--host', default='localhost', help="dispatcher address")
+    parser.add_argument('--port', type=int, default=3000, help="dispatcher port")
+    parser.add_argument('--depth', type=int, default=1,
+                        help="maximum number of requests sent to a backend at once")
+    parser.add_argument('--fake', type=int, default=0,
+                        help="number of backend servers with a fake Cadence to start")
+    parser.add_argument('--latency', type=float, default=0.5,
+                        help="simulation time of the fake Cadence, in seconds")
+    args = parser.parse_args()
+
+    backends = []
+    for backend in args.backends:
+        host, port = backend.rsplit(':', 1)
+        backends.append((host, int(port)))
+
+    if args.fake:
+        backends += start_fake_backends(args.fake, args.latency)
+
+    if not backends:
+        parser.error("There are no backend servers")
+
+    dispatcher = Dispatcher(backends, depth=args.depth)
+
+    try:
+        dispatcher.connect()
+        dispatcher.listen(args.host, args.port)
+    except ConnectionError as err:
+        print("[CONNECTION ERROR] {0}".format(err))
+        return 1
+
+    print("Dispatching to {0} workers on {1}:{2}".format(len(dispatcher.workers), args.host,
+                                                          args.port))
+
+    try:
+        dispatcher.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
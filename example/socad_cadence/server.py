@@ -18,7 +18,6 @@
 import json
 import socket
 import struct
-import time
 from contextlib import contextmanager
 
 
@@ -250,7 +249,6 @@ class Server:
         Arguments:
             msg {str} -- debug message
         """
-        time.sleep(1)
         self.send_warn("[Debug] {0}".format(msg))
 
     def close(self, code):
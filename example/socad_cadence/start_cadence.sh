@@ -25,6 +25,41 @@ SOCAD_WORK_SPACE="/home/example/project_ws"
 export SOCAD_CLIENT_ADDR="localhost"
 # Client Port
 export SOCAD_CLIENT_PORT="4000"
+# Serve several clients at the same time (1) or a single client (0)
+export SOCAD_MULTI_CLIENT="0"
+# Keep Cadence and the simulator loaded when the clients leave, and wait for
+# the next ones (1), until a client sends 'shutdown', or exit (0)
+export SOCAD_DAEMON="0"
+# Send the variables and get the results in the messages exchanged with
+# Cadence (1), or through the files vars.ocn and sim_res (0)
+export SOCAD_INBAND="0"
+# Let the clients evaluate any SKILL expression in Cadence (1) or not (0)
+export SOCAD_ALLOW_EVAL="0"
+# Minimum level of the server diagnostics (debug, info, warning or error)
+export SOCAD_LOG_LEVEL="warning"
+# File where the diagnostics are written instead of being shown by Cadence
+# (empty to show them in Cadence)
+export SOCAD_LOG_FILE=""
+# Journal where the requests, replies and Cadence messages are recorded, to be
+# replayed by benchmarks/replay.py (empty to not record them)
+export SOCAD_JOURNAL_FILE=""
+# Directory where the CPU profiles and memory snapshots requested by the
+# clients are written (empty to only send their summaries to the client)
+export SOCAD_PROFILE_DIR=""
+# Results directory of the simulations (as in resultsDir() of run.ocn), to
+# read the results written by Spectre in PSF ASCII format (readResults)
+export SOCAD_RESULTS_DIR=""
+
+## Cache of simulation results
+# Database file (empty to disable the cache)
+export SOCAD_CACHE_FILE=""
+# Maximum number of cached results
+export SOCAD_CACHE_SIZE="10000"
+# Reuse the results of nearby design points, within the tolerance of each
+# variable, e.g. "W1=1e-9,L1=1e-9" (empty to disable)
+export SOCAD_CACHE_TOLERANCES=""
+# Files the results depend on, besides the OCEAN scripts (separated by ':')
+export SOCAD_MODEL_FILES=""
 
 
 #############################################
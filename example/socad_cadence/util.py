@@ -16,7 +16,8 @@
 """Helpers to handle data."""
 
 import re
-from functools import reduce
+
+from socad import si
 
 
 def get_vars_from_file(fname):
@@ -28,39 +29,17 @@ def get_vars_from_file(fname):
     Returns:
         variables {dict} -- circuit variables
     """
-    variables = {}
-
-    # Dictionary with metric prefixes
-    prefix_dict = {
-        'f': 'e-15',
-        'p': 'e-12',
-        'n': 'e-9',
-        'u': 'e-6',
-        'm': 'e-3',
-        'k': 'e3',
-        'K': 'e3',  # Kilo can be 'k' or 'K' in Cadence
-        'M': 'e6',
-        'G': 'e9',
-        'T': 'e12'
-    }
-
     pattern = r'desVar\(\s*\"(?P<param>\w+)\"\s*(?P<value>\S+)\s*\)'
 
     with open(fname, 'r') as f:
         content = f.read()
 
-    for match in re.finditer(pattern, content):
-        try:  # try to convert value to float
-            value = float(match.group('value'))
-        except ValueError:
-            # If fails, replace the prefixes by the respective exponents
-            value = float(reduce((lambda a, kv: a.replace(*kv)), prefix_dict.items(),
-                                 match.group('value')))
+    matches = re.findall(pattern, content)
 
-        # Save to dict
-        variables[match.group('param')] = value
+    # The values may have SI scale factors, e.g. 100u
+    values = si.parse_batch([value for _, value in matches])
 
-    return variables
+    return dict(zip((param for param, _ in matches), values))
 
 
 def store_vars_in_file(variables, fname):
@@ -76,6 +55,18 @@ def store_vars_in_file(variables, fname):
             f.write("desVar(\t \"{0}\" {1}\t)\n".format(key, val))
 
 
+def vars_to_skill(variables):
+    """Convert circuit variables to the list sent in a SKILL expression.
+
+    Arguments:
+        variables {dict} -- circuit variables
+
+    Returns:
+        list -- (name, value) pairs of the circuit variables
+    """
+    return [[key, val] for key, val in variables.items()]
+
+
 def get_results_from_file(fname):
     """Get simulation results from file and store in a dictionary.
 
@@ -98,3 +89,15 @@ def get_results_from_file(fname):
         results[match.group('param')] = float(match.group('value'))
 
     return results
+
+
+def get_results_from_skill(results):
+    """Get simulation results from a SKILL list and store in a dictionary.
+
+    Arguments:
+        results {list} -- (name, value) pairs of the simulation results
+
+    Returns:
+        results {dict} -- simulation results
+    """
+    return dict((name, float(value)) for name, value in results)
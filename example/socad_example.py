@@ -122,6 +122,11 @@ def main():
         data = {}
         variables = {}  # Circuit variables (to be optimized)
 
+        # A server in daemon mode keeps the simulator loaded by a previous client
+        if client.session.get('simulator_loaded'):
+            variables = client.session['variables']
+            print("[INFO] The simulator is already loaded (no need to load it again)")
+
         # Main loop
         while True:
             option = print_menu()
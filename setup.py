@@ -45,5 +45,8 @@ setup(
         'Topic :: Scientific/Engineering :: Electronic Design Automation (EDA)'
     ],
     python_requires='>=3.6',
+    extras_require={
+        'numpy': ['numpy'],  # Arrays in the binary codec, PSF results and measurements
+    },
     #install_requires=[]
 )
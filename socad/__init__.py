@@ -15,7 +15,14 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 """SOCAD root package"""
 
+import sys
+
 from .client import Client
 from .server import Server
 
 __all__ = ['Client', 'Server']
+
+# The server may run in Python 2, which can't import the asyncio client
+if sys.version_info >= (3, 6):
+    from .aio import AsyncClient
+    __all__.append('AsyncClient')
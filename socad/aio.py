@@ -0,0 +1,299 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Client, built on asyncio streams, that communicates with Cadence through a server."""
+
+import asyncio
+from collections import OrderedDict
+
+from . import codec, compression
+from .client import _is_last
+from .transport import HEADER, pack_frame, unpack_header
+
+
+class AsyncClient:
+    """An asyncio client that handles Cadence Virtuoso requests.
+
+    It speaks the same protocol as :class:`socad.Client`, but its methods are
+    coroutines, so a single event loop can drive many servers (i.e. many
+    simulators) concurrently. Requests carry an ID, so several requests can
+    be in flight on the same connection and their replies are matched by ID.
+
+    Arguments:
+        codecs (list, optional): names of the codecs offered to the server,
+            by order of preference (default: codec.PREFERENCE).
+        compressors (list, optional): names of the compressors offered to the
+            server, by order of preference (default: (), i.e. the frames are
+            never compressed).
+        compress_level (int, optional): compression level (default: None,
+            i.e. the compressor default).
+        compress_threshold (int, optional): minimum number of bytes of a
+            frame to be compressed (default: compression.THRESHOLD).
+    """
+
+    def __init__(self, codecs=codec.PREFERENCE, compressors=(), compress_level=None,
+                 compress_threshold=compression.THRESHOLD):
+        """Set up the client. The connection is only opened in run()."""
+        self.codecs = list(codecs)
+        self.codec = codec.DEFAULT  # Used until the codec is negotiated
+        self.compressors = list(compressors)
+        self.compress_level = compress_level
+        self.compress_threshold = compress_threshold
+        self.compressor = None  # Set when a compressor is negotiated
+
+        # State of the Cadence session, sent by the server in the handshake
+        # (e.g. if the simulator is already loaded)
+        self.session = {}
+
+        # Uninitialized variables
+        self.reader = None
+        self.writer = None
+        self._reader_task = None  # Receives all the data from the server
+        self._messages = None  # Received objects that aren't replies
+
+        # Request IDs
+        self._next_id = 0
+        self._pending = OrderedDict()  # Futures of the requests without reply, by ID
+        self._streams = {}  # Queues of the replies of the streamed requests, by ID
+        self._discarded = set()  # IDs of the streams whose replies are dropped
+
+    async def run(self, host, port):
+        """Start the client.
+
+        Arguments:
+            host (str): remote socket IP address.
+            port (int): remote socket port.
+
+        Raises:
+            ConnectionError: if can't connect to server.
+
+        Returns:
+            list: remote socket name.
+        """
+        try:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        except OSError as err:
+            raise ConnectionError(err)
+
+        # Same handshake as the blocking client
+        sockname = self.writer.get_extra_info('sockname')
+        await self.send_data(dict(type="info", data=sockname, codecs=self.codecs,
+                                  compressors=self.compressors))
+
+        res = await self._recv_frame()
+
+        self.codec = codec.negotiate(self.codecs, res.get("codecs"))
+        self.compressor = compression.negotiate(self.compressors, res.get("compressors"),
+                                                self.compress_level)
+        self.session = res.get("session", {})
+
+        # From now on, everything sent by the server is received in background
+        self._messages = asyncio.Queue()
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+
+        return res["data"]
+
+    async def send_data(self, obj):
+        """Send an object to the server.
+
+        Arguments:
+            obj (dict): object to send.
+
+        Raises:
+            TypeError: if the object is not serializable with the codec.
+            ConnectionError: if the socket connection is broken.
+        """
+        header, payload = pack_frame(self.codec.encode(obj), self.compressor,
+                                     self.compress_threshold)
+
+        # The stream buffers both writes, so they're not concatenated here
+        self.writer.write(header)
+        self.writer.write(payload)
+        await self.writer.drain()
+
+    async def recv_data(self):
+        """Receive an object from the server that isn't a reply to a request.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in the codec format.
+
+        Returns:
+            dict: de-serialized received data.
+        """
+        obj = await self._messages.get()
+
+        if isinstance(obj, Exception):
+            self._messages.put_nowait(obj)  # Keep failing for the next callers
+            raise obj
+
+        return obj
+
+    async def _read_loop(self):
+        """Receive everything from the server, until the connection breaks.
+
+        Replies are delivered to the request that is waiting for them (or
+        queued for the stream they belong to), and the other objects are
+        queued for recv_data().
+        """
+        while True:
+            try:
+                obj = await self._recv_frame()
+            except (ConnectionError, TypeError) as exc:
+                error = exc
+                break
+
+            # A server that doesn't know about request IDs replies in order
+            res_id = obj.get("id", next(iter(self._pending), None))
+
+            if res_id in self._streams:
+                self._streams[res_id].put_nowait(obj)
+                continue
+            if res_id in self._discarded:  # Stream stopped early
+                if _is_last(obj):
+                    self._discarded.discard(res_id)
+                continue
+
+            future = self._pending.pop(res_id, None)
+
+            if future is None:
+                self._messages.put_nowait(obj)
+            elif not future.cancelled():
+                future.set_result(obj)
+
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        for queue in self._streams.values():
+            queue.put_nowait(error)
+        self._messages.put_nowait(error)
+
+    async def _recv_frame(self):
+        """Receive and de-serialize a frame.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in the codec format.
+
+        Returns:
+            dict: de-serialized received data.
+        """
+        try:
+            header = await self.reader.readexactly(HEADER.size)
+            msg_len, compressed = unpack_header(header, self.compressor)
+            payload = await self.reader.readexactly(msg_len)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("Socket connection broken while receiving data")
+
+        if compressed:
+            payload = self.compressor.decompress(payload)
+
+        return self.codec.decode(payload)
+
+    async def request(self, type_, data=None):
+        """Send a request to the server and wait for its reply.
+
+        Concurrent requests on the same client are pipelined, i.e. they're
+        all sent to the server, which queues them.
+
+        Arguments:
+            type_ (str): request type.
+            data (object, optional): request data (default: None).
+
+        Raises:
+            TypeError: if the request is not serializable with the codec.
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            dict: server reply.
+        """
+        req_id = self._next_id
+        self._next_id += 1
+
+        future = asyncio.get_event_loop().create_future()
+        self._pending[req_id] = future
+
+        try:
+            await self.send_data(dict(type=type_, data=data, id=req_id))
+        except Exception:
+            self._pending.pop(req_id, None)
+            raise
+
+        return await future
+
+    async def stream(self, type_, data=None):
+        """Send a request whose results are streamed, and iterate over them
+        (with "async for").
+
+        The server sends a reply per result as soon as it's ready (e.g. one
+        per simulation of a ``batchUpdateAndRun``), with the index of the
+        result in the reply, and then a reply of type ``end``. The results
+        are yielded as they arrive. If the request fails, its error reply is
+        yielded and the iteration ends. If the iteration is stopped early,
+        the remaining results are discarded when they arrive.
+
+        Arguments:
+            type_ (str): request type.
+            data (object, optional): request data (default: None).
+
+        Raises:
+            TypeError: if the data is not serializable with the codec.
+            ConnectionError: if the socket connection is broken.
+
+        Yields:
+            dict: server reply with a result.
+        """
+        req_id = self._next_id
+        self._next_id += 1
+
+        queue = asyncio.Queue()
+        self._streams[req_id] = queue
+        ended = False
+
+        try:
+            try:
+                await self.send_data(dict(type=type_, data=data, stream=True, id=req_id))
+            except TypeError:
+                ended = True  # Not sent
+                raise
+
+            while not ended:
+                res = await queue.get()
+                if isinstance(res, Exception):
+                    ended = True
+                    raise res
+
+                ended = _is_last(res)
+                if res.get("type") != "end":
+                    yield res
+        finally:
+            del self._streams[req_id]
+            if not ended:
+                self._discarded.add(req_id)
+
+    async def close(self):
+        """Close the connection."""
+        self.writer.close()
+
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+
+        if hasattr(self.writer, 'wait_closed'):  # Python 3.7+
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:  # The server has already closed the connection
+                pass
+
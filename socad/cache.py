@@ -0,0 +1,506 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Caches of simulation results.
+
+The results of a simulation are stored under a key that depends on the
+design variables and on the contents of the files that define the
+simulation (e.g. the OCEAN scripts and the model files), so a simulation is
+only run again if any of them changes.
+
+:class:`ResultCache` is persistent and only returns the results of the same
+design point. :class:`ApproximateCache` returns the results of the nearest
+design point within a tolerance of each variable.
+"""
+
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from collections import OrderedDict
+from itertools import product
+
+MAX_ENTRIES = 10000  # Default maximum number of cached results
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS results "
+    "(key TEXT PRIMARY KEY, results TEXT NOT NULL, used INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS results_used ON results (used)",
+)
+
+
+def canonical(variables):
+    """Get the canonical representation of a set of design variables.
+
+    The variables are sorted by name and the numbers are converted to float,
+    so the same design point always has the same representation.
+
+    Arguments:
+        variables (dict): circuit design variables.
+
+    Returns:
+        str: canonical representation.
+    """
+    items = []
+    for name in sorted(variables):
+        value = variables[name]
+        if _is_number(value):
+            value = repr(float(value))
+        else:
+            value = str(value)
+        items.append([str(name), value])
+
+    return json.dumps(items, separators=(',', ':'))
+
+
+class ResultCache:
+    """Cache of simulation results, stored in a sqlite database.
+
+    When the cache is full, the least recently used results are evicted.
+    The uses of the results are kept in memory and written with the next
+    stored results (or when the cache is closed), so a lookup never holds
+    the database lock, which is shared with the other processes that use
+    the same file.
+
+    Arguments:
+        path (str, optional): database file (default: ':memory:', i.e. the
+            cache isn't persistent).
+        files (list, optional): files whose contents are part of the key,
+            e.g. the OCEAN scripts and the model files (default: ()).
+        max_entries (int, optional): maximum number of cached results
+            (default: MAX_ENTRIES).
+    """
+
+    def __init__(self, path=':memory:', files=(), max_entries=MAX_ENTRIES):
+        """Open (or create) the database."""
+        self.path = path
+        self.files = _Files(files)
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(path)
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+        used = self._db.execute("SELECT MAX(used) FROM results").fetchone()[0]
+        self._clock = used or 0  # Time of the last use, in number of uses
+        self._uses = {}  # Time of the last use not written yet, by key
+
+    def __len__(self):
+        """Get the number of cached results.
+
+        They're counted in the database, since other processes may share it.
+        """
+        return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def key(self, variables):
+        """Get the key of a simulation.
+
+        Arguments:
+            variables (dict): circuit design variables.
+
+        Returns:
+            str: key of the simulation.
+        """
+        key = hashlib.sha256(self.files.digest())
+        key.update(canonical(variables).encode('utf-8'))
+
+        return key.hexdigest()
+
+    def get(self, variables):
+        """Get the cached results of a simulation.
+
+        Arguments:
+            variables (dict): circuit design variables.
+
+        Returns:
+            dict: simulation results, or None if they aren't cached.
+        """
+        key = self.key(variables)
+        row = self._db.execute("SELECT results FROM results WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._clock += 1
+        self._uses[key] = self._clock
+
+        return json.loads(row[0])
+
+    def put(self, variables, results):
+        """Store the results of a simulation.
+
+        Arguments:
+            variables (dict): circuit design variables.
+            results (dict): simulation results.
+
+        Raises:
+            TypeError: if the results are not JSON-serializable.
+        """
+        key = self.key(variables)
+        self._uses.pop(key, None)
+        self._write_uses()
+
+        # The uses are ordered by the clock of all the processes that share the database
+        used = self._db.execute("SELECT MAX(used) FROM results").fetchone()[0]
+        self._clock = max(self._clock, used or 0) + 1
+
+        # A single statement, so another process storing the same key doesn't collide
+        self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                         (key, json.dumps(results), self._clock))
+
+        count = len(self)
+        if count > self.max_entries:
+            self._evict(count - self.max_entries)
+
+        self._db.commit()
+
+    def stats(self):
+        """Get the cache statistics.
+
+        Returns:
+            dict: number of hits, misses and cached results.
+        """
+        return dict(hits=self.hits, misses=self.misses, entries=len(self))
+
+    def clear(self):
+        """Remove all the cached results."""
+        self._db.execute("DELETE FROM results")
+        self._db.commit()
+        self._uses.clear()
+
+    def close(self):
+        """Close the database."""
+        self._write_uses()
+        self._db.commit()
+        self._db.close()
+
+    def _write_uses(self):
+        """Write the uses kept in memory (they're committed by the caller)."""
+        if self._uses:
+            self._db.executemany("UPDATE results SET used = ? WHERE key = ?",
+                                 [(used, key) for key, used in self._uses.items()])
+            self._uses.clear()
+
+    def _evict(self, count):
+        """Remove the least recently used results.
+
+        Arguments:
+            count (int): number of results to remove.
+        """
+        self._db.execute("DELETE FROM results WHERE key IN "
+                         "(SELECT key FROM results ORDER BY used LIMIT ?)", (count,))
+
+
+class ApproximateCache:
+    """Cache of simulation results that reuses the results of nearby design
+    points.
+
+    The results of a design point are returned for any other design point
+    whose variables differ by less than their tolerances, e.g. a transistor
+    width that moved less than the process grid. The variables without
+    tolerance (and the non-numeric ones) must be equal. If several stored
+    points are within the tolerances, the nearest one is used.
+
+    The points are kept in memory, in a grid whose cells are twice the
+    tolerances, over a few of the variables (index_dims). So a lookup only
+    checks the points of 2 ** index_dims cells. The other variables are
+    compared one point at a time.
+
+    A backend cache (e.g. a :class:`ResultCache`) can be given, to look up
+    the exact design point when there are no points nearby, and to store all
+    the results.
+
+    Arguments:
+        tolerances (dict): tolerance of each variable, by name.
+        files (list, optional): files whose contents the results depend on.
+            The cache is cleared when they change (default: ()).
+        max_entries (int, optional): maximum number of points kept in memory.
+            The oldest are evicted first (default: MAX_ENTRIES).
+        index_dims (int, optional): maximum number of variables in the grid
+            (default: 3).
+        backend (object, optional): cache of exact results, with get() and
+            put() (default: None).
+    """
+
+    def __init__(self, tolerances, files=(), max_entries=MAX_ENTRIES, index_dims=3,
+                 backend=None):
+        """Create an empty cache."""
+        self.tolerances = dict((name, float(tol)) for name, tol in tolerances.items() if tol)
+        self.files = _Files(files)
+        self.max_entries = max_entries
+        self.index_dims = index_dims
+        self.backend = backend
+
+        self.hits = 0  # Exact or approximate hits
+        self.approximate_hits = 0
+        self.misses = 0
+
+        self._points = OrderedDict()  # (variables, results, cell) by canonical variables
+        self._grid = {}  # Canonical variables of the points, by cell
+        self._digest = None  # Hash of the files of the cached points
+
+    def __len__(self):
+        """Get the number of points kept in memory."""
+        return len(self._points)
+
+    def get(self, variables):
+        """Get the results of the nearest design point within the tolerances.
+
+        Arguments:
+            variables (dict): circuit design variables.
+
+        Returns:
+            dict: simulation results, or None if there are no points nearby.
+        """
+        self._check_files()
+
+        best, best_dist = None, None
+        signature, cells = self._locate(variables, neighbors=True)
+
+        for cell in product(*cells):
+            for key in self._grid.get((signature, cell), ()):
+                point, results, _ = self._points[key]
+                dist = self._distance(variables, point)
+                if dist is not None and (best_dist is None or dist < best_dist):
+                    best, best_dist = results, dist
+
+        if best is None and self.backend is not None:
+            best = self.backend.get(variables)
+            if best is not None:
+                best_dist = 0.0
+                self._add(variables, best)
+
+        if best is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if best_dist:
+            self.approximate_hits += 1
+
+        return best
+
+    def put(self, variables, results):
+        """Store the results of a simulation.
+
+        Arguments:
+            variables (dict): circuit design variables.
+            results (dict): simulation results.
+
+        Raises:
+            TypeError: if the backend can't store the results.
+        """
+        self._check_files()
+        self._add(variables, results)
+
+        if self.backend is not None:
+            self.backend.put(variables, results)
+
+    def stats(self):
+        """Get the cache statistics.
+
+        Returns:
+            dict: number of hits (and how many were approximate), misses and
+            points kept in memory.
+        """
+        return dict(hits=self.hits, approximate_hits=self.approximate_hits, misses=self.misses,
+                    entries=len(self._points))
+
+    def clear(self):
+        """Remove all the points kept in memory."""
+        self._points.clear()
+        self._grid.clear()
+
+    def close(self):
+        """Close the backend cache."""
+        if self.backend is not None:
+            self.backend.close()
+
+    def _add(self, variables, results):
+        """Add a point to the grid.
+
+        Arguments:
+            variables (dict): circuit design variables.
+            results (dict): simulation results.
+        """
+        key = canonical(variables)
+        if key in self._points:
+            self._remove(key)
+
+        signature, cells = self._locate(variables)
+        cell = (signature, tuple(cell[0] for cell in cells))
+
+        self._points[key] = (dict(variables), results, cell)
+        self._grid.setdefault(cell, []).append(key)
+
+        while len(self._points) > self.max_entries:
+            self._remove(next(iter(self._points)))
+
+    def _remove(self, key):
+        """Remove a point from the grid.
+
+        Arguments:
+            key (str): canonical variables of the point.
+        """
+        _, _, cell = self._points.pop(key)
+
+        keys = self._grid[cell]
+        keys.remove(key)
+        if not keys:
+            del self._grid[cell]
+
+    def _locate(self, variables, neighbors=False):
+        """Get the grid cell of a design point.
+
+        Arguments:
+            variables (dict): circuit design variables.
+            neighbors (bool, optional): if the neighbor cell within the
+                tolerance of each variable is included (default: False).
+
+        Returns:
+            tuple: signature of the variables compared one by one, and list
+            with the cells of each variable in the grid.
+        """
+        exact = []
+        approximate = []
+        for name in sorted(variables):
+            value = variables[name]
+            if name in self.tolerances and _is_number(value):
+                approximate.append(name)
+            else:
+                exact.append((name, _hashable(value)))
+
+        cells = []
+        for name in approximate[:self.index_dims]:
+            # The cells are 2 * tol wide, so only one neighbor can be in reach
+            value = variables[name] / (2 * self.tolerances[name])
+            cell = int(math.floor(value))
+            if not neighbors:
+                cells.append((cell,))
+            elif value - cell < 0.5:
+                cells.append((cell, cell - 1))
+            else:
+                cells.append((cell, cell + 1))
+
+        return (tuple(exact), tuple(approximate)), cells
+
+    def _distance(self, variables, point):
+        """Get the distance between two design points with the same signature.
+
+        Arguments:
+            variables (dict): circuit design variables.
+            point (dict): circuit design variables of a stored point.
+
+        Returns:
+            float: largest difference of a variable, relative to its
+            tolerance, or None if it's larger than the tolerance.
+        """
+        dist = 0.0
+
+        for name, tol in self.tolerances.items():
+            if name in variables and _is_number(variables[name]):
+                diff = abs(variables[name] - point[name]) / tol
+                if diff > 1.0:
+                    return None
+                dist = max(dist, diff)
+
+        return dist
+
+    def _check_files(self):
+        """Clear the cache if the files the results depend on have changed."""
+        digest = self.files.digest()
+
+        if digest != self._digest:
+            self.clear()
+            self._digest = digest
+
+
+class _Files:
+    """Files the simulation results depend on.
+
+    Arguments:
+        fnames (list): file names.
+    """
+
+    def __init__(self, fnames):
+        """Store the file names."""
+        self.fnames = list(fnames)
+
+        self._stamp = None  # Modification times and sizes of the files
+        self._digest = None  # Hash of the contents of the files
+
+    def digest(self):
+        """Get the hash of the contents of the files.
+
+        The files are only read again when their modification time or size
+        changes.
+
+        Returns:
+            bytes: hash of the files.
+        """
+        stamp = []
+        for fname in self.fnames:
+            try:
+                stat = os.stat(fname)
+            except OSError:  # A missing file is part of the key too
+                stamp.append((fname, None, None))
+            else:
+                stamp.append((fname, stat.st_mtime, stat.st_size))
+
+        if stamp != self._stamp:
+            digest = hashlib.sha256()
+            for fname, mtime, _ in stamp:
+                digest.update(fname.encode('utf-8') + b'\0')
+                if mtime is not None:
+                    with open(fname, 'rb') as f:
+                        digest.update(f.read())
+                digest.update(b'\0')
+
+            self._stamp = stamp
+            self._digest = digest.digest()
+
+        return self._digest
+
+
+def _hashable(value):
+    """Get a hashable version of a variable value, to compare it exactly.
+
+    Arguments:
+        value (object): variable value, e.g. a number, a string or a list.
+
+    Returns:
+        object: value, with the lists (and arrays) converted to tuples and the
+        dictionaries to tuples of items.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(val)) for key, val in value.items()))
+    if hasattr(value, 'tolist'):  # NumPy array or array.array
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(val) for val in value)
+
+    return value
+
+
+def _is_number(value):
+    """Check if a variable value is a number."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -15,9 +15,11 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 """Client that communicates with Cadence through a server."""
 
-import json
 import socket
-import struct
+from collections import deque
+
+from . import codec, compression
+from .transport import READ_SIZE, Transport
 
 
 class Client:
@@ -25,21 +27,51 @@ class Client:
 
     This client receives data from Cadence (through a server) and processes
     that data. It then gather the processed data and send it back to Cadence
-    through the server. It sends data in JSON format and the received data
-    should also be serialized in JSON.
+    through the server. The data is serialized with the codec negotiated with
+    the server, which is JSON if the server doesn't support any other codec.
 
     Arguments:
         sock (object, optional): socket to use for the connection
             (default: None).
+        read_size (int, optional): maximum number of bytes to receive per
+            socket call (default: READ_SIZE).
+        codecs (list, optional): names of the codecs offered to the server,
+            by order of preference (default: codec.PREFERENCE).
+        compressors (list, optional): names of the compressors offered to the
+            server, by order of preference (default: (), i.e. the frames are
+            never compressed).
+        compress_level (int, optional): compression level (default: None,
+            i.e. the compressor default).
+        compress_threshold (int, optional): minimum number of bytes of a
+            frame to be compressed (default: compression.THRESHOLD).
     """
 
-    def __init__(self, sock=None):
+    def __init__(self, sock=None, read_size=READ_SIZE, codecs=codec.PREFERENCE,
+                 compressors=(), compress_level=None,
+                 compress_threshold=compression.THRESHOLD):
         """Create the client socket."""
         if sock is None:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         else:
             self.socket = sock
 
+        self.transport = Transport(self.socket, read_size, compress_threshold)
+        self.codecs = list(codecs)
+        self.codec = codec.DEFAULT  # Used until the codec is negotiated
+        self.compressors = list(compressors)
+        self.compress_level = compress_level
+
+        # State of the Cadence session, sent by the server in the handshake
+        # (e.g. if the simulator is already loaded)
+        self.session = {}
+
+        # Request IDs
+        self._next_id = 0
+        self._pending = deque()  # IDs of the requests without reply, in order
+        self._replies = {}  # Replies received before being asked for, by ID
+        self._streams = set()  # IDs of the streamed requests
+        self._discarded = set()  # IDs of the streams whose replies are dropped
+
     def run(self, host, port):
         """Start the client.
 
@@ -63,113 +95,249 @@ class Client:
         # have an exception the error will be caught in the function that
         # calls this one
 
-        # Send the local socket name to the server
-        self.send_data(dict(type="info", data=self.socket.getsockname()))
+        # Send the local socket name to the server, and the codecs and
+        # compressors we can use
+        self.send_data(dict(type="info", data=self.socket.getsockname(), codecs=self.codecs,
+                            compressors=self.compressors))
+
+        # Receive the remote socket name, and the codecs and compressors the
+        # server can use
+        res = self.recv_data()
 
-        # Receive the remote socket name
-        return self.recv_data()["data"]
+        # The remaining data is serialized with the negotiated codec, and the
+        # large frames are compressed with the negotiated compressor
+        self.codec = codec.negotiate(self.codecs, res.get("codecs"))
+        self.transport.compressor = compression.negotiate(self.compressors,
+                                                          res.get("compressors"),
+                                                          self.compress_level)
+        self.session = res.get("session", {})
+
+        return res["data"]
 
     def send_data(self, obj):
         """Send an object through a socket.
 
-        1 - Serialize the object in JSON and encode the string;
-
-        2 - pack the serialized object length in an unsigned int (I)[4 bytes],
-        and big-endian byte order (>) (this way the *object size* message
-        has always the same size);
+        1 - Serialize the object with the negotiated codec;
 
-        3 - send the data.
+        2 - send the data in a frame, i.e. preceded by its length packed in an
+        unsigned int (I)[4 bytes], and big-endian byte order (>) (this way
+        the *object size* message has always the same size).
 
         Arguments:
             obj (dict): object to send.
 
         Raises:
-            TypeError: if the object is not serializable in JSON.
+            TypeError: if the object is not serializable with the codec.
             ConnectionError: if the socket connection is broken.
         """
-        # Serialize the object in JSON and encode the string as a bytes object
-        try:
-            serialized = json.dumps(obj).encode()
-        except (TypeError, ValueError):
-            raise TypeError("It can only send JSON-serializable data")
+        self.transport.send_frame(self.codec.encode(obj))
 
-        serialized_len = len(serialized)  # String length
+    def recv_data(self):
+        """Receive an object through a socket.
 
-        # Packed string length
-        pack_serialized_len = struct.pack(">I", serialized_len)
+        1 - Receive a frame, i.e. the first 4 bytes of data, which contains the
+        data length, and then the serialized data;
 
-        # Data to send
-        data = pack_serialized_len + serialized
+        2 - de-serialize the data with the negotiated codec.
 
-        total_sent = 0
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in the codec format.
 
-        while total_sent < serialized_len:
-            sent = self.socket.send(data[total_sent:])
+        Returns:
+            dict: de-serialized received data.
+        """
+        return self.codec.decode(self.transport.recv_frame())
 
-            if not sent:
-                raise ConnectionError("Socket connection broken while sending data")
+    def submit(self, type_, data=None):
+        """Send a request to the server without waiting for its reply.
 
-            total_sent += sent
+        Several requests can be submitted before receiving their replies, so
+        the server always has work queued.
 
-    def recv_data(self):
-        """Receive an object through a socket.
+        Arguments:
+            type_ (str): request type.
+            data (object, optional): request data (default: None).
 
-        1 - Receive the first 4 bytes of data, which contains the data length;
+        Raises:
+            TypeError: if the request is not serializable with the codec.
+            ConnectionError: if the socket connection is broken.
 
-        2 - Receive the data, serialized in JSON, and decode it;
+        Returns:
+            int: request ID, to get the reply with recv_reply().
+        """
+        return self._submit(dict(type=type_, data=data))
 
-        3 - Convert the received data in an object.
+    def recv_reply(self, req_id):
+        """Receive the reply to a submitted request.
+
+        Replies to other requests received in the meantime are kept until
+        they're asked for.
+
+        Arguments:
+            req_id (int): request ID, returned by submit().
 
         Raises:
+            KeyError: if there's no submitted request with the given ID.
             ConnectionError: if the socket connection is broken.
-            TypeError: if the received data is not in JSON format.
+            TypeError: if the received data is not in the codec format.
 
         Returns:
-            dict: decoded and de-serialized received data.
+            dict: server reply.
         """
-        data_len = self.recv_bytes(4)
+        return self._recv_next(req_id)
+
+    def request(self, type_, data=None):
+        """Send a request to the server and wait for its reply.
+
+        Arguments:
+            type_ (str): request type.
+            data (object, optional): request data (default: None).
+
+        Raises:
+            TypeError: if the data is not serializable with the codec.
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            dict: server reply.
+        """
+        return self.recv_reply(self.submit(type_, data))
+
+    def stream(self, type_, data=None):
+        """Send a request whose results are streamed, and iterate over them.
+
+        The server sends a reply per result as soon as it's ready (e.g. one
+        per simulation of a ``batchUpdateAndRun``), with the index of the
+        result in the reply, and then a reply of type ``end``. The results
+        are yielded as they arrive, so they can be processed while the
+        server is still working on the next ones, and they're never gathered
+        in memory. If the request fails, its error reply is yielded and the
+        iteration ends.
 
-        if not data_len:
-            raise ConnectionError("Socket connection broken while receiving data")
+        If the iteration is stopped early, the remaining results are
+        discarded when they arrive.
 
-        # >I means a unsigned int (I) (with four bytes length) and big-endian byte order (>)
-        msglen = struct.unpack(">I", data_len)[0]
+        Arguments:
+            type_ (str): request type.
+            data (object, optional): request data (default: None).
 
-        serialized = self.recv_bytes(msglen).decode()
+        Raises:
+            TypeError: if the data is not serializable with the codec.
+            ConnectionError: if the socket connection is broken.
+
+        Yields:
+            dict: server reply with a result.
+        """
+        req_id = self._submit(dict(type=type_, data=data, stream=True))
+        self._streams.add(req_id)
 
         try:
-            obj = json.loads(serialized)
-        except (TypeError, ValueError):
-            raise TypeError("Received data is not in JSON format")
+            while True:
+                res = self._recv_next(req_id)
+                if res.get("type") == "end":
+                    return
+                yield res
+                if _is_last(res):  # The request failed
+                    return
+        finally:
+            if req_id in self._pending:  # Stopped before the end
+                self._discarded.add(req_id)
+            self._replies.pop(req_id, None)
+
+    def _submit(self, req):
+        """Send a request with a new ID.
 
-        return obj
+        Arguments:
+            req (dict): request, without ID.
 
-    def recv_bytes(self, n_bytes):
-        """Receive a specified number of bytes through a socket.
+        Returns:
+            int: request ID.
+        """
+        req_id = self._next_id
+        self._next_id += 1
+
+        req['id'] = req_id
+        self.send_data(req)
+        self._pending.append(req_id)
+
+        return req_id
+
+    def _recv_next(self, req_id):
+        """Receive the next reply to a submitted request.
+
+        Replies to other requests received in the meantime are kept until
+        they're asked for. A streamed request only stops waiting for replies
+        when it gets its ``end`` reply (or an error reply, if it failed).
 
         Arguments:
-            n_bytes (int): number of bytes to receive.
+            req_id (int): request ID.
 
         Raises:
+            KeyError: if there's no submitted request with the given ID.
             ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in the codec format.
 
         Returns:
-            bytes: received bytes stream.
+            dict: server reply.
         """
-        data = b""  # Bytes literal
-        data_len = len(data)
+        replies = self._replies.get(req_id)
+        if replies:
+            res = replies.popleft()
+            if not replies:
+                del self._replies[req_id]
+            return res
+
+        if req_id not in self._pending:
+            raise KeyError("There's no request with the ID {0}".format(req_id))
 
-        while data_len < n_bytes:
-            packet = self.socket.recv(min(n_bytes - data_len, 1024))
+        while True:
+            res = self.recv_data()
 
-            if not packet:
-                raise ConnectionError("Socket connection broken while receiving a byte")
+            # A server that doesn't know about request IDs replies in order
+            res_id = res.get("id", self._pending[0])
 
-            data_len += len(packet)
-            data += packet
+            if res_id not in self._pending:
+                raise KeyError("Received a reply to an unknown request: {0}".format(res_id))
 
-        return data
+            if res_id not in self._streams or _is_last(res):
+                self._pending.remove(res_id)
+                self._streams.discard(res_id)
+
+            if res_id in self._discarded:
+                if res_id not in self._pending:
+                    self._discarded.remove(res_id)
+            elif res_id == req_id:
+                return res
+            else:
+                self._replies.setdefault(res_id, deque()).append(res)
+
+    def recv_bytes(self, n_bytes):
+        """Receive a specified number of bytes through a socket.
+
+        Arguments:
+            n_bytes (int): number of bytes to receive.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            bytearray: received bytes stream.
+        """
+        return self.transport.recv_bytes(n_bytes)
 
     def close(self):
         """Close the socket."""
         self.socket.close()
+
+
+def _is_last(res):
+    """Check if a reply is the last one of a stream.
+
+    Arguments:
+        res (dict): reply of a streamed request.
+
+    Returns:
+        bool: if it's the reply of type 'end', or an error of the whole
+        request (without the index of a result).
+    """
+    return res.get("type") == "end" or (res.get("type") == "error" and "index" not in res)
@@ -0,0 +1,522 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Codecs used to serialize the objects exchanged by the client and the server.
+
+The codec is negotiated when the client and the server exchange their socket
+names in ``run()``. JSON is always available and is used when the other end
+doesn't support (or doesn't know about) any other codec.
+
+The binary codec also sends arrays of float64 or complex128 numbers (e.g.
+the waveforms of an AC or transient analysis) as raw little-endian buffers.
+With NumPy, they're received as arrays that share the memory of the
+received frame, without being copied. It's only worth it for large arrays:
+the small messages of most requests are serialized faster (and smaller) by
+the JSON codec, which is implemented in C. So JSON is preferred by default,
+and the clients that read waveforms offer the binary codec first, e.g.
+``Client(codecs=('binary', 'json'))``. The JSON codec sends arrays as lists,
+and complex numbers as ``{"__complex__": [real, imag]}`` (with the lists of
+the real and imaginary parts, for complex arrays).
+"""
+
+import array
+import json
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    _TEXT_TYPE = unicode  # pylint: disable=undefined-variable
+    _STR_TYPES = (str, unicode)  # pylint: disable=undefined-variable
+    _BYTES_TYPES = (bytearray,)
+    _INT_TYPES = (int, long)  # pylint: disable=undefined-variable
+except NameError:
+    _TEXT_TYPE = str
+    _STR_TYPES = (str,)
+    _BYTES_TYPES = (bytes, bytearray)
+    _INT_TYPES = (int,)
+
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+_C128 = struct.Struct('<dd')
+
+# Key of the JSON objects that hold complex numbers
+_COMPLEX = '__complex__'
+
+_INT64_MIN = -2**63
+_INT64_MAX = 2**63 - 1
+
+# Array header: element kind ('d' float64, 'c' complex128) and number of dimensions
+_ARRAY = struct.Struct('<cB')
+
+# Array data starts at a multiple of the element alignment
+_ALIGNMENT = 8
+
+_ARRAY_TYPES = {b'd': '<f8', b'c': '<c16'}
+
+
+def _to_json(obj):
+    """Convert an array or a complex number to be serialized in JSON.
+
+    Arguments:
+        obj (object): object that is not serializable in JSON.
+
+    Raises:
+        TypeError: if the object is not an array or a number.
+
+    Returns:
+        object: list with the array items, {"__complex__": [real, imag]} for
+        a complex number or array, or the Python value of a NumPy scalar.
+    """
+    if isinstance(obj, complex):
+        return {_COMPLEX: [obj.real, obj.imag]}
+
+    if isinstance(obj, array.array):
+        return obj.tolist()
+
+    if numpy is not None and isinstance(obj, numpy.ndarray):
+        if obj.dtype.kind == 'c':
+            return {_COMPLEX: [obj.real.tolist(), obj.imag.tolist()]}
+        return obj.tolist()
+
+    if numpy is not None and isinstance(obj, numpy.generic):
+        return obj.item()
+
+    raise TypeError("{0} is not JSON serializable".format(type(obj).__name__))
+
+
+def _from_json(obj):
+    """Convert the complex numbers of a JSON object back (see _to_json()).
+
+    Arguments:
+        obj (dict): de-serialized JSON object.
+
+    Returns:
+        object: complex number, complex array (list without NumPy), or the
+        object unchanged.
+    """
+    if len(obj) != 1 or _COMPLEX not in obj:
+        return obj
+
+    real, imag = obj[_COMPLEX]
+    if not isinstance(real, list):
+        return complex(real, imag)
+    if numpy is not None:
+        return numpy.array(real, dtype=float) + 1j * numpy.array(imag, dtype=float)
+
+    return _zip_complex(real, imag)
+
+
+def _zip_complex(real, imag):
+    """Join the (nested) lists of the real and imaginary parts of an array.
+
+    Arguments:
+        real (list): real parts.
+        imag (list): imaginary parts.
+
+    Returns:
+        list: complex numbers, with the same nesting.
+    """
+    if real and isinstance(real[0], list):
+        return [_zip_complex(re_row, im_row) for re_row, im_row in zip(real, imag)]
+
+    return [complex(re_val, im_val) for re_val, im_val in zip(real, imag)]
+
+
+class JsonCodec:
+    """Serialize objects in JSON."""
+
+    name = 'json'
+
+    def encode(self, obj):
+        """Serialize an object.
+
+        Arrays are serialized as lists, and complex numbers as objects with
+        their real and imaginary parts.
+
+        Arguments:
+            obj (object): object to serialize.
+
+        Raises:
+            TypeError: if the object is not serializable in JSON.
+
+        Returns:
+            bytes: serialized object.
+        """
+        try:
+            return json.dumps(obj, default=_to_json).encode()
+        except (TypeError, ValueError):
+            raise TypeError("It can only send JSON-serializable data")
+
+    def decode(self, data):
+        """De-serialize an object.
+
+        Arguments:
+            data (bytearray): serialized object.
+
+        Raises:
+            TypeError: if the data is not in JSON format.
+
+        Returns:
+            object: de-serialized object.
+        """
+        try:
+            return json.loads(data.decode(), object_hook=_from_json)
+        except (TypeError, ValueError):
+            raise TypeError("Received data is not in JSON format")
+
+
+class _Chunks(list):
+    """List of serialized chunks, which keeps count of their size.
+
+    The chunks are only counted once, so getting the size of the chunks
+    before each array of a message doesn't take quadratic time.
+    """
+
+    def __init__(self):
+        """Start without chunks."""
+        list.__init__(self)
+        self._size = 0  # Size of the chunks counted so far
+        self._counted = 0  # Number of chunks counted so far
+
+    def size(self):
+        """Get the size of the chunks.
+
+        Returns:
+            int: size, in bytes.
+        """
+        for index in range(self._counted, len(self)):
+            self._size += len(self[index])
+        self._counted = len(self)
+
+        return self._size
+
+
+class BinaryCodec:
+    """Serialize objects in a compact binary format.
+
+    Each value is preceded by a one byte tag. Numbers are packed in their
+    native little-endian representation, strings and containers are prefixed
+    with their length, and lists made only of floats are packed as a single
+    vector. It handles the same types as JSON, plus bytes, complex numbers
+    and arrays.
+
+    Arrays (NumPy arrays of real or complex numbers and ``array.array``) are
+    packed as raw float64 or complex128 buffers, aligned to 8 bytes in the
+    frame. With NumPy installed, they're decoded as views of the received
+    data (with ``numpy.frombuffer``); otherwise real arrays with one
+    dimension are decoded to ``array.array('d')`` and the others to lists.
+    """
+
+    name = 'binary'
+
+    def encode(self, obj):
+        """Serialize an object.
+
+        Arguments:
+            obj (object): object to serialize.
+
+        Raises:
+            TypeError: if the object is not serializable with this codec.
+
+        Returns:
+            bytes: serialized object.
+        """
+        chunks = _Chunks()
+        self._encode(obj, chunks)
+
+        return b''.join(chunks)
+
+    def _encode(self, obj, chunks):
+        """Serialize an object and append the result to a list of chunks.
+
+        Arguments:
+            obj (object): object to serialize.
+            chunks (_Chunks): list of serialized chunks.
+        """
+        append = chunks.append
+
+        if obj is None:
+            append(b'N')
+        elif obj is True:
+            append(b'T')
+        elif obj is False:
+            append(b'F')
+        elif isinstance(obj, float):
+            append(b'd')
+            append(_F64.pack(obj))
+        elif isinstance(obj, complex):
+            append(b'z')
+            append(_C128.pack(obj.real, obj.imag))
+        elif isinstance(obj, _INT_TYPES):
+            if _INT64_MIN <= obj <= _INT64_MAX:
+                append(b'i')
+                append(_I64.pack(obj))
+            else:  # Big integers are sent as text
+                digits = str(obj).rstrip('L').encode()
+                append(b'I')
+                append(_U32.pack(len(digits)))
+                append(digits)
+        elif isinstance(obj, _STR_TYPES):
+            if isinstance(obj, _TEXT_TYPE):
+                obj = obj.encode('utf-8')
+            append(b's')
+            append(_U32.pack(len(obj)))
+            append(obj)
+        elif isinstance(obj, _BYTES_TYPES):
+            append(b'y')
+            append(_U32.pack(len(obj)))
+            append(bytes(obj))
+        elif isinstance(obj, array.array) or (numpy is not None and
+                                               isinstance(obj, numpy.ndarray)):
+            self._encode_array(obj, chunks)
+        elif numpy is not None and isinstance(obj, numpy.generic):
+            # NumPy scalars (e.g. integers and booleans) are sent as Python values
+            self._encode(obj.item(), chunks)
+        elif isinstance(obj, dict):
+            append(b'm')
+            append(_U32.pack(len(obj)))
+            for key, val in obj.items():
+                self._encode(key, chunks)
+                self._encode(val, chunks)
+        elif isinstance(obj, (list, tuple)):
+            if obj and all(type(val) is float for val in obj):  # pylint: disable=unidiomatic-typecheck
+                append(b'D')
+                append(_U32.pack(len(obj)))
+                append(struct.pack('<{0}d'.format(len(obj)), *obj))
+            else:
+                append(b'l')
+                append(_U32.pack(len(obj)))
+                for val in obj:
+                    self._encode(val, chunks)
+        else:
+            raise TypeError("It can only send data serializable with the binary codec, "
+                            "not {0}".format(type(obj).__name__))
+
+    def _encode_array(self, obj, chunks):
+        """Serialize an array and append the result to a list of chunks.
+
+        Arguments:
+            obj (object): NumPy array or array.array.
+            chunks (_Chunks): list of serialized chunks.
+        """
+        if isinstance(obj, array.array):
+            if obj.typecode in 'cuw':
+                raise TypeError("Can't send an array of characters")
+            shape = (len(obj),)
+            kind = b'd'
+            if obj.typecode != 'd' or sys.byteorder != 'little':
+                obj = array.array('d', obj)
+                if sys.byteorder != 'little':
+                    obj.byteswap()
+            data = obj.tobytes() if hasattr(obj, 'tobytes') else obj.tostring()
+        else:
+            if obj.dtype.kind in 'biuf':
+                kind = b'd'
+            elif obj.dtype.kind == 'c':
+                kind = b'c'
+            else:
+                raise TypeError("Can't send an array of {0}".format(obj.dtype))
+            shape = obj.shape
+            # No copy if the array is already contiguous and in the wire format
+            data = numpy.ascontiguousarray(obj, dtype=_ARRAY_TYPES[kind]).reshape(-1)
+            data = memoryview(data.view(numpy.uint8))
+
+        header = b'A' + _ARRAY.pack(kind, len(shape)) + struct.pack('<{0}I'.format(len(shape)),
+                                                                     *shape)
+        offset = chunks.size() + len(header)
+
+        chunks.append(header)
+        chunks.append(b'\0' * (-offset % _ALIGNMENT))
+        chunks.append(data)
+
+    def decode(self, data):
+        """De-serialize an object.
+
+        Arrays are decoded as views of the data, so the data must not be
+        modified while they're used.
+
+        Arguments:
+            data (bytearray): serialized object.
+
+        Raises:
+            TypeError: if the data is not in the binary format.
+
+        Returns:
+            object: de-serialized object.
+        """
+        try:
+            obj, offset = self._decode(data, 0)
+        except (struct.error, IndexError, KeyError, ValueError):
+            raise TypeError("Received data is not in the binary format")
+
+        if offset != len(data):
+            raise TypeError("Received data is not in the binary format")
+
+        return obj
+
+    def _decode(self, data, offset):
+        """De-serialize the object that starts at a given offset.
+
+        Arguments:
+            data (bytearray): serialized data.
+            offset (int): offset of the object tag.
+
+        Returns:
+            tuple: de-serialized object and offset of the next object.
+        """
+        tag = data[offset:offset + 1]
+        offset += 1
+
+        if tag == b'N':
+            return None, offset
+        if tag == b'T':
+            return True, offset
+        if tag == b'F':
+            return False, offset
+        if tag == b'd':
+            return _F64.unpack_from(data, offset)[0], offset + _F64.size
+        if tag == b'i':
+            return _I64.unpack_from(data, offset)[0], offset + _I64.size
+        if tag == b'z':
+            return complex(*_C128.unpack_from(data, offset)), offset + _C128.size
+        if tag == b'A':
+            return self._decode_array(data, offset)
+
+        # The remaining types are prefixed by their length
+        length = _U32.unpack_from(data, offset)[0]
+        offset += _U32.size
+
+        if tag in (b's', b'y', b'I'):
+            end = offset + length
+            if end > len(data):
+                raise ValueError("Truncated data")
+            raw = bytes(data[offset:end])
+            if tag == b's':
+                return raw.decode('utf-8'), end
+            if tag == b'I':
+                return int(raw), end
+            return raw, end
+        if tag == b'D':
+            vector = struct.unpack_from('<{0}d'.format(length), data, offset)
+            return list(vector), offset + length * _F64.size
+        if tag == b'l':
+            obj = []
+            for _ in range(length):
+                val, offset = self._decode(data, offset)
+                obj.append(val)
+            return obj, offset
+        if tag == b'm':
+            obj = {}
+            for _ in range(length):
+                key, offset = self._decode(data, offset)
+                obj[key], offset = self._decode(data, offset)
+            return obj, offset
+
+        raise ValueError("Unknown tag")
+
+    def _decode_array(self, data, offset):
+        """De-serialize the array that starts at a given offset.
+
+        Arguments:
+            data (bytearray): serialized data.
+            offset (int): offset of the array header, after the tag.
+
+        Returns:
+            tuple: de-serialized array and offset of the next object.
+        """
+        kind, ndim = _ARRAY.unpack_from(data, offset)
+        offset += _ARRAY.size
+        shape = struct.unpack_from('<{0}I'.format(ndim), data, offset)
+        offset += 4 * ndim
+        offset += -offset % _ALIGNMENT
+
+        dtype = _ARRAY_TYPES[kind]
+        count = 1
+        for size in shape:
+            count *= size
+        end = offset + count * (8 if kind == b'd' else 16)
+        if end > len(data):
+            raise ValueError("Truncated data")
+
+        if numpy is not None:
+            return numpy.frombuffer(data, dtype, count, offset).reshape(shape), end
+
+        values = array.array('d')
+        raw = bytes(data[offset:end])
+        if hasattr(values, 'frombytes'):
+            values.frombytes(raw)
+        else:  # Python 2
+            values.fromstring(raw)
+        if sys.byteorder != 'little':
+            values.byteswap()
+
+        if kind == b'c':
+            values = [complex(real, imag) for real, imag in zip(values[::2], values[1::2])]
+        if ndim == 1 and kind == b'd':
+            return values, end
+
+        return _nest(list(values), shape), end
+
+
+def _nest(values, shape):
+    """Split a flat list in nested lists with a given shape.
+
+    Arguments:
+        values (list): flat list of values.
+        shape (tuple): sizes of each dimension.
+
+    Returns:
+        list: nested lists.
+    """
+    for size in reversed(shape[1:]):
+        values = [values[i:i + size] for i in range(0, len(values), size)]
+
+    return values
+
+
+# Available codecs, by name
+CODECS = {codec.name: codec for codec in (BinaryCodec(), JsonCodec())}
+
+# Codecs offered during the negotiation, by order of preference (see above)
+PREFERENCE = ('json', 'binary')
+
+# Codec used before (or without) a negotiation
+DEFAULT = CODECS['json']
+
+
+def negotiate(offered, accepted):
+    """Choose the codec used in a connection.
+
+    Both ends of the connection get the same result, since the choice is the
+    first codec offered by the client that is also accepted by the server.
+
+    Arguments:
+        offered (list): codec names offered by the client, or None.
+        accepted (list): codec names accepted by the server, or None.
+
+    Returns:
+        object: negotiated codec (JSON if there's no codec in common).
+    """
+    for name in offered or ():
+        if name in (accepted or ()) and name in CODECS:
+            return CODECS[name]
+
+    return DEFAULT
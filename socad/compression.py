@@ -0,0 +1,152 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Compression of the frames exchanged by the client and the server.
+
+Like the codec, the compression algorithm is negotiated when the client and
+the server exchange their socket names in ``run()``. Only the frames larger
+than a threshold are compressed, and a compressed frame is flagged in its
+header, so small control messages are sent as they are.
+"""
+
+import zlib
+
+try:
+    import lzma
+except ImportError:  # Python 2
+    lzma = None
+
+# Frames with less bytes than this are never compressed
+THRESHOLD = 16 * 1024
+
+
+class ZlibCompressor:
+    """Compress frames with zlib.
+
+    Arguments:
+        level (int, optional): compression level, from 0 to 9 (default: 6).
+    """
+
+    name = 'zlib'
+
+    def __init__(self, level=None):
+        """Set the compression level."""
+        self.level = 6 if level is None else level
+
+    def compress(self, data):
+        """Compress data.
+
+        Arguments:
+            data (bytes): data to compress.
+
+        Returns:
+            bytes: compressed data.
+        """
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        """Decompress data.
+
+        Arguments:
+            data (bytearray): compressed data.
+
+        Raises:
+            TypeError: if the data is not compressed with zlib.
+
+        Returns:
+            bytes: decompressed data.
+        """
+        try:
+            return zlib.decompress(bytes(data))
+        except zlib.error:
+            raise TypeError("Received data is not compressed with zlib")
+
+
+class LzmaCompressor:
+    """Compress frames with LZMA.
+
+    It's slower than zlib, but it usually compresses better, which pays off on
+    slow links.
+
+    Arguments:
+        level (int, optional): compression preset, from 0 to 9 (default: 6).
+    """
+
+    name = 'lzma'
+
+    def __init__(self, level=None):
+        """Set the compression preset."""
+        self.level = 6 if level is None else level
+
+    def compress(self, data):
+        """Compress data.
+
+        Arguments:
+            data (bytes): data to compress.
+
+        Returns:
+            bytes: compressed data.
+        """
+        return lzma.compress(data, preset=self.level)
+
+    def decompress(self, data):
+        """Decompress data.
+
+        Arguments:
+            data (bytearray): compressed data.
+
+        Raises:
+            TypeError: if the data is not compressed with LZMA.
+
+        Returns:
+            bytes: decompressed data.
+        """
+        try:
+            return lzma.decompress(data)
+        except lzma.LZMAError:
+            raise TypeError("Received data is not compressed with LZMA")
+
+
+# Available compressors, by name
+COMPRESSORS = {'zlib': ZlibCompressor}
+if lzma is not None:
+    COMPRESSORS['lzma'] = LzmaCompressor
+
+# Compressors accepted by default, by order of preference
+AVAILABLE = tuple(name for name in ('zlib', 'lzma') if name in COMPRESSORS)
+
+
+def negotiate(offered, accepted, level=None):
+    """Choose the compressor used in a connection.
+
+    Both ends of the connection get the same algorithm, since the choice is
+    the first one offered by the client that is also accepted by the server.
+    The compression level is chosen by each end.
+
+    Arguments:
+        offered (list): compressor names offered by the client, or None.
+        accepted (list): compressor names accepted by the server, or None.
+        level (int, optional): compression level (default: None, i.e. the
+            compressor default).
+
+    Returns:
+        object: negotiated compressor, or None if there's no compressor in
+        common.
+    """
+    for name in offered or ():
+        if name in (accepted or ()) and name in COMPRESSORS:
+            return COMPRESSORS[name](level)
+
+    return None
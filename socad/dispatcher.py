@@ -0,0 +1,679 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Dispatcher that shares a farm of Cadence servers between clients.
+
+The clients connect to the dispatcher as if it was a normal server. Each
+request is forwarded to one of the backend servers (the workers), each one
+with its own Cadence Virtuoso, so several simulations run at the same time.
+"""
+
+import selectors
+import socket
+import sys
+import time
+from collections import OrderedDict
+
+from . import codec, compression, log
+from .client import Client
+from .server import HANDSHAKE_TIMEOUT, Connection
+from .transport import READ_SIZE
+
+# Requests that are sent to every worker
+BROADCAST = ('loadSimulator',)
+
+# Types of the requests that are forwarded to the workers (the others are
+# answered with an error, without reaching them)
+FORWARDED = ('info', 'stats', 'readResults', 'evalSkill', 'loadSimulator', 'updateAndRun',
+             'batchUpdateAndRun')
+
+
+class Worker:
+    """A backend server of the dispatcher.
+
+    Arguments:
+        worker_id (int): worker identifier, used to isolate its files.
+        addr (tuple): backend server address.
+        client (Client): client connected to the backend server.
+    """
+
+    def __init__(self, worker_id, addr, client):
+        """Store the connection to the backend server."""
+        self.worker_id = worker_id
+        self.addr = addr
+        self.client = client
+
+        self.jobs = OrderedDict()  # Jobs being processed, by request ID
+        self.alive = True
+        self.loaded = False  # If the simulator was loaded
+        self.last_seen = time.time()
+        self.ping_sent = None  # When the last health check was sent
+
+        self._next_id = 0
+
+    def fileno(self):
+        """Get the file descriptor of the backend socket."""
+        return self.client.socket.fileno()
+
+    @property
+    def load(self):
+        """int: number of jobs being processed."""
+        return len(self.jobs)
+
+    def submit(self, type_, data, job):
+        """Send a request to the backend server.
+
+        Arguments:
+            type_ (str): request type.
+            data (object): request data.
+            job (tuple): job the request belongs to (None for health checks).
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the request is not serializable with the codec.
+        """
+        req_id = self._next_id
+        self._next_id += 1
+
+        self.client.send_data(dict(type=type_, data=data, id=req_id))
+        self.jobs[req_id] = job
+
+    def pop_job(self, res):
+        """Get the job of a reply from the backend server.
+
+        Arguments:
+            res (dict): backend server reply.
+
+        Returns:
+            tuple: job the reply belongs to (None for health checks).
+        """
+        # A backend server that doesn't know about request IDs replies in order
+        res_id = res.get('id', next(iter(self.jobs), None))
+
+        return self.jobs.pop(res_id, None)
+
+
+class _Broadcast:
+    """Request sent to several workers, which is replied when all of them reply.
+
+    Arguments:
+        count (int): number of workers.
+    """
+
+    def __init__(self, count):
+        """Set the number of missing replies."""
+        self.count = count
+        self.reply = None
+
+
+class _Stream:
+    """Streamed batch of simulations, whose simulations are spread over the
+    workers. It ends when all the simulations reply.
+
+    Arguments:
+        count (int): number of simulations.
+    """
+
+    def __init__(self, count):
+        """Set the number of missing replies."""
+        self.total = count
+        self.count = count
+
+
+class Dispatcher:
+    """A server in front of several Cadence servers.
+
+    The ``updateAndRun`` requests (and any other request, except those in
+    BROADCAST) are sent to the worker with the least requests being
+    processed. The ``loadSimulator`` requests are sent to all the workers that
+    didn't load the simulator yet. The simulations of a streamed
+    ``batchUpdateAndRun`` are sent to the workers as ``updateAndRun``
+    requests, and their results are streamed to the client as they end.
+
+    If a request can't be sent to a worker, it's sent to another worker. If a
+    worker fails while processing requests, they get an error reply instead,
+    since they may be what made it fail. The requests of unknown types are
+    answered with an error, and a ``shutdown`` request stops the dispatcher,
+    so they never reach the workers.
+
+    Each worker gets a ``configure`` request with its ID when the dispatcher
+    connects to it, so it can use its own variables and results files.
+
+    Arguments:
+        backends (list): addresses (host, port) of the backend servers.
+        sock (object, optional): socket to use in the connection with the
+            clients (default: None).
+        depth (int, optional): maximum number of requests sent to a worker at
+            the same time (default: 1).
+        health_interval (float, optional): time, in seconds, without hearing
+            from an idle worker before checking if it's alive (default: 30).
+            None disables the health checks.
+        health_timeout (float, optional): time, in seconds, to wait for the
+            reply to a health check (default: 30).
+        max_attempts (int, optional): maximum number of workers to try for a
+            request (default: 2).
+        read_size (int, optional): maximum number of bytes to receive per
+            socket call (default: READ_SIZE).
+        codecs (list, optional): names of the codecs accepted from the
+            clients and offered to the workers (default: codec.PREFERENCE).
+        compressors (list, optional): names of the compressors accepted from
+            the clients (default: compression.AVAILABLE).
+        compress_level (int, optional): compression level (default: None,
+            i.e. the compressor default).
+        compress_threshold (int, optional): minimum number of bytes of a
+            frame to be compressed (default: compression.THRESHOLD).
+        log_level (int, optional): minimum level of the diagnostics
+            (default: log.INFO).
+        log_file (str, optional): file where the diagnostics are written
+            instead of stderr (default: None).
+        log_rate (float, optional): maximum number of diagnostics per second
+            (default: log.RATE).
+    """
+
+    def __init__(self, backends, sock=None, depth=1, health_interval=30.0,
+                 health_timeout=30.0, max_attempts=2, read_size=READ_SIZE,
+                 codecs=codec.PREFERENCE, compressors=compression.AVAILABLE,
+                 compress_level=None, compress_threshold=compression.THRESHOLD,
+                 log_level=log.INFO, log_file=None, log_rate=log.RATE):
+        """Create the dispatcher socket."""
+        # Diagnostics, written in the background
+        self.log_file = open(log_file, 'a') if log_file else None
+        self.log = log.Log(self.log_file or sys.stderr, log_level, log_rate)
+
+        self.backends = list(backends)
+        self.depth = depth
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_attempts = max_attempts
+        self.read_size = read_size
+        self.codecs = list(codecs)
+        self.compressors = list(compressors)
+        self.compress_level = compress_level
+        self.compress_threshold = compress_threshold
+
+        self.workers = []
+        self.clients = []  # Connected clients, by turn to be served
+        self.handshakes = {}  # Clients in the handshake, with its deadline
+        self.variables = None  # Reply of the workers to loadSimulator
+        self.running = False
+
+        self.selector = selectors.DefaultSelector()
+
+        if sock is None:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # define socket options to allow the reuse of the same addr
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        else:
+            self.socket = sock
+
+    def connect(self):
+        """Connect to the backend servers.
+
+        Raises:
+            ConnectionError: if it can't connect to any backend server.
+
+        Returns:
+            int: number of connected workers.
+        """
+        for worker_id, addr in enumerate(self.backends):
+            client = Client(read_size=self.read_size, codecs=self.codecs)
+
+            try:
+                client.run(*addr)
+                # Isolate the files of each worker
+                client.send_data(dict(type='configure', data=dict(worker_id=worker_id)))
+                client.recv_data()
+            except (OSError, TypeError, KeyError) as err:
+                client.close()
+                self.log.warning("[DISPATCHER] Can't connect to worker {0}: {1}".format(addr,
+                                                                                      err))
+                continue
+
+            worker = Worker(worker_id, addr, client)
+            self.workers.append(worker)
+            self.selector.register(worker, selectors.EVENT_READ, worker)
+
+        if not self.workers:
+            raise ConnectionError("Can't connect to any backend server")
+
+        return len(self.workers)
+
+    def listen(self, host, port, backlog=5):
+        """Start accepting clients.
+
+        Arguments:
+            host (str): local socket IP address.
+            port (int): local socket port.
+            backlog (int, optional): number of connections waiting to be
+                accepted (default: 5).
+
+        Raises:
+            ConnectionError: if there's a communication problem.
+        """
+        try:
+            self.socket.bind((host, port))
+            self.socket.listen(backlog)
+        except OSError as err:
+            raise ConnectionError(err)
+
+        self.selector.register(self.socket, selectors.EVENT_READ)
+
+    def serve(self):
+        """Serve the clients until stop() is called."""
+        self.running = True
+
+        while self.running:
+            self.step(1.0)
+
+    def stop(self):
+        """Stop serving the clients."""
+        self.running = False
+
+    def step(self, timeout=None):
+        """Handle the events that happen during a period of time.
+
+        Arguments:
+            timeout (float, optional): maximum time, in seconds, to wait for
+                an event (default: None, i.e. wait forever).
+        """
+        if self.health_interval is not None:
+            # The health checks run at least every interval (step(0) doesn't block)
+            timeout = (self.health_interval if timeout is None
+                       else min(timeout, self.health_interval))
+        if self.handshakes:
+            # Wake up in time to drop the clients that don't finish the handshake
+            wait = max(min(self.handshakes.values()) - time.time(), 0)
+            timeout = wait if timeout is None else min(timeout, wait)
+
+        for key, _ in self.selector.select(timeout):
+            if key.data is None:
+                self._accept()
+            elif isinstance(key.data, Worker):
+                self._recv_from_worker(key.data)
+            elif key.data in self.handshakes:
+                self._finish_handshake(key.data)
+            else:
+                self._recv_from_client(key.data)
+
+        self._expire_handshakes()
+        self._check_health()
+        self._dispatch()
+
+    def _accept(self):
+        """Accept a new client.
+
+        The handshake is finished when the client replies (see
+        _finish_handshake()), so a slow client doesn't block the farm.
+        """
+        conn, addr = self.socket.accept()
+        client = Connection(conn, addr, self.read_size, self.compress_threshold)
+
+        try:
+            client.start_handshake(self.codecs, self.compressors, self.compress_level)
+        except OSError as err:
+            client.close()
+            self.log.warning("[DISPATCHER] Handshake with client {0} failed: {1}".format(addr,
+                                                                                        err))
+            return
+
+        self.handshakes[client] = time.time() + HANDSHAKE_TIMEOUT
+        self.selector.register(client, selectors.EVENT_READ, client)
+
+    def _finish_handshake(self, client):
+        """Receive the reply of a client to the handshake, and start serving
+        the client when the handshake is finished.
+
+        Arguments:
+            client (Connection): client in the handshake, with data to receive.
+        """
+        try:
+            if not client.poll_handshake():
+                return
+        except (OSError, TypeError, KeyError) as err:
+            del self.handshakes[client]
+            self.selector.unregister(client)
+            client.close()
+            self.log.warning("[DISPATCHER] Handshake with client {0} failed: {1}".format(
+                client.addr, err))
+            return
+
+        del self.handshakes[client]
+        self.clients.append(client)
+
+    def _expire_handshakes(self):
+        """Drop the clients that didn't finish the handshake in time."""
+        now = time.time()
+
+        for client, deadline in list(self.handshakes.items()):
+            if now > deadline:
+                del self.handshakes[client]
+                self.selector.unregister(client)
+                client.close()
+                self.log.warning("[DISPATCHER] Handshake with client {0} timed out".format(
+                    client.addr))
+
+    def _drop_client(self, client):
+        """Disconnect a client.
+
+        Arguments:
+            client (Connection): client to disconnect.
+        """
+        if client in self.clients:
+            self.clients.remove(client)
+            self.selector.unregister(client)
+            client.close()
+
+    def _reply(self, client, req, obj):
+        """Send a reply to a client, with the ID of the request.
+
+        Arguments:
+            client (Connection): client that sent the request.
+            req (dict): client request.
+            obj (dict): reply.
+        """
+        if client not in self.clients:  # The client has gone
+            return
+
+        obj = dict(obj)
+        obj.pop('id', None)
+        if 'id' in req:
+            obj['id'] = req['id']
+
+        try:
+            client.send_data(obj)
+        except (OSError, TypeError) as err:
+            self.log.warning("[DISPATCHER] Dropping client {0}: {1}".format(client.addr, err))
+            self._drop_client(client)
+
+    def _recv_from_client(self, client):
+        """Receive a request from a client and queue it.
+
+        Arguments:
+            client (Connection): client with data to receive.
+        """
+        try:
+            req = client.recv_data()
+        except (OSError, TypeError) as err:
+            self.log.warning("[DISPATCHER] Dropping client {0}: {1}".format(client.addr, err))
+            self._drop_client(client)
+            return
+
+        # Only the client gets the errors, and the workers never see the invalid requests
+        if not isinstance(req, dict) or 'data' not in req:
+            self._reply(client, req if isinstance(req, dict) else {},
+                        dict(type='error', data="Invalid request"))
+        elif req.get('type') not in FORWARDED:
+            self._reply(client, req, dict(type='error', data="Invalid request type: {0!r}".format(
+                req.get('type'))))
+        elif req['type'] == 'info' and req['data'] == 'exit':
+            self._drop_client(client)
+        elif req['type'] == 'info' and req['data'] == 'shutdown':
+            # The dispatcher stops (the workers get 'exit' when it's closed)
+            self.log.info("[DISPATCHER] Shutdown requested by client {0}".format(client.addr))
+            self._drop_client(client)
+            self.stop()
+        elif req.get('type') in BROADCAST:
+            self._broadcast(client, req)
+        elif req.get('stream') and req.get('type') == 'batchUpdateAndRun':
+            self._split(client, req)
+        else:
+            client.requests.append((req, 0, None))
+
+    def _split(self, client, req):
+        """Queue each simulation of a streamed batch as its own request.
+
+        Arguments:
+            client (Connection): client that sent the request.
+            req (dict): client request.
+        """
+        data = req.get('data') or []
+        group = _Stream(len(data))
+
+        if not data:
+            self._reply(client, req, dict(type='end', data=0))
+
+        for index, variables in enumerate(data):
+            part = dict(type='updateAndRun', data=variables, index=index)
+            if 'id' in req:
+                part['id'] = req['id']
+            client.requests.append((part, 0, group))
+
+    def _stream_reply(self, client, req, res, group):
+        """Send the reply to a simulation of a streamed batch to the client,
+        and end the stream after its last simulation.
+
+        Arguments:
+            client (Connection): client that sent the request.
+            req (dict): request of the simulation.
+            res (dict): reply.
+            group (_Stream): streamed batch.
+        """
+        self._reply(client, req, dict(res, index=req['index']))
+
+        group.count -= 1
+        if not group.count:
+            self._reply(client, req, dict(type='end', data=group.total))
+
+    def _broadcast(self, client, req):
+        """Send a request to all the workers that need it.
+
+        Arguments:
+            client (Connection): client that sent the request.
+            req (dict): client request.
+        """
+        workers = [worker for worker in self.workers if worker.alive and not worker.loaded]
+
+        if not workers:
+            if self.variables is not None:  # Every worker has already loaded the simulator
+                self._reply(client, req, self.variables)
+            else:
+                self._reply(client, req, dict(type='error', data="There are no workers"))
+            return
+
+        group = _Broadcast(len(workers))
+        for worker in workers:
+            self._submit(worker, client, req, 0, group)
+
+    def _submit(self, worker, client, req, attempt, group=None):
+        """Send a request to a worker.
+
+        Arguments:
+            worker (Worker): worker.
+            client (Connection): client that sent the request.
+            req (dict): client request.
+            attempt (int): number of workers that already failed the request.
+            group (object, optional): broadcast (_Broadcast) or streamed batch
+                (_Stream) the request belongs to (default: None).
+        """
+        job = (client, req, attempt, group)
+
+        try:
+            worker.submit(req.get('type'), req.get('data'), job)
+        except TypeError as err:
+            # The request can't be serialized, so it would fail in any worker
+            self._abort(job, "Invalid request: {0}".format(err))
+        except OSError as err:
+            # The worker didn't get the request, so another one can process it
+            self._fail(worker, err)
+            self._retry(job, err)
+
+    def _dispatch(self):
+        """Send the queued requests to the least busy workers.
+
+        The clients take turns, so a client with many queued requests can't
+        starve the others.
+        """
+        while any(client.requests for client in self.clients):
+            workers = [worker for worker in self.workers if worker.alive]
+
+            if not workers:
+                for client in self.clients:
+                    while client.requests:
+                        req, _, group = client.requests.popleft()
+                        error = dict(type='error', data="There are no workers")
+                        if group is None:
+                            self._reply(client, req, error)
+                        else:
+                            self._stream_reply(client, req, error, group)
+                return
+
+            worker = min(workers, key=lambda worker: worker.load)
+            if worker.load >= self.depth:
+                return
+
+            client = next(client for client in self.clients if client.requests)
+            self.clients.remove(client)
+            self.clients.append(client)
+
+            req, attempt, group = client.requests.popleft()
+            self._submit(worker, client, req, attempt, group)
+
+    def _recv_from_worker(self, worker):
+        """Receive a reply from a worker and send it to the client.
+
+        Arguments:
+            worker (Worker): worker with data to receive.
+        """
+        try:
+            res = worker.client.recv_data()
+        except (OSError, TypeError) as err:
+            self._fail(worker, err)
+            return
+
+        worker.last_seen = time.time()
+        job = worker.pop_job(res)
+
+        if job is None:  # Reply to a health check
+            worker.ping_sent = None
+            return
+
+        client, req, _, group = job
+
+        if group is None:
+            self._reply(client, req, res)
+            return
+
+        if isinstance(group, _Stream):
+            self._stream_reply(client, req, res, group)
+            return
+
+        # A broadcast is replied when all the workers reply
+        if res.get('type') == req.get('type'):
+            worker.loaded = True
+            self.variables = group.reply = res
+        group.count -= 1
+
+        if not group.count:
+            self._reply(client, req, group.reply or res)
+
+    def _check_health(self):
+        """Check if the idle workers are alive, and fail the silent ones."""
+        if self.health_interval is None:
+            return
+
+        now = time.time()
+
+        for worker in self.workers:
+            if not worker.alive:
+                continue
+
+            if worker.ping_sent is not None:
+                if now - worker.ping_sent > self.health_timeout:
+                    self._fail(worker, "Health check timed out")
+            elif not worker.jobs and now - worker.last_seen > self.health_interval:
+                try:
+                    worker.submit('info', 'ping', None)
+                except (OSError, TypeError) as err:
+                    self._fail(worker, err)
+                    continue
+                worker.ping_sent = now
+
+    def _fail(self, worker, err):
+        """Remove a failed worker, and reply with an error to the requests it
+        was processing.
+
+        They're not sent to other workers, since they may be what made the
+        worker fail (e.g. a simulation that crashes Cadence).
+
+        Arguments:
+            worker (Worker): failed worker.
+            err (Exception): reason of the failure.
+        """
+        self.log.error("[DISPATCHER] Worker {0} {1} failed: {2}".format(worker.worker_id,
+                                                                        worker.addr, err))
+
+        worker.alive = False
+        self.selector.unregister(worker)
+        worker.client.close()
+
+        jobs = [job for job in worker.jobs.values() if job is not None]
+        worker.jobs.clear()
+
+        for job in jobs:
+            self._abort(job, "Worker failed: {0}".format(err))
+
+    def _retry(self, job, err):
+        """Queue again a request that couldn't be sent to a worker, or reply
+        with an error if it has failed too many times.
+
+        Arguments:
+            job (tuple): job of the request.
+            err (Exception): reason of the failure.
+        """
+        client, req, attempt, group = job
+
+        if isinstance(group, _Broadcast) or attempt + 1 >= self.max_attempts:
+            self._abort(job, "Worker failed: {0}".format(err))
+        else:
+            client.requests.appendleft((req, attempt + 1, group))
+
+    def _abort(self, job, msg):
+        """Reply with an error to a request that failed.
+
+        Arguments:
+            job (tuple): job of the request.
+            msg (str): error message.
+        """
+        client, req, _, group = job
+        error = dict(type='error', data=msg)
+
+        if isinstance(group, _Broadcast):
+            group.count -= 1
+            if not group.count:
+                self._reply(client, req, group.reply or error)
+        elif group is None:
+            self._reply(client, req, error)
+        else:
+            self._stream_reply(client, req, error, group)
+
+    def close(self):
+        """Disconnect from the workers and the clients."""
+        for worker in self.workers:
+            if worker.alive:
+                try:
+                    worker.client.send_data(dict(type='info', data='exit'))
+                except ConnectionError:
+                    pass
+                worker.client.close()
+
+        for client in self.clients + list(self.handshakes):
+            client.close()
+
+        self.selector.close()
+        self.socket.close()
+
+        self.log.close()  # Write the remaining diagnostics
+        if self.log_file is not None:
+            self.log_file.close()
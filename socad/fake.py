@@ -0,0 +1,342 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Stand-in for Cadence Virtuoso, to run a server without a Virtuoso license.
+
+:class:`FakeCadence` replaces the ``sys`` module that is given to the
+:class:`socad.Server` in ``cadence.py``. It talks to the server through
+pipes, like Virtuoso does with ``ipcBeginProcess``, and emulates the
+``requestHandler`` of ``cadence.il``: each message with a function call is
+"evaluated" by a Python handler, after a configurable latency, and the result
+is sent back preceded by its length.
+"""
+
+import os
+import re
+import threading
+import time
+
+from . import skill
+
+_CALL = re.compile(r'^\s*\w+\(.*\)\s*$', re.DOTALL)
+_FRAMED = re.compile(br'^[0-9]+(\n|$)')
+_STARTED = b"Python server has started!"
+_DESVAR = re.compile(r'desVar\(\s*\"(?P<param>\w+)\"\s*(?P<value>\S+)\s*\)')
+
+
+def model(variables):
+    """Default circuit "simulated" by the fake Cadence.
+
+    Arguments:
+        variables (dict): circuit design variables.
+
+    Returns:
+        dict: simulation results.
+    """
+    values = list(variables.values())
+
+    return {'SUM': float(sum(values)), 'MAX': float(max(values or [0.0])),
+            'N': float(len(values))}
+
+
+class FakeCadence:
+    """Stand-in for the Cadence stream given to the server.
+
+    The default handlers emulate the procedures of ``cadence.il``:
+    ``loadSimulator``, ``updateAndRun``, which reads the design variables
+    from the variables file, "simulates" them with a model and writes the
+    results file like ``run.ocn``, ``batchUpdateAndRun``, and their in-band
+    versions, which get the variables and return the results instead of
+    using files.
+
+    Arguments:
+        latency (float, optional): time, in seconds, that each simulation
+            takes (default: 0).
+        handlers (dict, optional): Python functions that evaluate the SKILL
+            functions, by name. They're added to (or replace) the default
+            handlers (default: None).
+        sim_model (callable, optional): function that gets the design
+            variables and returns the results of updateAndRun (default:
+            model).
+    """
+
+    def __init__(self, latency=0, handlers=None, sim_model=model):
+        """Create the pipes to the server and start "Cadence"."""
+        self.latency = latency
+        self.model = sim_model
+        self.handlers = dict(loadSimulator=self.load_simulator, updateAndRun=self.update_and_run,
+                             batchUpdateAndRun=self.batch_update_and_run,
+                             updateAndRunInband=self.update_and_run_inband,
+                             batchUpdateAndRunInband=self.batch_update_and_run_inband,
+                             socadEvalBatch=self.eval_batch)
+        self.handlers.update(handlers or {})
+
+        self.exit_code = None
+        self.messages = []  # Messages that Cadence would print
+        self.evaluations = 0  # Number of evaluated expressions
+
+        # Cadence -> server and server -> Cadence pipes
+        in_read, self._in_write = os.pipe()
+        self._out_read, out_write = os.pipe()
+        self.stdin = os.fdopen(in_read, 'r')
+        self.stdout = os.fdopen(out_write, 'w')
+        self.stderr = _Log(self.messages)
+
+        self._started = False
+        self._thread = threading.Thread(target=self._request_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+        # Same message sent by startServer() in cadence.il
+        self._send_data("Python server has started!\n")
+
+    def load_simulator(self, load_file):
+        """Emulate the loadSimulator procedure.
+
+        Arguments:
+            load_file (str): name of file to load the simulator from.
+
+        Returns:
+            str: function status.
+        """
+        return "loadSimulator_OK"
+
+    def update_and_run(self, run_file, var_file, result_file):
+        """Emulate the updateAndRun procedure.
+
+        Arguments:
+            run_file (str): name of file to run the simulation from.
+            var_file (str): name of file with the circuit design variables.
+            result_file (str): environment variable assignment with the name
+                of the file to store the simulation results.
+
+        Returns:
+            str: function status.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        with open(var_file, 'r') as f:
+            content = f.read()
+
+        variables = {}
+        for match in _DESVAR.finditer(content):
+            variables[match.group('param')] = float(match.group('value'))
+
+        with open(result_file.split('=', 1)[1], 'w') as f:
+            for key, val in self.model(variables).items():
+                f.write("{0}\t{1!r}\n".format(key, val))
+
+        return "updateAndRun_OK"
+
+    def batch_update_and_run(self, run_file, var_files, result_files):
+        """Emulate the batchUpdateAndRun procedure.
+
+        Arguments:
+            run_file (str): name of file to run the simulations from.
+            var_files (list): names of files with the circuit design variables.
+            result_files (list): environment variable assignments with the
+                names of the files to store the simulation results.
+
+        Returns:
+            str: function status.
+        """
+        for var_file, result_file in zip(var_files, result_files):
+            self.update_and_run(run_file, var_file, result_file)
+
+        return "batchUpdateAndRun_OK"
+
+    def update_and_run_inband(self, run_file, variables):
+        """Emulate the updateAndRunInband procedure.
+
+        Arguments:
+            run_file (str): name of file to run the simulation from.
+            variables (list): (name, value) pairs of the circuit design
+                variables.
+
+        Returns:
+            list: function status and (name, value) pairs of the results.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        results = self.model(dict((name, float(value)) for name, value in variables))
+
+        return ["updateAndRunInband_OK", [[key, val] for key, val in results.items()]]
+
+    def batch_update_and_run_inband(self, run_file, batch):
+        """Emulate the batchUpdateAndRunInband procedure.
+
+        Arguments:
+            run_file (str): name of file to run the simulations from.
+            batch (list): (name, value) pairs of the circuit design
+                variables of each simulation.
+
+        Returns:
+            list: function status and results of each simulation.
+        """
+        results = [self.update_and_run_inband(run_file, variables)[1] for variables in batch]
+
+        return ["batchUpdateAndRunInband_OK", results]
+
+    def eval_batch(self, exprs):
+        """Emulate the socadEvalBatch procedure.
+
+        Arguments:
+            exprs (list): SKILL expressions.
+
+        Returns:
+            list: function status and, for each expression, a list with t
+            and its value, or nil and the error message.
+        """
+        results = []
+        for expr in exprs:
+            try:
+                results.append([True, self._call(expr)])
+            except Exception as err:  # pylint: disable=broad-except
+                results.append([False, str(err)])
+
+        return ["socadEvalBatch_OK", results]
+
+    def exit(self, code):
+        """Emulate the end of the server process.
+
+        Arguments:
+            code (int): exit code.
+        """
+        self.exit_code = code
+
+        try:
+            os.close(self._in_write)
+        except OSError:
+            pass
+
+    def _request_loop(self):
+        """Receive the messages of the server, like requestHandler.
+
+        The messages preceded by their length are reassembled, like
+        requestHandler does, so they may arrive in several reads.
+        """
+        buffer = b''  # Received part of a message with length
+
+        while True:
+            try:
+                data = os.read(self._out_read, 1 << 20)
+            except OSError:
+                break
+
+            if not data:  # The server has closed its stdout
+                break
+
+            if not self._started:
+                self._started = data.startswith(_STARTED)
+                self.messages.append((_STARTED if self._started else data).decode())
+                # Other messages may have been received with this one
+                data = data[len(_STARTED):] if self._started else b''
+
+            if buffer or _FRAMED.match(data):
+                buffer += data
+                while True:
+                    header, newline, rest = buffer.partition(b'\n')
+                    if not newline or len(rest) < int(header):
+                        break
+                    self._handle(rest[:int(header)].decode())
+                    buffer = rest[int(header):]
+            elif data:
+                self._handle(data.decode())
+
+        os.close(self._out_read)
+
+    def _handle(self, request):
+        """Handle a whole message of the server.
+
+        Arguments:
+            request (str): message.
+        """
+        if _CALL.match(request):
+            self._send_data(self._evaluate(request) + "\n")
+        else:
+            self.messages.append(request)
+
+    def _evaluate(self, expr):
+        """Evaluate a function call with the respective handler.
+
+        Arguments:
+            expr (str): SKILL expression.
+
+        Returns:
+            str: result, formatted like SKILL prints it, or an error message.
+        """
+        try:
+            return skill.format_value(self._call(expr))
+        except Exception as err:  # pylint: disable=broad-except
+            return "*Error* {0}".format(err)
+
+    def _call(self, expr):
+        """Call the handler of a function call.
+
+        Arguments:
+            expr (str): SKILL expression.
+
+        Raises:
+            Exception: if the expression can't be evaluated.
+
+        Returns:
+            object: result.
+        """
+        self.evaluations += 1
+
+        name, args = skill.parse_call(expr)
+
+        try:
+            handler = self.handlers[name]
+        except KeyError:
+            raise skill.SkillError("eval: undefined function - {0}".format(name))
+
+        try:
+            return handler(*args)
+        except Exception as err:  # pylint: disable=broad-except
+            raise skill.SkillError("{0}: {1}".format(name, err))
+
+    def _send_data(self, msg):
+        """Send data to the server, like sendData in cadence.il.
+
+        Arguments:
+            msg (str): data to send.
+        """
+        data = msg.encode()
+
+        try:
+            os.write(self._in_write, "{0}\n".format(len(data)).encode() + data)
+        except OSError:  # The server has gone
+            pass
+
+
+class _Log:
+    """Stand-in for the stderr of the server, which Cadence prints."""
+
+    def __init__(self, messages):
+        """Store the messages in the given list."""
+        self.messages = messages
+
+    def write(self, msg):
+        """Store a message."""
+        self.messages.append(msg)
+
+    def flush(self):
+        """Nothing to flush."""
+
+    def close(self):
+        """Nothing to close."""
@@ -0,0 +1,308 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Record and replay of the sessions of a server.
+
+In capture mode (see the ``journal_file`` argument of :class:`socad.Server`)
+the server records in a journal every request received from the clients,
+every reply sent to them, and every message exchanged with Cadence, with the
+time when it happened. The :class:`Replayer` plays the requests of a journal
+back against a server, to load it with the traffic of a real session.
+
+The journal is a binary file: a signature, followed by the records. Each
+record has a header with the time (float64), the kind of record (uint8), the
+codec of the payload (uint8), the client (uint16) and the payload length
+(uint32), all little-endian, followed by the payload: the request or reply,
+as it was serialized by the codec of the client, or the Cadence message, in
+UTF-8. So recording a request or reply doesn't serialize it again.
+"""
+
+import select
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from .codec import CODECS, PREFERENCE
+
+SIGNATURE = b'SOCADJ2\n'
+
+# Kinds of records
+REQUEST = 1  # Request received from a client
+REPLY = 2  # Reply sent to a client
+SKILL_SEND = 3  # Expression sent to Cadence
+SKILL_RECV = 4  # Message received from Cadence
+
+_HEADER = struct.Struct('<dBBHI')
+
+# Codecs of the payloads, by number (0 for the Cadence messages)
+_CODECS = (None, 'json', 'binary')
+
+Record = namedtuple('Record', 'time kind client obj')
+
+
+class Journal:
+    """Journal where the server records its sessions.
+
+    Arguments:
+        fname (str): name of the journal file (it's overwritten).
+    """
+
+    def __init__(self, fname):
+        """Create the journal file."""
+        self.file = open(fname, 'wb')
+        self.file.write(SIGNATURE)
+        self._clients = {}  # Number of each client, by id() of its connection
+        self._count = 0  # Number of clients recorded
+        self._lock = threading.Lock()
+
+    def record(self, kind, data, client=None, codec=None):
+        """Record an event.
+
+        Arguments:
+            kind (int): kind of record, e.g. REQUEST.
+            data (object): serialized request or reply (bytes), or Cadence
+                message (str).
+            client (object, optional): connection of the client, for the
+                requests and replies (default: None).
+            codec (str, optional): name of the codec of the request or reply
+                (default: None).
+        """
+        codec_number = _CODECS.index(codec)
+        payload = data if isinstance(data, (bytes, bytearray)) else data.encode('utf-8')
+
+        with self._lock:
+            number = 0
+            if client is not None:
+                number = self._clients.get(id(client))
+                if number is None:
+                    number = self._clients[id(client)] = self._count
+                    self._count += 1
+            self.file.write(_HEADER.pack(time.time(), kind, codec_number, number, len(payload)))
+            self.file.write(payload)
+
+    def drop_client(self, client):
+        """Forget a disconnected client, so a new connection isn't recorded
+        as the same client.
+
+        Arguments:
+            client (object): connection of the client.
+        """
+        with self._lock:
+            self._clients.pop(id(client), None)
+
+    def close(self):
+        """Close the journal file."""
+        with self._lock:
+            self.file.close()
+
+
+def read(fname):
+    """Read the records of a journal.
+
+    Arguments:
+        fname (str): name of the journal file.
+
+    Raises:
+        ValueError: if the file is not a journal, or it's truncated.
+
+    Returns:
+        generator: records (time, kind, client, obj), by order.
+    """
+    with open(fname, 'rb') as f:
+        if f.read(len(SIGNATURE)) != SIGNATURE:
+            raise ValueError("{0} is not a SOCAD journal".format(fname))
+
+        while True:
+            header = f.read(_HEADER.size)
+            if not header:
+                return
+            if len(header) < _HEADER.size:
+                raise ValueError("The journal {0} is truncated".format(fname))
+
+            timestamp, kind, codec_number, client, length = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError("The journal {0} is truncated".format(fname))
+
+            if codec_number:
+                obj = CODECS[_CODECS[codec_number]].decode(bytearray(payload))
+            else:
+                obj = payload.decode('utf-8')
+
+            yield Record(timestamp, kind, client, obj)
+
+
+class Replayer:
+    """Play the requests of a journal back against a server.
+
+    Each client of the journal is replayed by its own client, in a thread.
+    A request is sent after the replies that the original client got before
+    sending it (so the pipelining of the requests is kept), and at its
+    original time, divided by the speed.
+
+    Arguments:
+        fname (str): name of the journal file.
+        speed (float, optional): speed of the replay, e.g. 1 for the
+            original speed, or 10 for 10 times faster. With None, each
+            request is sent as soon as possible (default: 1).
+    """
+
+    def __init__(self, fname, speed=1.0):
+        """Read the requests of the journal."""
+        self.speed = speed
+        self.sessions = _sessions(read(fname))
+
+    def run(self, host, port, codecs=PREFERENCE):
+        """Replay the journal.
+
+        Arguments:
+            host (str): server address.
+            port (int): server port.
+            codecs (list, optional): names of the codecs offered to the server
+                (default: codec.PREFERENCE).
+
+        Raises:
+            ConnectionError: if there's a communication problem.
+
+        Returns:
+            dict: number of requests, duration (in seconds), and round-trip
+            time of each request (in seconds, until its last reply).
+        """
+        # Imported here, so the server doesn't depend on the client
+        from .client import Client  # pylint: disable=import-outside-toplevel
+
+        latencies = []
+        errors = []
+        start = time.time()
+
+        def replay(session):
+            try:
+                client = Client(codecs=codecs)
+                client.run(host, port)
+                try:
+                    latencies.extend(self._replay(client, session, start))
+                finally:
+                    client.close()
+            except Exception as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+        threads = [threading.Thread(target=replay, args=(session,))
+                   for session in self.sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return dict(requests=len(latencies), duration=time.time() - start,
+                    latencies=latencies)
+
+    def _replay(self, client, session, start):
+        """Replay the requests of a client.
+
+        Arguments:
+            client (Client): connected client.
+            session (list): requests of the client (see _sessions()).
+            start (float): start time of the replay.
+
+        Returns:
+            list: round-trip time of each request.
+        """
+        pending = {}  # Send time and number of replies left, by request key
+        keys = []  # Keys of the requests without ID, by order
+        latencies = []
+
+        def receive(timeout=None):
+            """Receive a reply, waiting up to the timeout for it."""
+            if timeout is not None and not select.select([client.socket], [], [],
+                                                         max(timeout, 0))[0]:
+                return False
+
+            reply = client.recv_data()
+            key = ('id', reply['id']) if 'id' in reply else keys.pop(0)
+            sent, left = pending[key]
+            if left > 1:
+                pending[key] = (sent, left - 1)
+            else:
+                del pending[key]
+                latencies.append(time.time() - sent)
+            return True
+
+        for offset, req, replies, waits in session:
+            # Wait for the replies the original client got before this request
+            while len(latencies) < waits:
+                receive()
+
+            # Wait for the time of the request, receiving the replies meanwhile
+            if self.speed:
+                due = start + offset / self.speed
+                while time.time() < due and pending and receive(due - time.time()):
+                    pass
+                time.sleep(max(due - time.time(), 0))
+
+            client.send_data(req)
+            if replies:
+                if 'id' in req:
+                    key = ('id', req['id'])
+                else:  # Matched by order
+                    key = ('seq', id(req))
+                    keys.append(key)
+                pending[key] = (time.time(), replies)
+
+        while pending:
+            receive()
+
+        return latencies
+
+
+def _sessions(records):
+    """Get the requests of each client of a journal.
+
+    Arguments:
+        records (iterable): records of the journal.
+
+    Returns:
+        list: requests of each client. Each request has its time (since the
+        first request of the journal), the request, its number of replies,
+        and the number of requests of the client that were answered before
+        it was sent.
+    """
+    sessions = {}  # Requests of each client
+    pending = {}  # Requests not answered yet, by client and request key
+    answered = {}  # Number of requests answered, by client
+    first = None
+
+    for record in records:
+        if record.kind == REQUEST:
+            first = record.time if first is None else first
+            req = record.obj
+            session = sessions.setdefault(record.client, [])
+            session.append([record.time - first, req, 0, answered.get(record.client, 0)])
+            pending.setdefault(record.client, []).append(session[-1])
+        elif record.kind == REPLY:
+            reqs = pending.get(record.client, [])
+            reply = record.obj
+            for req in reqs:
+                if req[1].get('id') == reply.get('id'):
+                    req[2] += 1
+                    if not (req[1].get('stream') and reply.get('type') != 'end'):
+                        reqs.remove(req)  # The last reply of the request
+                        answered[record.client] = answered.get(record.client, 0) + 1
+                    break
+
+    return [[tuple(req) for req in session] for _, session in sorted(sessions.items())]
@@ -0,0 +1,186 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Diagnostics channel of the server.
+
+Messages are filtered by level, limited to a maximum rate and buffered.
+A background thread writes the buffered messages in batches, so sending a
+message never blocks the server (e.g. while Cadence is busy and doesn't read
+its end of the pipe).
+"""
+
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+# Levels, by name
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+
+# Default maximum number of messages per second, and of messages in a burst
+RATE = 50
+BURST = 200
+
+# Default interval, in seconds, between writes of the buffered messages
+INTERVAL = 0.2
+
+
+class Log:
+    """Leveled, rate-limited and buffered log channel.
+
+    The messages are written to a stream (e.g. the stderr given by Cadence
+    or a side file) by a background thread. The messages above the maximum
+    rate are dropped, and the number of dropped messages is written instead.
+
+    Arguments:
+        stream (object): stream where the messages are written.
+        level (int, optional): minimum level of the messages (default:
+            DEBUG).
+        rate (float, optional): maximum number of messages per second, or
+            None for no limit (default: RATE).
+        burst (int, optional): maximum number of messages written at once,
+            above the rate (default: BURST).
+        interval (float, optional): interval, in seconds, between writes
+            (default: INTERVAL).
+    """
+
+    def __init__(self, stream, level=DEBUG, rate=RATE, burst=BURST, interval=INTERVAL):
+        """Start the thread that writes the messages."""
+        self.stream = stream
+        self.level = level
+        self.rate = rate
+        self.burst = burst
+        self.interval = interval
+        self.dropped = 0  # Messages dropped since the last one written
+
+        self._buffer = []  # Messages not written yet
+        self._allowance = burst  # Messages that can be sent right now
+        self._last = time.time()  # Time of the last message
+        self._lock = threading.Lock()  # Protects the buffer and the rate limit
+        self._write_lock = threading.Lock()  # Keeps the order of the writes
+        self._closed = threading.Event()
+
+        self._thread = threading.Thread(target=self._write_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def debug(self, msg):
+        """Send a debug message.
+
+        Arguments:
+            msg (str): message.
+        """
+        if self.level <= DEBUG:
+            self.write(DEBUG, msg)
+
+    def info(self, msg):
+        """Send an information message.
+
+        Arguments:
+            msg (str): message.
+        """
+        if self.level <= INFO:
+            self.write(INFO, msg)
+
+    def warning(self, msg):
+        """Send a warning message.
+
+        Arguments:
+            msg (str): message.
+        """
+        self.write(WARNING, msg)
+
+    def error(self, msg):
+        """Send an error message.
+
+        Arguments:
+            msg (str): message.
+        """
+        self.write(ERROR, msg)
+
+    def write(self, level, msg):
+        """Buffer a message, if it's above the level and the rate allows it.
+
+        Arguments:
+            level (int): message level.
+            msg (str): message. A new line is added if it doesn't end with one.
+        """
+        if level < self.level:
+            return
+
+        if not msg.endswith('\n'):
+            msg += '\n'
+
+        with self._lock:
+            if self.rate is not None and not self._allow():
+                self.dropped += 1
+                return
+
+            if self.dropped:
+                self._buffer.append("[{0} messages dropped]\n".format(self.dropped))
+                self.dropped = 0
+            self._buffer.append(msg)
+
+    def flush(self):
+        """Write the buffered messages, in a single write."""
+        with self._write_lock:
+            with self._lock:
+                msgs, self._buffer = self._buffer, []
+
+            if not msgs:
+                return
+
+            try:
+                self.stream.write(''.join(msgs))
+                self.stream.flush()
+            except (IOError, OSError, ValueError):  # The stream was closed
+                pass
+
+    def close(self):
+        """Stop the background thread and write the remaining messages."""
+        self._closed.set()
+        self._thread.join()
+
+        with self._lock:
+            if self.dropped:
+                self._buffer.append("[{0} messages dropped]\n".format(self.dropped))
+                self.dropped = 0
+
+        self.flush()
+
+    def _allow(self):
+        """Check if the rate allows one more message (token bucket).
+
+        Returns:
+            bool: True if the message can be sent.
+        """
+        now = time.time()
+        self._allowance = min(self.burst, self._allowance + (now - self._last) * self.rate)
+        self._last = now
+
+        if self._allowance < 1:
+            return False
+
+        self._allowance -= 1
+        return True
+
+    def _write_loop(self):
+        """Write the buffered messages periodically, until the log is closed."""
+        while not self._closed.is_set():
+            self._closed.wait(self.interval)
+            self.flush()
@@ -0,0 +1,277 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Measurements of simulation results, in NumPy, to replace the expressions
+of the OCEAN calculator (e.g. ``ymax``, ``gainBwProd`` or ``pv``).
+
+The measurements work on a whole batch of results at once: the frequency
+responses of the batch are stacked in a 2-D array, with one simulation per
+row, and each measurement returns an array with one value per simulation.
+Measurements that aren't found (e.g. a gain that never crosses 0 dB) are
+NaN, where OCEAN returns nil.
+
+This module requires NumPy.
+"""
+
+import multiprocessing
+
+import numpy
+
+
+def stack(results, signal):
+    """Stack a signal of several simulations in a 2-D array.
+
+    Arguments:
+        results (list): results of each simulation, as returned by
+            socad.psf.read() or by the 'readResults' request.
+        signal (str): signal name, e.g. "out" or "freq".
+
+    Raises:
+        KeyError: if a simulation doesn't have the signal.
+        ValueError: if the signal doesn't have the same number of points in
+            all the simulations.
+
+    Returns:
+        numpy.ndarray: signal of each simulation, one per row.
+    """
+    return numpy.stack([numpy.asarray(result[signal]) for result in results])
+
+
+def max_magnitude(values):
+    """Maximum magnitude of a signal, i.e. ymax(mag(...)) in OCEAN.
+
+    Arguments:
+        values (numpy.ndarray): signal (real or complex), with the points in
+            the last axis.
+
+    Returns:
+        numpy.ndarray: maximum magnitude of each simulation.
+    """
+    return numpy.abs(values).max(axis=-1)
+
+
+def crossing(freq, values, level):
+    """Frequency where a magnitude falls below a level for the first time.
+
+    The frequency is interpolated linearly in log scale, between the points
+    around the crossing.
+
+    Arguments:
+        freq (numpy.ndarray): frequencies, shared by all the simulations (1-D)
+            or of each simulation (same shape as the values).
+        values (numpy.ndarray): magnitude of each simulation, with the points
+            in the last axis.
+        level (float|numpy.ndarray): level, for all the simulations or of
+            each one.
+
+    Returns:
+        numpy.ndarray: crossing frequency of each simulation (NaN if the
+        magnitude doesn't fall below the level).
+    """
+    with numpy.errstate(divide='ignore'):  # log10(0) is -inf
+        log_freq, found = _crossing(freq, numpy.log10(values), numpy.log10(level))[:2]
+
+    return numpy.where(found, 10 ** log_freq, numpy.nan)
+
+
+def bandwidth(freq, values, db=3.0):
+    """Frequency where the gain falls a number of dB below its low frequency
+    value (the value at the first frequency).
+
+    Arguments:
+        freq (numpy.ndarray): frequencies (see crossing()).
+        values (numpy.ndarray): frequency response (real or complex), with
+            the points in the last axis.
+        db (float, optional): gain drop, in dB (default: 3).
+
+    Returns:
+        numpy.ndarray: bandwidth of each simulation (NaN if not found).
+    """
+    mag = numpy.abs(values)
+
+    return crossing(freq, mag, mag[..., 0] * 10 ** (-db / 20.0))
+
+
+def gain_bw_product(freq, values):
+    """Gain-bandwidth product, i.e. gainBwProd() in OCEAN: product of the low
+    frequency gain and the -3 dB bandwidth.
+
+    Arguments:
+        freq (numpy.ndarray): frequencies (see crossing()).
+        values (numpy.ndarray): frequency response (real or complex), with
+            the points in the last axis.
+
+    Returns:
+        numpy.ndarray: gain-bandwidth product of each simulation (NaN if
+        the bandwidth is not found).
+    """
+    return numpy.abs(values[..., 0]) * bandwidth(freq, values)
+
+
+def unity_gain_frequency(freq, values):
+    """Frequency where the gain falls below 0 dB.
+
+    Arguments:
+        freq (numpy.ndarray): frequencies (see crossing()).
+        values (numpy.ndarray): frequency response (real or complex), with
+            the points in the last axis.
+
+    Returns:
+        numpy.ndarray: unity gain frequency of each simulation (NaN if the
+        gain is always below or above 0 dB).
+    """
+    return crossing(freq, numpy.abs(values), 1.0)
+
+
+def phase_margin(freq, values):
+    """Phase margin of a loop gain, i.e. phaseMargin() in OCEAN: 180 degrees
+    plus its phase at the unity gain frequency.
+
+    The phase is unwrapped from the first frequency, where it's taken
+    between -180 and 180 degrees.
+
+    Arguments:
+        freq (numpy.ndarray): frequencies (see crossing()).
+        values (numpy.ndarray): complex loop gain, with the points in the
+            last axis.
+
+    Returns:
+        numpy.ndarray: phase margin of each simulation, in degrees (NaN if
+        the gain doesn't cross 0 dB).
+    """
+    with numpy.errstate(divide='ignore'):  # log10(0) is -inf
+        _, found, idx, pos = _crossing(freq, numpy.log10(numpy.abs(values)), 0.0)
+
+    phase = numpy.degrees(numpy.unwrap(numpy.angle(values), axis=-1))
+    phase -= 360 * numpy.round(phase[..., :1] / 360)
+
+    return numpy.where(found, 180 + _interpolate(phase, idx, pos), numpy.nan)
+
+
+def op_param(results, instance, param):
+    """Operating point parameter of an instance in several simulations, i.e.
+    pv() in OCEAN.
+
+    Arguments:
+        results (list): "dcOpInfo" results of each simulation, as returned by
+            socad.psf.read() or by the 'readResults' request.
+        instance (str): instance name, e.g. "M1.m1".
+        param (str): parameter name, e.g. "region" or "pwr".
+
+    Raises:
+        KeyError: if a simulation doesn't have the instance or parameter.
+
+    Returns:
+        numpy.ndarray: parameter of each simulation.
+    """
+    return numpy.array([result[instance][param] for result in results])
+
+
+def ac_metrics(freq, values):
+    """Measure the AC metrics of the example circuit, like run.ocn.
+
+    Arguments:
+        freq (numpy.ndarray): frequencies (see crossing()).
+        values (numpy.ndarray): frequency response of each simulation.
+
+    Returns:
+        dict: GAIN, GBW, UGF and PM of each simulation.
+    """
+    return dict(GAIN=max_magnitude(values), GBW=gain_bw_product(freq, values),
+                UGF=unity_gain_frequency(freq, values), PM=phase_margin(freq, values))
+
+
+def measure_batch(func, batch, processes=None):
+    """Apply a measurement function to a batch of results, in parallel.
+
+    The batch is split in one part per process, and the function is applied
+    to each part in a process pool, so large batches use all the cores of
+    the client. The results are copied to the processes, so the pool only
+    pays off when the measurements take longer than copying the results.
+
+    Arguments:
+        func (callable): function that gets a list of results and returns a
+            dict of arrays, with one value per result (e.g. a function that
+            stacks the signals and calls ac_metrics()). It must be defined at
+            the top level of a module, so it can be sent to the processes.
+        batch (list): results of each simulation.
+        processes (int, optional): number of processes, or None to apply the
+            function in this process (default: None).
+
+    Returns:
+        dict: arrays returned by the function, for the whole batch.
+    """
+    if not processes or processes < 2 or len(batch) < 2:
+        return func(batch)
+
+    size = -(-len(batch) // processes)  # Ceiling division
+    parts = [batch[i:i + size] for i in range(0, len(batch), size)]
+
+    pool = multiprocessing.Pool(min(processes, len(parts)))
+    try:
+        measured = pool.map(func, parts)
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict((key, numpy.concatenate([part[key] for part in measured]))
+                for key in measured[0])
+
+
+def _crossing(freq, log_values, log_level):
+    """Find where a magnitude falls below a level for the first time.
+
+    Arguments:
+        freq (numpy.ndarray): frequencies (see crossing()).
+        log_values (numpy.ndarray): log10 of the magnitude of each simulation.
+        log_level (float|numpy.ndarray): log10 of the level.
+
+    Returns:
+        tuple: log10 of the crossing frequencies, whether each one was found,
+        and the index of the point after the crossing and the position of
+        the crossing between the points (from 0 to 1), to interpolate other
+        signals (see _interpolate()).
+    """
+    log_level = numpy.asarray(log_level)
+    below = log_values < log_level[..., None]
+    idx = numpy.argmax(below, axis=-1)
+    found = below.any(axis=-1) & (idx > 0)
+    idx = numpy.maximum(idx, 1)[..., None]
+
+    y_0 = numpy.take_along_axis(log_values, idx - 1, -1)[..., 0]
+    y_1 = numpy.take_along_axis(log_values, idx, -1)[..., 0]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        pos = (log_level - y_0) / (y_1 - y_0)
+
+    log_freq = numpy.log10(numpy.broadcast_to(freq, log_values.shape))
+
+    return _interpolate(log_freq, idx, pos), found, idx, pos
+
+
+def _interpolate(values, idx, pos):
+    """Interpolate a signal between two consecutive points.
+
+    Arguments:
+        values (numpy.ndarray): signal of each simulation.
+        idx (numpy.ndarray): index of the second point, of each simulation.
+        pos (numpy.ndarray): position between the points (from 0 to 1).
+
+    Returns:
+        numpy.ndarray: interpolated value of each simulation.
+    """
+    v_0 = numpy.take_along_axis(values, idx - 1, -1)[..., 0]
+    v_1 = numpy.take_along_axis(values, idx, -1)[..., 0]
+
+    return v_0 + (v_1 - v_0) * pos
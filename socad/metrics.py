@@ -0,0 +1,176 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Latency metrics of the server, by phase of the requests.
+
+The server measures how long each phase takes (e.g. receiving a request,
+decoding it, running it in Cadence, sending the reply) with a monotonic
+clock. The durations of the last requests are kept in a rolling window, to
+get their percentiles, and the totals are kept since the server started.
+"""
+
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Monotonic clock (Python 2 only has the wall clock)
+clock = getattr(time, 'perf_counter', time.time)
+
+# Default number of durations kept per phase
+WINDOW = 1024
+
+# Percentiles reported by stats()
+PERCENTILES = (50, 95, 99)
+
+
+class Metrics:
+    """Rolling latency histograms, by phase.
+
+    Arguments:
+        window (int, optional): number of durations kept per phase, to get
+            the percentiles (default: WINDOW).
+    """
+
+    def __init__(self, window=WINDOW):
+        """Start without measurements."""
+        self.window = window
+        self._phases = {}  # Durations, count and total time, by phase
+        # Request, client and start time of the requests in progress, by id()
+        # of the request (which is kept, so its id() isn't reused meanwhile)
+        self._started = {}
+
+    @contextmanager
+    def timer(self, phase):
+        """Measure the duration of a block of code (in a "with").
+
+        Arguments:
+            phase (str): phase name.
+        """
+        start = clock()
+        try:
+            yield
+        finally:
+            self.observe(phase, clock() - start)
+
+    def observe(self, phase, seconds):
+        """Add a duration to a phase.
+
+        Arguments:
+            phase (str): phase name.
+            seconds (float): duration, in seconds.
+        """
+        try:
+            durations, totals = self._phases[phase]
+        except KeyError:
+            durations, totals = self._phases[phase] = (deque(maxlen=self.window), [0, 0.0])
+
+        durations.append(seconds)
+        totals[0] += 1
+        totals[1] += seconds
+
+    def start_request(self, req, client=None):
+        """Start measuring the time until a request is answered.
+
+        Arguments:
+            req (dict): request.
+            client (object, optional): connection of the client that sent
+                the request (default: None).
+        """
+        self._started[id(req)] = (req, client, clock())
+
+    def end_request(self, req, phase='request'):
+        """End the measurement of a request, if it was started and not ended.
+
+        Arguments:
+            req (dict): request.
+            phase (str, optional): phase name (default: 'request').
+        """
+        started = self._started.pop(id(req), None)
+
+        if started is not None:
+            self.observe(phase, clock() - started[2])
+
+    def drop_client(self, client):
+        """Forget the requests of a disconnected client, which won't be
+        answered.
+
+        Arguments:
+            client (object): connection of the client.
+        """
+        for key, (_, req_client, _) in list(self._started.items()):
+            if req_client is client:
+                del self._started[key]
+
+    def stats(self):
+        """Get the statistics of each phase.
+
+        Returns:
+            dict: count and total time (since the start), and percentiles
+            and maximum (of the rolling window) of each phase, in seconds,
+            e.g. {'cadence': {'count': 10, 'total': 1.2, 'p50': 0.1, ...}}.
+        """
+        stats = {}
+
+        for phase, (durations, (count, total)) in self._phases.items():
+            ordered = sorted(durations)
+            stats[phase] = dict(count=count, total=total, max=ordered[-1])
+            for pct in PERCENTILES:
+                stats[phase]['p{0}'.format(pct)] = percentile(ordered, pct)
+
+        return stats
+
+    def prometheus(self, prefix='socad'):
+        """Dump the statistics in the Prometheus text format, as a summary.
+
+        Arguments:
+            prefix (str, optional): prefix of the metric name (default:
+                'socad').
+
+        Returns:
+            str: metrics, e.g. socad_phase_seconds{phase="cadence",quantile="0.5"} 0.1.
+        """
+        name = '{0}_phase_seconds'.format(prefix)
+        lines = ['# HELP {0} Duration of each phase of the requests.'.format(name),
+                 '# TYPE {0} summary'.format(name)]
+
+        for phase, stats in sorted(self.stats().items()):
+            for percentile in PERCENTILES:
+                lines.append('{0}{{phase="{1}",quantile="{2}"}} {3!r}'.format(
+                    name, phase, percentile / 100.0, stats['p{0}'.format(percentile)]))
+            lines.append('{0}_sum{{phase="{1}"}} {2!r}'.format(name, phase, stats['total']))
+            lines.append('{0}_count{{phase="{1}"}} {2}'.format(name, phase, stats['count']))
+
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        """Remove all the measurements."""
+        self._phases.clear()
+        self._started.clear()
+
+
+def percentile(ordered, pct):
+    """Get a percentile of sorted values (nearest rank).
+
+    Arguments:
+        ordered (list): sorted values (at least one).
+        pct (float): percentile, from 0 to 100.
+
+    Returns:
+        float: value.
+    """
+    rank = int(math.ceil(pct / 100.0 * len(ordered)))
+
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
@@ -0,0 +1,204 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""On-demand profiling of the running server.
+
+The CPU profiler (cProfile) and the memory tracer (tracemalloc) are started
+and stopped while the server runs, e.g. by requests of a client, so the hot
+paths can be profiled under real load without restarting Cadence. Each
+result is returned as a text summary and, if the profiler has a directory,
+dumped to a file, which can be loaded with pstats.Stats() or
+tracemalloc.Snapshot.load().
+"""
+
+import cProfile
+import os
+import pstats
+import time
+
+try:
+    from StringIO import StringIO  # Python 2 (pstats writes str)
+except ImportError:
+    from io import StringIO
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+# Default number of functions or lines in the summaries
+LIMIT = 30
+
+
+class Profiler:
+    """CPU and memory profiler of the server.
+
+    The CPU profiler only profiles the thread that starts it (the thread
+    that serves the requests), and the memory tracer traces the allocations
+    of all the threads.
+
+    Arguments:
+        directory (str, optional): directory where the results are dumped
+            (default: None, i.e. they're not dumped).
+    """
+
+    def __init__(self, directory=None):
+        """Start without profiling."""
+        self.directory = directory
+        self._cpu = None  # Running CPU profiler
+
+    @property
+    def cpu_running(self):
+        """bool: if the CPU profiler is running."""
+        return self._cpu is not None
+
+    @property
+    def memory_running(self):
+        """bool: if the memory tracer is running."""
+        return tracemalloc is not None and tracemalloc.is_tracing()
+
+    def start_cpu(self):
+        """Start the CPU profiler.
+
+        Raises:
+            ValueError: if it's already running.
+        """
+        if self._cpu is not None:
+            raise ValueError("The CPU profiler is already running")
+
+        self._cpu = cProfile.Profile()
+        self._cpu.enable()
+
+    def stop_cpu(self, limit=LIMIT, sort='cumulative'):
+        """Stop the CPU profiler and get its results.
+
+        Arguments:
+            limit (int, optional): number of functions in the summary
+                (default: LIMIT).
+            sort (str, optional): sort key of the functions, as in
+                pstats.Stats.sort_stats() (default: 'cumulative').
+
+        Raises:
+            ValueError: if it isn't running.
+
+        Returns:
+            dict: summary of the functions that took longer ('summary'), and
+            name of the pstats file ('file', None if not dumped).
+        """
+        if self._cpu is None:
+            raise ValueError("The CPU profiler isn't running")
+
+        profile, self._cpu = self._cpu, None
+        profile.disable()
+
+        summary = StringIO()
+        stats = pstats.Stats(profile, stream=summary)
+        stats.sort_stats(sort).print_stats(limit)
+
+        fname = self._file_name('pstats')
+        if fname is not None:
+            stats.dump_stats(fname)
+
+        return dict(summary=summary.getvalue(), file=fname)
+
+    def start_memory(self, frames=1):
+        """Start the memory tracer.
+
+        Arguments:
+            frames (int, optional): number of frames stored per allocation
+                (default: 1).
+
+        Raises:
+            ValueError: if it's already running, or if tracemalloc is not
+                available (Python 2).
+        """
+        if tracemalloc is None:
+            raise ValueError("The memory tracer requires Python 3.4 or newer")
+        if tracemalloc.is_tracing():
+            raise ValueError("The memory tracer is already running")
+
+        tracemalloc.start(frames)
+
+    def snapshot_memory(self, limit=LIMIT):
+        """Take a snapshot of the memory allocated since the tracer started.
+
+        Arguments:
+            limit (int, optional): number of lines in the summary (default:
+                LIMIT).
+
+        Raises:
+            ValueError: if the tracer isn't running.
+
+        Returns:
+            dict: lines of code that allocated more memory ('summary'), memory
+            allocated now and at the peak, in bytes ('current' and 'peak'), and
+            name of the snapshot file ('file', None if not dumped).
+        """
+        if not self.memory_running:
+            raise ValueError("The memory tracer isn't running")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        current, peak = tracemalloc.get_traced_memory()
+
+        summary = '\n'.join(str(stat) for stat in snapshot.statistics('lineno')[:limit])
+
+        fname = self._file_name('tracemalloc')
+        if fname is not None:
+            snapshot.dump(fname)
+
+        return dict(summary=summary, current=current, peak=peak, file=fname)
+
+    def stop_memory(self, limit=LIMIT):
+        """Take a last snapshot and stop the memory tracer.
+
+        Arguments:
+            limit (int, optional): number of lines in the summary (default:
+                LIMIT).
+
+        Raises:
+            ValueError: if the tracer isn't running.
+
+        Returns:
+            dict: snapshot (see snapshot_memory()).
+        """
+        snapshot = self.snapshot_memory(limit)
+        tracemalloc.stop()
+
+        return snapshot
+
+    def stop(self):
+        """Stop the profilers that are running, discarding their results."""
+        if self._cpu is not None:
+            self._cpu.disable()
+            self._cpu = None
+
+        if self.memory_running:
+            tracemalloc.stop()
+
+    def _file_name(self, ext):
+        """Get a new name for a results file.
+
+        Arguments:
+            ext (str): file extension.
+
+        Returns:
+            str: file name, in the directory, or None if there's no directory.
+        """
+        if not self.directory:
+            return None
+
+        return os.path.join(self.directory, 'socad_{0}_{1}.{2}'.format(
+            os.getpid(), int(time.time() * 1000), ext))
@@ -0,0 +1,377 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Reader of the simulation results written by Spectre in PSF ASCII format.
+
+Reading the results directly from the ``psf`` folder of the results
+directory avoids the OCEAN expression evaluator, which is single-threaded
+and often slower than the simulation itself. Spectre writes PSF ASCII when
+it's run with ``-format psfascii``.
+
+The files are memory-mapped and the values are scanned in a single pass, in
+chunks that are converted to numbers as they're read, so large sweeps are
+never held in memory as text. With NumPy installed,
+the signals of a sweep are returned as arrays; otherwise as ``array.array``
+(real signals) or lists (complex signals).
+
+The net names are the ones in the netlist, without the leading '/' used by
+OCEAN, e.g. "out" for ``v("/out")``.
+"""
+
+import array
+import glob
+import mmap
+import os
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Signal of a sweep (name and value)
+_SWEPT_VALUE = re.compile(br'"([^"]*)" +(\([^()]*\)|[^\s()"]+)')
+
+# Value of an analysis without sweep (name, type and value), or properties
+_VALUE = re.compile(br'''
+    (?P<prop>PROP\((?:[^()"]|"(?:[^"\\]|\\.)*")*\))
+  | "(?P<name>(?:[^"\\]|\\.)*)"\s+"(?P<type>[^"]*)"\s+
+    (?P<value>\((?:[^()"]|"(?:[^"\\]|\\.)*")*\)|"(?:[^"\\]|\\.)*"|[^\s()"]+)''', re.VERBOSE)
+
+# Tokens of the header, type, sweep and trace sections
+_TOKEN = re.compile(br'"(?:[^"\\]|\\.)*"|\w+\(|[()]|[^\s()"]+')
+
+# Tokens of a structure value
+_ITEM = re.compile(br'"(?:[^"\\]|\\.)*"|[^\s()"]+')
+
+_SECTIONS = (b'TYPE', b'SWEEP', b'TRACE')
+
+# Number of bytes of the values of a sweep scanned at once
+CHUNK_SIZE = 1 << 20
+
+
+def find(results_dir, analysis):
+    """Find the PSF file of an analysis in the results directory.
+
+    Arguments:
+        results_dir (str): results directory (as given to resultsDir() in
+            OCEAN), or its psf folder.
+        analysis (str): analysis name, e.g. "ac", "tran" or "dcOpInfo".
+
+    Raises:
+        IOError: if there are no results of the analysis.
+
+    Returns:
+        str: file name, e.g. "<results_dir>/psf/ac.ac".
+    """
+    fnames = []
+    for folder in (os.path.join(results_dir, 'psf'), results_dir):
+        fnames.extend(glob.glob(os.path.join(folder, analysis + '.*')))
+
+    if not fnames:
+        raise IOError("No results of the analysis '{0}' in {1}".format(analysis, results_dir))
+
+    return min(fnames, key=len)
+
+
+def read(fname, signals=None):
+    """Read the results of an analysis from a PSF ASCII file.
+
+    Arguments:
+        fname (str): name of the PSF file.
+        signals (list, optional): names of the signals (or values) to read,
+            or None to read all of them. The sweep variable (e.g. "freq") is
+            always read (default: None).
+
+    Raises:
+        IOError: if the file can't be read.
+        ValueError: if the file is not in PSF ASCII format.
+
+    Returns:
+        dict: values of the signals, by name. In a sweep, each signal is a
+        vector with one value per point. Otherwise, each value is a number,
+        a string or, if it's a structure (e.g. the operating point of a
+        device in "dcOpInfo"), a dict of its fields.
+    """
+    with open(fname, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            raise ValueError("{0} is not a PSF ASCII file".format(fname))
+
+    try:
+        sections = _sections(data, fname)
+        if b'SWEEP' in sections:
+            return _read_sweep(data, sections, signals)
+        return _read_values(data, sections, signals)
+    finally:
+        data.close()
+
+
+def read_header(fname):
+    """Read the header of a PSF ASCII file.
+
+    Arguments:
+        fname (str): name of the PSF file.
+
+    Raises:
+        IOError: if the file can't be read.
+        ValueError: if the file is not in PSF ASCII format.
+
+    Returns:
+        dict: header properties, e.g. "simulator" or "analysis type".
+    """
+    with open(fname, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            raise ValueError("{0} is not a PSF ASCII file".format(fname))
+
+    try:
+        start, end = _sections(data, fname)[b'HEADER']
+        tokens = [_atom(token) for token in _TOKEN.findall(data[start:end])]
+    finally:
+        data.close()
+
+    return dict(zip(tokens[::2], tokens[1::2]))
+
+
+def _sections(data, fname):
+    """Find the sections of a PSF ASCII file.
+
+    The sections before the values are small, so only the beginning of the
+    file is searched (until the start of the values).
+
+    Arguments:
+        data (mmap): contents of the file.
+        fname (str): name of the file, for the error messages.
+
+    Raises:
+        ValueError: if the file is not in PSF ASCII format.
+
+    Returns:
+        dict: start and end offsets of the contents of each section, by name.
+    """
+    values = data.find(b'\nVALUE\n')
+    end = data.rfind(b'\nEND')
+
+    if data[:6] != b'HEADER' or values < 0 or end < values:
+        raise ValueError("{0} is not a PSF ASCII file".format(fname))
+
+    # Offsets of the section names
+    marks = [(b'HEADER', -1)]
+    for name in _SECTIONS:
+        pos = data.find(b'\n' + name + b'\n', 0, values)
+        if pos >= 0:
+            marks.append((name, pos))
+    marks.append((b'VALUE', values))
+    marks.append((b'END', end))
+
+    return dict((name, (pos + len(name) + 2, next_pos))
+                for (name, pos), (_, next_pos) in zip(marks, marks[1:]))
+
+
+def _read_types(data, sections):
+    """Read the fields of the structure types.
+
+    Arguments:
+        data (mmap): contents of the file.
+        sections (dict): start and end offsets of each section.
+
+    Returns:
+        dict: field names of each structure, by type name.
+    """
+    if b'TYPE' not in sections:
+        return {}
+
+    start, end = sections[b'TYPE']
+    structs = {}
+    stack = []  # Structures being read: name and fields
+    name = None  # Name of the last type or field
+    depth = 0  # Depth of the properties being skipped
+
+    for token in _TOKEN.findall(data[start:end]):
+        if depth:
+            depth += {b'(': 1, b')': -1}.get(token[-1:], 0)
+        elif token.startswith(b'"'):
+            name = _atom(token)
+        elif token == b')':
+            if stack:
+                struct, fields = stack.pop()
+                structs[struct] = fields
+        elif token.endswith(b'(') and token != b'STRUCT(':
+            depth = 1  # Properties or array dimensions
+        elif name is not None:  # Kind of the last type, e.g. FLOAT or STRUCT(
+            if stack:
+                stack[-1][1].append(name)
+            if token == b'STRUCT(':
+                stack.append((name, []))
+            name = None
+
+    return structs
+
+
+def _read_sweep(data, sections, signals):
+    """Read the signals of a sweep.
+
+    The values of each chunk are collected as text and converted at the end
+    of the chunk (all at once, if NumPy is installed), so only the text of
+    one chunk is kept in memory.
+
+    Arguments:
+        data (mmap): contents of the file.
+        sections (dict): start and end offsets of each section.
+        signals (list): names of the signals to read, or None.
+
+    Returns:
+        dict: vector of each signal, by name.
+    """
+    start, end = sections[b'SWEEP']
+    sweep = _TOKEN.findall(data[start:end])[0]
+
+    columns = {}  # Values of the current chunk, as text, by signal name
+    vectors = {}  # Converted values of the previous chunks, by signal name
+    wanted = None if signals is None else set(name.encode() for name in signals)
+    if wanted is not None:
+        wanted.add(sweep[1:-1])
+
+    appenders = {}  # Append a value to its column (or drop it), by signal name
+
+    # The values are read in chunks of whole lines, with one value per line
+    pos, end = sections[b'VALUE']
+    while pos < end:
+        chunk_end = data.find(b'\n', min(pos + CHUNK_SIZE, end), end) + 1 or end
+        for name, value in _SWEPT_VALUE.findall(data, pos, chunk_end):
+            try:
+                appenders[name](value)
+            except KeyError:
+                if wanted is None or name in wanted:
+                    columns[name] = [value]
+                    vectors[name] = []
+                    appenders[name] = columns[name].append
+                else:
+                    appenders[name] = _drop
+        pos = chunk_end
+
+        for name, values in columns.items():
+            if values:
+                vectors[name].append(_vector(values))
+                del values[:]  # Same list, still used by its appender
+
+    return dict((name.decode(), _concatenate(parts)) for name, parts in vectors.items())
+
+
+def _read_values(data, sections, signals):
+    """Read the values of an analysis without sweep (e.g. dcOp or dcOpInfo).
+
+    Arguments:
+        data (mmap): contents of the file.
+        sections (dict): start and end offsets of each section.
+        signals (list): names of the values to read, or None.
+
+    Returns:
+        dict: values, by name.
+    """
+    structs = _read_types(data, sections)
+    wanted = None if signals is None else set(name.encode() for name in signals)
+    values = {}
+
+    start, end = sections[b'VALUE']
+    for match in _VALUE.finditer(data, start, end):
+        name = match.group('name')
+        if name is None or (wanted is not None and name not in wanted):
+            continue  # Properties, or a value that wasn't asked for
+
+        value = match.group('value')
+        if value.startswith(b'('):
+            items = [_atom(item) for item in _ITEM.findall(value)]
+            fields = structs.get(match.group('type').decode())
+            value = dict(zip(fields, items)) if fields else items
+        else:
+            value = _atom(value)
+
+        values[name.decode()] = value
+
+    return values
+
+
+def _drop(value):
+    """Drop the value of a signal that wasn't asked for."""
+
+
+def _vector(values):
+    """Convert the values of a signal to a vector.
+
+    Arguments:
+        values (list): values, as text. Complex values are in parentheses.
+
+    Returns:
+        object: NumPy array, array.array (real values) or list (complex
+        values).
+    """
+    if values[0].startswith(b'('):
+        parts = b' '.join(values).replace(b'(', b' ').replace(b')', b' ').split()
+        if numpy is not None:
+            return numpy.array(parts).astype(float).view(complex)
+        return [complex(float(real), float(imag)) for real, imag in zip(parts[::2], parts[1::2])]
+
+    if numpy is not None:
+        return numpy.array(values).astype(float)
+
+    return array.array('d', [float(value) for value in values])
+
+
+def _concatenate(parts):
+    """Join the vectors of the chunks of a signal.
+
+    Arguments:
+        parts (list): vectors (see _vector()), at least one.
+
+    Returns:
+        object: vector of the signal.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    if numpy is not None:
+        return numpy.concatenate(parts)
+
+    vector = parts[0]
+    for part in parts[1:]:
+        vector.extend(part)
+
+    return vector
+
+
+def _atom(token):
+    """Convert a PSF atom (number or string) to Python.
+
+    Arguments:
+        token (bytes): atom.
+
+    Returns:
+        object: integer, float or string.
+    """
+    if token.startswith(b'"'):
+        return token[1:-1].decode()
+
+    try:
+        return int(token)
+    except ValueError:
+        pass
+
+    try:
+        return float(token)
+    except ValueError:
+        return token.decode()
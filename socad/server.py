@@ -15,12 +15,23 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 """Server that stands between a client and Cadence Virtuoso."""
 
-import json
+import select
 import socket
-import struct
-import time
+from collections import deque
 from contextlib import contextmanager
 
+try:
+    import selectors
+except ImportError:  # Python 2
+    selectors = None
+
+from . import codec, compression, journal, log, metrics, profiler, skill
+from .transport import HEADER, READ_SIZE, Transport
+
+# Maximum time, in seconds, that a client has to finish the handshake, when
+# there are several clients
+HANDSHAKE_TIMEOUT = 10.0
+
 
 @contextmanager
 def closing(thing):
@@ -36,35 +47,328 @@ def closing(thing):
         thing.close()
 
 
+class Connection:
+    """A client connected to the server.
+
+    It keeps everything that is negotiated with the client, and the requests
+    received from it that were not processed yet.
+
+    Arguments:
+        sock (object): client socket.
+        addr (tuple): client address.
+        read_size (int): maximum number of bytes to receive per socket call.
+        compress_threshold (int): minimum number of bytes of a frame to be
+            compressed.
+        metrics (Metrics, optional): where the durations of sending,
+            receiving and (de)serializing the data are measured (default:
+            None).
+    """
+
+    def __init__(self, sock, addr, read_size, compress_threshold, metrics=None):
+        """Wrap the client socket."""
+        self.socket = sock
+        self.addr = addr
+        self.metrics = metrics
+        self.transport = Transport(sock, read_size, compress_threshold)
+        self.codec = codec.DEFAULT  # Used until the codec is negotiated
+
+        self.requests = deque()  # Requests received but not processed yet
+        self.journal = None  # Where the requests and replies are recorded, if any
+        self._offer = None  # Codecs, compressors and level offered in the handshake
+        self._reply = bytearray()  # Part of the reply to the handshake received so far
+
+    def handshake(self, codecs, compressors, compress_level=None, session=None):
+        """Exchange the socket names with the client and negotiate the codec
+        and the compressor.
+
+        Arguments:
+            codecs (list): names of the codecs accepted from the client.
+            compressors (list): names of the compressors accepted from the
+                client.
+            compress_level (int, optional): compression level (default: None,
+                i.e. the compressor default).
+            session (dict, optional): state of the Cadence session, sent to
+                the client (default: None).
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in JSON format.
+            KeyError: if the client didn't send its socket name.
+
+        Returns:
+            list: remote socket name.
+        """
+        self.start_handshake(codecs, compressors, compress_level, session)
+
+        return self.finish_handshake()
+
+    def start_handshake(self, codecs, compressors, compress_level=None, session=None):
+        """Send the first message of the handshake (see handshake()).
+
+        The handshake is finished with finish_handshake() or, without
+        blocking, with poll_handshake().
+
+        Arguments:
+            codecs (list): names of the codecs accepted from the client.
+            compressors (list): names of the compressors accepted from the
+                client.
+            compress_level (int, optional): compression level (default: None,
+                i.e. the compressor default).
+            session (dict, optional): state of the Cadence session, sent to
+                the client (default: None).
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+        """
+        # Send the socket address to the client, the codecs and compressors
+        # we can use, and the state of the Cadence session
+        self.send_data(dict(data=self.addr, codecs=codecs, compressors=compressors,
+                            session=session or {}))
+        self._offer = (codecs, compressors, compress_level)
+
+    def finish_handshake(self):
+        """Receive the reply of the client to the handshake, and negotiate the
+        codec and the compressor.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in JSON format.
+            KeyError: if the client didn't send its socket name.
+
+        Returns:
+            list: remote socket name.
+        """
+        # Receive remote socket name, and the codecs and compressors the
+        # client can use
+        return self._negotiate(self.recv_data())
+
+    def poll_handshake(self):
+        """Receive the part of the reply to the handshake that has arrived,
+        and finish the handshake when the whole reply is received.
+
+        It's called when the socket is readable, so it doesn't block: it
+        receives what has arrived (without going past the reply, since the
+        requests may follow it), so a slow client doesn't block the others.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in JSON format.
+            KeyError: if the client didn't send its socket name.
+
+        Returns:
+            bool: if the handshake is finished.
+        """
+        size = HEADER.size
+        if len(self._reply) >= HEADER.size:
+            size += HEADER.unpack_from(self._reply)[0]
+
+        data = self.socket.recv(min(size - len(self._reply), self.transport.read_size))
+        if not data:
+            raise IOError("Socket connection broken while receiving bytes")
+        self._reply += data
+
+        if len(self._reply) < HEADER.size or len(self._reply) < (
+                HEADER.size + HEADER.unpack_from(self._reply)[0]):
+            return False
+
+        self._negotiate(self.codec.decode(self._reply[HEADER.size:]))
+        self._reply = None
+
+        return True
+
+    def _negotiate(self, req):
+        """Negotiate the codec and the compressor with the reply of the client
+        to the handshake.
+
+        Arguments:
+            req (dict): reply of the client.
+
+        Raises:
+            TypeError: if the reply isn't a dict.
+            KeyError: if the client didn't send its socket name.
+
+        Returns:
+            list: remote socket name.
+        """
+        if not isinstance(req, dict):
+            raise TypeError("Invalid handshake reply: {0!r}".format(req))
+
+        codecs, compressors, compress_level = self._offer
+
+        # The remaining data is serialized with the negotiated codec, and the
+        # large frames are compressed with the negotiated compressor
+        self.codec = codec.negotiate(req.get('codecs'), codecs)
+        self.transport.compressor = compression.negotiate(req.get('compressors'), compressors,
+                                                          compress_level)
+
+        return req['data']
+
+    def send_data(self, obj):
+        """Send an object to the client.
+
+        Arguments:
+            obj (dict): object to send.
+
+        Raises:
+            TypeError: if the object is not serializable with the codec.
+            ConnectionError: if the socket connection is broken.
+        """
+        start = metrics.clock() if self.metrics is not None else None
+        data = self.codec.encode(obj)
+
+        # The payload is recorded as it's sent, without serializing it again
+        if self.journal is not None:
+            self.journal.record(journal.REPLY, data, self, self.codec.name)
+
+        if self.metrics is None:
+            self.transport.send_frame(data)
+            return
+
+        encoded = metrics.clock()
+        self.transport.send_frame(data)
+
+        self.metrics.observe('encode', encoded - start)
+        self.metrics.observe('send', metrics.clock() - encoded)
+
+    def recv_data(self):
+        """Receive an object from the client.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in the codec format.
+
+        Returns:
+            dict: de-serialized received data.
+        """
+        if self.metrics is None:
+            data = self.transport.recv_frame()
+            obj = self.codec.decode(data)
+        else:
+            start = metrics.clock()
+            data = self.transport.recv_frame()
+            received = metrics.clock()
+            obj = self.codec.decode(data)
+
+            self.metrics.observe('recv', received - start)
+            self.metrics.observe('decode', metrics.clock() - received)
+
+        if self.journal is not None:
+            self.journal.record(journal.REQUEST, data, self, self.codec.name)
+
+        return obj
+
+    def fileno(self):
+        """Get the file descriptor of the client socket, so the connection
+        can be used with select()."""
+        return self.socket.fileno()
+
+    def close(self):
+        """Close the client socket."""
+        self.socket.close()
+
+
 class Server:
     """A server that handles skill commands.
 
     This server is started and ran by Cadence Virtuoso. It receives data from
     a client and passes it to Cadence. It then gather the Cadence response and
-    send it back to the client. The data sent to client is serialized in JSON
-    and the data from client should also be in JSON.
+    send it back to the client. The data exchanged with the client is
+    serialized with the codec negotiated with it, which is JSON if the client
+    doesn't support any other codec.
+
+    The server either handles a single client, started with :meth:`run`, or
+    several clients at the same time, started with :meth:`listen`. In the
+    latter case, the requests of all the clients share a fair queue in front
+    of Cadence. A single client server started in daemon mode accepts the
+    next client after one leaves (see :meth:`next_client`), so the clients
+    reuse the same Cadence session, and they get its state (:attr:`session`)
+    in the handshake.
 
     Arguments:
         cad_stream (object): Cadence stream.
         sock (object, optional): socket to use in the connection
-            (default: None).        
+            (default: None).
+        read_size (int, optional): maximum number of bytes to receive per
+            socket call (default: READ_SIZE).
+        codecs (list, optional): names of the codecs accepted from the client
+            (default: codec.PREFERENCE).
+        compressors (list, optional): names of the compressors accepted from
+            the client (default: compression.AVAILABLE).
+        compress_level (int, optional): compression level (default: None,
+            i.e. the compressor default).
+        compress_threshold (int, optional): minimum number of bytes of a
+            frame to be compressed (default: compression.THRESHOLD).
+        skill_framing (bool, optional): if the skill expressions are sent
+            preceded by their length, so Cadence can reassemble the large
+            ones. The Cadence requestHandler must support it (default:
+            False).
+        log_level (int, optional): minimum level of the diagnostics sent to
+            Cadence (default: log.DEBUG).
+        log_file (str, optional): file where the diagnostics are written
+            instead of being sent to Cadence (default: None).
+        log_rate (float, optional): maximum number of diagnostics per second
+            (default: log.RATE).
+        journal_file (str, optional): file where the requests, replies and
+            Cadence messages are recorded, to be replayed later (see
+            socad.journal) (default: None, i.e. not recorded).
+        profile_dir (str, optional): directory where the results of the
+            profilers are dumped (see socad.profiler) (default: None, i.e.
+            they're only summarized).
     """
 
-    def __init__(self, cad_stream, sock=None):
+    def __init__(self, cad_stream, sock=None, read_size=READ_SIZE, codecs=codec.PREFERENCE,
+                 compressors=compression.AVAILABLE, compress_level=None,
+                 compress_threshold=compression.THRESHOLD, skill_framing=False,
+                 log_level=log.DEBUG, log_file=None, log_rate=log.RATE, journal_file=None,
+                 profile_dir=None):
         """Create the server socket."""
         self.cad_stream = cad_stream
         self.server_in = cad_stream.stdin
         self.server_out = cad_stream.stdout
         self.server_err = cad_stream.stderr
 
+        # Diagnostics, written in the background
+        self.log_file = open(log_file, 'a') if log_file else None
+        self.log = log.Log(self.log_file or self.server_err, log_level, log_rate)
+
+        # Capture mode
+        self.journal = journal.Journal(journal_file) if journal_file else None
+
+        self.read_size = read_size
+        self.codecs = list(codecs)
+        self.compressors = list(compressors)
+        self.compress_level = compress_level
+        self.compress_threshold = compress_threshold
+        self.skill_framing = False
+
         # Uninitialized variables
-        self.conn = None  # Client socket
+        self.client = None  # Client whose request is being processed
+        self.clients = []  # Connected clients, by turn to be served
+        self.handshakes = {}  # Clients in the handshake, with its deadline
+        self.selector = None  # Only used with several clients
+        self.daemon = False  # If the socket keeps accepting single clients
+
+        # State of the Cadence session (e.g. if the simulator is loaded), sent
+        # to the clients in the handshake
+        self.session = {}
+
+        # Duration of each phase of the requests, and send time of the
+        # expressions that Cadence didn't answer yet
+        self.metrics = metrics.Metrics()
+        self._skill_sent = deque()
+        self._skill_stale = 0  # Answers still due to the previous clients
+
+        # CPU and memory profilers, started and stopped on demand
+        self.profiler = profiler.Profiler(profile_dir)
 
         # Receive initial message from cadence, to check connectivity, and send it back
         # to print on screen
         msg = self.recv_skill()
         self.send_skill(msg)
 
+        # The expressions are only framed once Cadence knows the server has started
+        self.skill_framing = skill_framing
+
         if sock is None:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             # define socket options to allow the reuse of the same addr
@@ -72,12 +376,35 @@ class Server:
         else:
             self.socket = sock
 
-    def run(self, host, port):
-        """Start the server.
+    @property
+    def conn(self):
+        """object: socket of the current client."""
+        return self.client.socket if self.client is not None else None
+
+    @property
+    def transport(self):
+        """Transport: framing of the current client socket."""
+        return self.client.transport if self.client is not None else None
+
+    @property
+    def codec(self):
+        """object: codec negotiated with the current client."""
+        return self.client.codec if self.client is not None else codec.DEFAULT
+
+    @property
+    def requests(self):
+        """deque: requests of the current client that were not processed yet."""
+        return self.client.requests if self.client is not None else deque()
+
+    def run(self, host, port, daemon=False):
+        """Start the server, for a single client.
 
         Arguments:
             host (str): remote socket IP address.
             port (int): remote socket port.
+            daemon (bool, optional): if the server keeps accepting clients,
+                one at a time, after the first one leaves (see next_client())
+                (default: False).
 
         Raises:
             ConnectionError: if there's a communication problem.
@@ -85,178 +412,548 @@ class Server:
         Returns:
             list: remote socket name.
         """
+        self.daemon = daemon
+
         try:
             # Start connection between client and server (UNIX socket)
-            # NOTE: After the connection with the client, the "self.conn" is the socket
-            # that communicates with the client, so the "self.socket" is not required
-            # anymore and can be closed.
-            with closing(self.socket) as s:
-                s.bind((host, port))
-                s.listen(1)  # Waits for client connection
+            self.socket.bind((host, port))
+            self.socket.listen(1)  # Waits for client connection
+        except OSError as err:
+            self.socket.close()
+            raise IOError(err)  # TODO: Replace to "ConnectionError"
+
+        return self._accept_single()
+
+    def next_client(self):
+        """Wait for the next client, in daemon mode.
 
-                # Accept the client connection and get his socket and address
-                self.conn, addr = s.accept()
+        The current client is disconnected, if it's still connected. The
+        answers to the expressions Cadence is still evaluating are discarded
+        when they arrive (see recv_skill()), so the next client is accepted
+        without waiting for them and never gets them.
+
+        Raises:
+            ConnectionError: if the server isn't in daemon mode, or if there's
+                a communication problem.
+
+        Returns:
+            list: remote socket name.
+        """
+        if not self.daemon:
+            raise IOError("Only a server started in daemon mode accepts a new client")
+
+        if self.client is not None:
+            self.drop_client()
+
+        self._skill_stale += len(self._skill_sent)
+        self._skill_sent.clear()
+
+        return self._accept_single()
+
+    def _accept_single(self):
+        """Accept a client, when there's a single client.
+
+        Raises:
+            ConnectionError: if there's a communication problem.
+
+        Returns:
+            list: remote socket name.
+        """
+        try:
+            # Accept the client connection and get his socket and address
+            conn, addr = self.socket.accept()
         except OSError as err:
             raise IOError(err)  # TODO: Replace to "ConnectionError"
+        finally:
+            # NOTE: After the connection with the client, the "self.conn" is the socket
+            # that communicates with the client, so the "self.socket" is not required
+            # anymore and can be closed (unless it accepts the next clients).
+            if not self.daemon:
+                self.socket.close()
+
+        self.client = Connection(conn, addr, self.read_size, self.compress_threshold,
+                                 self.metrics)
+        self.clients = [self.client]
 
         # The next function calls don't need a try statement because if they
         # have an exception the error will be caught in the function that
         # calls this one
+        addr = self.client.handshake(self.codecs, self.compressors, self.compress_level,
+                                     self.session)
+        self.client.journal = self.journal
 
-        # Send the socket address to the client
-        self.send_data(dict(data=addr))
+        return addr
 
-        # Receive remote socket name
-        return self.recv_data()['data']
+    def listen(self, host, port, backlog=5):
+        """Start the server, for several clients.
 
-    def send_data(self, obj):
-        """Send an object through a socket.
+        The clients are accepted while the server waits for requests, in
+        recv_request().
+
+        Arguments:
+            host (str): remote socket IP address.
+            port (int): remote socket port.
+            backlog (int, optional): number of connections waiting to be
+                accepted (default: 5).
+
+        Raises:
+            ConnectionError: if there's a communication problem, or if the
+                multi-client mode is not available (Python 2).
+        """
+        if selectors is None:
+            raise IOError("Serving several clients requires the 'selectors' module")
+
+        try:
+            self.socket.bind((host, port))
+            self.socket.listen(backlog)
+        except OSError as err:
+            raise IOError(err)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ)
+
+    def _accept(self):
+        """Accept a new client, when there are several clients.
+
+        The handshake is finished when the client replies (see
+        _finish_handshake()), so a slow client doesn't block the others.
+        """
+        conn, addr = self.socket.accept()
+        client = Connection(conn, addr, self.read_size, self.compress_threshold, self.metrics)
+
+        try:
+            client.start_handshake(self.codecs, self.compressors, self.compress_level,
+                                   self.session)
+        except IOError:
+            client.close()
+            self.send_warn("[WARNING] Handshake with client {0} failed\n".format(addr))
+            return
+
+        self.handshakes[client] = metrics.clock() + HANDSHAKE_TIMEOUT
+        self.selector.register(client, selectors.EVENT_READ)
 
-        1 - Serialize the object in JSON and encode the string;
+    def _finish_handshake(self, client):
+        """Receive the reply of a client to the handshake, and start serving
+        the client when the handshake is finished.
 
-        2 - pack the serialized object length in an unsigned int (I) [4 bytes],
-            and big-endian byte order (>) (this way the *object size* message
-            has always the same size);
+        The reply must arrive within HANDSHAKE_TIMEOUT (see
+        _expire_handshakes()).
 
-        3 - send the data.
+        Arguments:
+            client (Connection): client in the handshake, with data to receive.
+        """
+        try:
+            if not client.poll_handshake():
+                return
+        except (IOError, TypeError, KeyError):
+            del self.handshakes[client]
+            self.selector.unregister(client)
+            client.close()
+            self.send_warn("[WARNING] Handshake with client {0} failed\n".format(client.addr))
+            return
+
+        del self.handshakes[client]
+        client.journal = self.journal
+        self.clients.append(client)
+
+    def _expire_handshakes(self):
+        """Drop the clients that didn't finish the handshake in time."""
+        now = metrics.clock()
+
+        for client, deadline in list(self.handshakes.items()):
+            if now > deadline:
+                del self.handshakes[client]
+                self.selector.unregister(client)
+                client.close()
+                self.send_warn("[WARNING] Handshake with client {0} timed out\n".format(
+                    client.addr))
+
+    def drop_client(self, client=None):
+        """Disconnect a client.
+
+        Arguments:
+            client (Connection, optional): client to disconnect (default:
+                None, i.e. the current client).
+        """
+        client = client or self.client
+
+        if client in self.clients:
+            self.clients.remove(client)
+        if self.selector is not None:
+            self.selector.unregister(client)
+        if client is self.client:
+            self.client = None
+        if self.journal is not None:
+            self.journal.drop_client(client)
+        self.metrics.drop_client(client)
+
+        client.close()
+
+    def send_data(self, obj):
+        """Send an object through a socket, to the current client.
+
+        1 - Serialize the object with the negotiated codec;
+
+        2 - send the data in a frame, i.e. preceded by its length packed in an
+            unsigned int (I) [4 bytes], and big-endian byte order (>) (this
+            way the *object size* message has always the same size).
 
         Arguments:
             obj (dict): object to send.
 
         Raises:
-            TypeError: if the object is not serializable in JSON.
+            TypeError: if the object is not serializable with the codec.
             ConnectionError: if the socket connection is broken.
         """
-        # Serialize the object in JSON and encode the string as a bytes object
-        try:
-            serialized = json.dumps(obj).encode()
-        except (TypeError, ValueError):
-            raise TypeError('It can only send JSON-serializable data')
+        self.client.send_data(obj)
+
+    def recv_data(self):
+        """Receive an object through a socket, from the current client.
 
-        serialized_len = len(serialized)  # String length
+        1 - Receive a frame, i.e. the first 4 bytes of data, which contains the
+            data length, and then the serialized data;
 
-        # Packed string length
-        pack_serialized_len = struct.pack('>I', serialized_len)
+        2 - de-serialize the data with the negotiated codec.
 
-        # Data to send
-        data = pack_serialized_len + serialized
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in the codec format.
 
-        total_sent = 0
+        Returns:
+            dict: de-serialized received data.
+        """
+        return self.client.recv_data()
 
-        while total_sent < serialized_len:
-            sent = self.conn.send(data[total_sent:])
+    def poll_requests(self, timeout=0):
+        """Queue the requests the clients have already sent.
 
-            if not sent:
-                # TODO: Replace to "ConnectionError"
-                raise IOError("Socket connection broken while sending data")
+        With several clients, it also accepts the new clients (and finishes
+        their handshakes), and drops the ones that disconnect or don't finish
+        the handshake in time.
 
-            total_sent += sent
+        Arguments:
+            timeout (float, optional): maximum time, in seconds, to wait for
+                the first event (default: 0).
 
-    def recv_data(self):
-        """Receive an object through a socket.
+        Raises:
+            ConnectionError: if the socket connection is broken, and there are
+                no queued requests (single client).
+            TypeError: if the received data is not in the codec format.
 
-        1 - Receive the first 4 bytes of data, which contains the data length;
+        Returns:
+            int: number of queued requests.
+        """
+        if self.selector is None:
+            try:
+                while select.select([self.client], [], [], timeout)[0]:
+                    self._queue(self.client)
+                    timeout = 0  # Only wait for the first request
+            except IOError:
+                # The requests sent before disconnecting (e.g. 'exit') are served first
+                if not self.client.requests:
+                    raise
 
-        2 - Receive the data, serialized in JSON, and decode it;
+            return len(self.client.requests)
 
-        3 - Convert the received data in an object.
+        if self.handshakes:
+            # Wake up in time to drop the clients that don't finish the handshake
+            wait = max(min(self.handshakes.values()) - metrics.clock(), 0)
+            timeout = wait if timeout is None else min(timeout, wait)
+
+        events = self.selector.select(timeout)
+
+        while events:
+            for key, _ in events:
+                if key.fileobj is self.socket:
+                    self._accept()
+                    continue
+
+                client = key.fileobj
+                if client in self.handshakes:
+                    self._finish_handshake(client)
+                    continue
+
+                try:
+                    self._queue(client)
+                except (IOError, TypeError) as err:
+                    self.send_warn("[WARNING] Dropping client {0}: {1}\n".format(client.addr,
+                                                                                 err))
+                    self.drop_client(client)
+
+            events = self.selector.select(0)  # Only wait for the first event
+
+        self._expire_handshakes()
+
+        return sum(len(client.requests) for client in self.clients)
+
+    def recv_request(self):
+        """Get the next request from the clients.
+
+        The queued requests are returned first, by order of arrival. When the
+        queue is empty it waits for a new request. With several clients, they
+        take turns, so a client with many queued requests can't starve the
+        others. The client of the returned request becomes the current one.
 
         Raises:
-            ConnectionError: if the socket connection is broken.
-            TypeError: if the received data is not in JSON format.
+            ConnectionError: if the socket connection is broken (single client).
+            TypeError: if the received data is not in the codec format.
 
         Returns:
-            dict: decoded and de-serialized received data.
+            dict: client request.
         """
-        data_len = self.recv_bytes(4)
+        if self.selector is None:
+            if not self.client.requests:
+                # Wait for the request before receiving it, so the time spent
+                # receiving it doesn't include the wait
+                select.select([self.client], [], [])
+                self._queue(self.client)
 
-        if not data_len:
-            # TODO: Replace to "ConnectionError"
-            raise IOError("Socket connection broken while receiving data")
+            # Queue the requests sent while this one was in transit
+            self.poll_requests()
 
-        msg_len = struct.unpack('>I', data_len)[0]
+            return self.client.requests.popleft()
 
-        serialized = self.recv_bytes(msg_len).decode()
+        # Queue the requests sent while the previous one was processed
+        self.poll_requests()
 
-        try:
-            obj = json.loads(serialized)
-        except (TypeError, ValueError):
-            raise TypeError('Received data is not in JSON format')
+        while not any(client.requests for client in self.clients):
+            self.poll_requests(None)
 
-        return obj
+        # The first client (by turn) with a queued request goes to the end of the line
+        client = next(client for client in self.clients if client.requests)
+        self.clients.remove(client)
+        self.clients.append(client)
 
-    def recv_bytes(self, n_bytes):
-        """Receive a specified number of bytes through a socket.
+        self.client = client
+        return client.requests.popleft()
+
+    def _queue(self, client):
+        """Receive a request from a client and queue it.
 
         Arguments:
-            n_bytes (int): number of bytes to receive.
+            client (Connection): client.
 
         Raises:
             ConnectionError: if the socket connection is broken.
+            TypeError: if the received data is not in the codec format.
+        """
+        req = client.recv_data()
+        self.metrics.start_request(req, client)
+        client.requests.append(req)
 
-        Returns:
-            bytes: received bytes stream.
+    def send_reply(self, req, obj, client=None):
+        """Send the reply to a request, to the client that sent it.
+
+        The reply gets the request ID (if any), so the client can match the
+        reply to the request. A reply that can't be serialized with the codec
+        is replaced by an error reply, so only that request fails. With
+        several clients, a client that disconnects before getting its reply
+        is dropped. The time since the request was received is measured in
+        the 'request' phase (only until the first reply, in a stream).
+
+        Arguments:
+            req (dict): client request.
+            obj (dict): reply to send.
+            client (Connection, optional): client that sent the request
+                (default: None, i.e. the current client).
+
+        Raises:
+            ConnectionError: if the socket connection is broken (single client).
         """
-        data = b''  # Bytes literal
-        data_len = len(data)
+        client = client or self.client
 
-        while data_len < n_bytes:
-            # Receives a maximum of 1024 bytes per iteration
-            packet = self.conn.recv(min(n_bytes - data_len, 1024))
+        if 'id' in req:
+            obj = dict(obj, id=req['id'])
 
-            if not packet:
-                # TODO: Replace to "ConnectionError"
-                raise IOError("Socket connection broken while receiving bytes")
+        if self.selector is not None and client not in self.clients:
+            return  # The client has already disconnected
 
-            data_len += len(packet)
-            data += packet
+        try:
+            try:
+                client.send_data(obj)
+            except TypeError as err:
+                # Nothing was sent, so the client gets the error instead
+                obj = dict(type='error', data=str(err))
+                if 'id' in req:
+                    obj['id'] = req['id']
+                client.send_data(obj)
+        except IOError as err:
+            if self.selector is None:
+                raise
+            self.send_warn("[WARNING] Dropping client {0}: {1}\n".format(client.addr, err))
+            self.drop_client(client)
+
+        self.metrics.end_request(req)
+
+    def recv_bytes(self, n_bytes):
+        """Receive a specified number of bytes through a socket, from the
+        current client.
+
+        Arguments:
+            n_bytes (int): number of bytes to receive.
 
-        return data
+        Raises:
+            ConnectionError: if the socket connection is broken.
 
-    def send_skill(self, expr):
+        Returns:
+            bytearray: received bytes stream.
+        """
+        return self.client.transport.recv_bytes(n_bytes)
+
+    def send_skill(self, expr, answered=False):
         """Send a skill expression to Cadence Virtuoso for evaluation.
 
+        With skill framing, the expression is preceded by its length (number
+        of bytes) and a newline, like the messages sent by Cadence. The time
+        spent writing the expression is measured in the 'skill_send' phase,
+        and, if Cadence answers it, the time until the answer is received in
+        the 'cadence' phase.
+
         Arguments:
-            data (str): skill expression.
+            expr (str): skill expression.
+            answered (bool, optional): if Cadence answers the expression, i.e.
+                the caller receives the answer with recv_skill() (default:
+                False, e.g. a message that Cadence just prints).
         """
+        start = metrics.clock()
+
+        if self.skill_framing:
+            num_bytes = len(expr) if isinstance(expr, bytes) else len(expr.encode('utf-8'))
+            self.server_out.write("{0}\n".format(num_bytes))
+
         self.server_out.write(expr)
         self.server_out.flush()
 
+        if self.journal is not None:
+            self.journal.record(journal.SKILL_SEND, expr)
+
+        sent = metrics.clock()
+        self.metrics.observe('skill_send', sent - start)
+
+        # The response time is measured from now, for the messages Cadence answers
+        if answered:
+            self._skill_sent.append(sent)
+
     def recv_skill(self):
         """Receive a response from Cadence.
 
         First receives the message length (number of bytes) and then receives
-        the message.
+        the message. The answers due to the previous clients (see
+        next_client()) are skipped.
 
         Returns:
             str: message received from Cadence Virtuoso.
         """
-        num_bytes = int(self.server_in.readline())
-        msg = self.server_in.read(num_bytes)
+        while True:
+            num_bytes = int(self.server_in.readline())
+            msg = self.server_in.read(num_bytes)
+
+            if not self._skill_stale:
+                break
+            self._skill_stale -= 1
+
+        if self._skill_sent:
+            self.metrics.observe('cadence', metrics.clock() - self._skill_sent.popleft())
 
         # Remove the '\n' from the message
         if msg[-1] == '\n':
             msg = msg[:-1]
 
+        if self.journal is not None:
+            self.journal.record(journal.SKILL_RECV, msg)
+
         return msg
 
+    def wait_skill(self, timeout=None):
+        """Wait for a message from Cadence, while queuing the requests the
+        clients send in the meantime (see poll_requests()).
+
+        It returns when Cadence has sent a message, when a client sends data,
+        or when the timeout expires, so the server can prepare the next
+        request while Cadence is busy.
+
+        Arguments:
+            timeout (float, optional): maximum time, in seconds, to wait
+                (default: None, i.e. no limit).
+
+        Raises:
+            ConnectionError: if the socket connection is broken (single client).
+            TypeError: if the received data is not in the codec format.
+
+        Returns:
+            bool: if there's a message from Cadence to receive.
+        """
+        if self.selector is None:
+            sources = [self.server_in, self.client]
+        else:
+            sources = [self.server_in, self.socket] + self.clients + list(self.handshakes)
+
+        ready = select.select(sources, [], [], timeout)[0]
+
+        if self.server_in in ready:
+            return True
+
+        if ready:
+            self.poll_requests()
+
+        return False
+
+    def send_skill_batch(self, exprs):
+        """Send several skill expressions to Cadence Virtuoso, in a single
+        message, to be evaluated one after the other.
+
+        Their results are received with recv_skill_batch(), in a single
+        message too.
+
+        Arguments:
+            exprs (list): skill expressions.
+        """
+        self.send_skill(skill.call('socadEvalBatch', list(exprs)), answered=True)
+
+    def recv_skill_batch(self):
+        """Receive the results of the skill expressions sent with
+        send_skill_batch().
+
+        Raises:
+            TypeError: if the message from Cadence is not a batch reply.
+
+        Returns:
+            list: result of each expression, or a SkillError if Cadence
+            failed to evaluate it.
+        """
+        msg = self.recv_skill()
+
+        try:
+            status, results = skill.parse(msg)
+        except ValueError:
+            raise TypeError("Invalid message received from Cadence: {0}".format(msg))
+
+        if status != 'socadEvalBatch_OK':
+            raise TypeError("Invalid message received from Cadence: {0}".format(msg))
+
+        return [value if ok else skill.SkillError(value) for ok, value in results or []]
+
     def send_warn(self, warn):
         """Send a warning message to Cadence Virtuoso.
 
+        The message is buffered and sent in the background (see
+        :class:`socad.log.Log`).
+
         Arguments:
             warn (str): warning message.
         """
-        self.server_err.write(warn)
-        self.server_err.flush()
+        self.log.warning(warn)
 
     def send_debug(self, msg):
         """Send a debug message to Cadence Virtuoso.
 
+        The message is only buffered if the log level is DEBUG, and it's sent
+        in the background.
+
         Arguments:
             msg (str): debug message.
         """
-        time.sleep(1)  # Wait a second before send the message
-        self.send_warn("[Debug] {0}".format(msg))
+        self.log.debug("[Debug] {0}".format(msg))
 
     def close(self, code):
         """Close the server socket and end the communication with Cadence.
@@ -264,9 +961,22 @@ class Server:
         Arguments:
             code (int): exit code.
         """
-        self.conn.close()
+        for client in self.clients + list(self.handshakes):
+            client.close()
+
+        if self.selector is not None:
+            self.selector.close()
+        if self.selector is not None or self.daemon:
+            self.socket.close()  # Still accepting clients
+
         # Send feedback to Cadence
         self.send_warn("Connection with the client ended!\n\n")
+        self.log.close()  # Send the remaining diagnostics
+        if self.log_file is not None:
+            self.log_file.close()
+        if self.journal is not None:
+            self.journal.close()
+        self.profiler.stop()
         self.server_out.close()  # close stdout
         self.server_err.close()  # close stderr
         self.cad_stream.exit(code)  # close connection to cadence (code up to 255)
@@ -0,0 +1,218 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Conversion of numbers in engineering notation, with the SI scale factors
+used by Cadence and Spectre, e.g. 100u, 2.5k or 1e-3, and the SPICE "meg"
+(in any case), e.g. 10meg.
+
+The scale factor is read in a single pass, with the number, so it never
+touches the exponent of a number (e.g. the 'm' in 1e-3m). Letters after the
+scale factor (e.g. the unit in 10uA) are ignored, like Spectre does.
+
+The batch functions work with lists, and with NumPy arrays if NumPy is
+installed.
+"""
+
+import math
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Exponent of each scale factor (case-sensitive, as in Spectre, except "meg")
+EXPONENTS = {
+    'Y': 24, 'Z': 21, 'E': 18, 'P': 15, 'T': 12, 'G': 9, 'M': 6, 'meg': 6, 'K': 3, 'k': 3,
+    '_': 0, '%': -2, 'c': -2, 'm': -3, 'u': -6, 'n': -9, 'p': -12, 'f': -15, 'a': -18,
+    'z': -21, 'y': -24,
+}
+
+# Scale factors used to format numbers, by exponent
+_FACTORS = {24: 'Y', 21: 'Z', 18: 'E', 15: 'P', 12: 'T', 9: 'G', 6: 'M', 3: 'k', -3: 'm',
+            -6: 'u', -9: 'n', -12: 'p', -15: 'f', -18: 'a', -21: 'z', -24: 'y'}
+
+_NUMBER = re.compile(r'''
+    \s*(?P<mantissa>[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?P<exp>[eE][-+]?[0-9]+)?)
+    (?P<factor>[mM][eE][gG]|[YZEPTGMKk_%cmunpfazy]?)[A-Za-z]*\s*$''', re.VERBOSE)
+
+
+def parse(text):
+    """Convert a number in engineering notation to float.
+
+    Arguments:
+        text (str): number, e.g. "100u", "2.5k", "1e-3", "10meg" or "10uA".
+
+    Raises:
+        ValueError: if the text is not a number.
+
+    Returns:
+        float: number.
+    """
+    match = _NUMBER.match(text)
+
+    if not match:
+        raise ValueError("Invalid number: {0!r}".format(text))
+
+    mantissa, exp, factor = match.group('mantissa', 'exp', 'factor')
+
+    if not factor:
+        return float(mantissa)
+    if len(factor) > 1:  # e.g. 10MEG
+        factor = factor.lower()
+    if exp:  # e.g. 1e3k
+        return float(mantissa) * 10.0 ** EXPONENTS[factor]
+
+    # The exponent is appended to the text, so the result is exact (100u == 100e-6)
+    return float("{0}e{1}".format(mantissa, EXPONENTS[factor]))
+
+
+def parse_batch(texts):
+    """Convert several numbers in engineering notation to float.
+
+    Arguments:
+        texts (list): numbers (see parse()).
+
+    Raises:
+        ValueError: if any text is not a number.
+
+    Returns:
+        list: numbers.
+    """
+    values = []
+    append = values.append
+
+    for text in texts:
+        try:  # Most numbers don't have a scale factor
+            append(float(text))
+        except ValueError:
+            append(parse(text))
+
+    return values
+
+
+def parse_array(texts):
+    """Convert several numbers in engineering notation to a NumPy array.
+
+    Arguments:
+        texts (list): numbers (see parse()), in a list or an array.
+
+    Raises:
+        ImportError: if NumPy is not installed.
+        ValueError: if any text is not a number.
+
+    Returns:
+        numpy.ndarray: numbers, with the shape of the input.
+    """
+    if numpy is None:
+        raise ImportError("NumPy is required to parse arrays")
+
+    texts = numpy.asarray(texts)
+    values = numpy.fromiter(parse_batch(texts.ravel().tolist()), dtype=float,
+                            count=texts.size)
+
+    return values.reshape(texts.shape)
+
+
+def format_value(value, sig_figs=3, si=True):
+    """Format a number in engineering notation, i.e. with an exponent that
+    is a multiple of 3.
+
+    Arguments:
+        value (float): number.
+        sig_figs (int, optional): number of significant digits (default: 3).
+        si (bool, optional): if the exponent is replaced by its scale factor,
+            e.g. "k" instead of "e3", when there's one (default: True).
+
+    Returns:
+        str: formatted number, e.g. "2.5k".
+    """
+    value = float(value)
+
+    if value == 0 or math.isinf(value) or math.isnan(value):
+        return repr(value) if value else '0'
+
+    return _format(value, int(math.floor(math.log10(abs(value)))), sig_figs, si)
+
+
+def format_batch(values, sig_figs=3, si=True):
+    """Format several numbers in engineering notation.
+
+    With a NumPy array, the exponents of all the numbers are computed at
+    once.
+
+    Arguments:
+        values (list): numbers, in a list or an array.
+        sig_figs (int, optional): number of significant digits (default: 3).
+        si (bool, optional): if the exponents are replaced by their scale
+            factors (default: True).
+
+    Returns:
+        list: formatted numbers.
+    """
+    if numpy is None or not isinstance(values, numpy.ndarray):
+        return [format_value(value, sig_figs, si) for value in values]
+
+    values = values.astype(float).ravel()
+    finite = numpy.isfinite(values) & (values != 0)
+    exps = numpy.floor(numpy.log10(numpy.abs(numpy.where(finite, values, 1.0)))).astype(int)
+
+    return [_format(value, exp, sig_figs, si) if ok else format_value(value)
+            for value, exp, ok in zip(values.tolist(), exps.tolist(), finite.tolist())]
+
+
+def _format(value, exp, sig_figs, si):
+    """Format a number in engineering notation.
+
+    Arguments:
+        value (float): number, finite and not zero.
+        exp (int): exponent of the number, i.e. floor(log10(abs(value))).
+        sig_figs (int): number of significant digits.
+        si (bool): if the exponent is replaced by its scale factor.
+
+    Returns:
+        str: formatted number.
+    """
+    exp3 = exp // 3 * 3
+    # The mantissa has exp - exp3 + 1 digits before the decimal point
+    mantissa = round(value / 10.0 ** exp3, sig_figs - 1 - exp + exp3)
+
+    if abs(mantissa) >= 1000:  # Rounded up to the next exponent, e.g. 999.9 -> 1k
+        exp3 += 3
+        mantissa = round(value / 10.0 ** exp3, sig_figs - 1)
+
+    return _join(mantissa, exp3, si)
+
+
+def _join(mantissa, exp3, si):
+    """Join the mantissa and the exponent of a number.
+
+    Arguments:
+        mantissa (float): mantissa.
+        exp3 (int): exponent, multiple of 3.
+        si (bool): if the exponent is replaced by its scale factor.
+
+    Returns:
+        str: formatted number.
+    """
+    if mantissa == int(mantissa):  # prevent from displaying .0
+        mantissa = int(mantissa)
+
+    if not exp3:
+        return str(mantissa)
+    if si and exp3 in _FACTORS:
+        return "{0}{1}".format(mantissa, _FACTORS[exp3])
+
+    return "{0}e{1}".format(mantissa, exp3)
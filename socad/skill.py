@@ -0,0 +1,237 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Conversion between Python objects and SKILL expressions and values.
+
+Python strings, numbers, booleans, None and lists map to SKILL strings,
+numbers, ``t``, ``nil`` and lists.
+"""
+
+import math
+import numbers
+import re
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<open>(?:'|list)?\()
+      | (?P<close>\))
+      | (?P<int>[-+]?[0-9]+)(?![^\s()"'])
+      | (?P<float>[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)(?![^\s()"'])
+      | (?P<atom>[^\s()"']+)
+    )''', re.VERBOSE | re.DOTALL)
+
+_CALL = re.compile(r'^\s*(?P<name>\w+)\(', re.DOTALL)
+
+_ESCAPES = {'n': '\n', 't': '\t', '\\': '\\', '"': '"'}
+
+
+class SkillError(Exception):
+    """Error raised by Cadence when evaluating a SKILL expression."""
+
+
+def format_value(obj):
+    """Format a Python object like SKILL prints it (with "%L").
+
+    Arguments:
+        obj (object): object to format.
+
+    Raises:
+        TypeError: if the object has no SKILL equivalent.
+
+    Returns:
+        str: formatted object, e.g. ("GAIN" 1.5).
+    """
+    return _format(obj, '({0})')
+
+
+def format_expr(obj):
+    """Format a Python object as a SKILL expression that evaluates to it.
+
+    Arguments:
+        obj (object): object to format.
+
+    Raises:
+        TypeError: if the object has no SKILL equivalent.
+
+    Returns:
+        str: SKILL expression, e.g. list("GAIN" 1.5).
+    """
+    return _format(obj, 'list({0})')
+
+
+def call(name, *args):
+    """Build the SKILL expression that calls a function.
+
+    Arguments:
+        name (str): function name.
+        *args: function arguments.
+
+    Raises:
+        TypeError: if an argument has no SKILL equivalent.
+
+    Returns:
+        str: SKILL expression, e.g. updateAndRun("run.ocn" list("W1" 2.0)).
+    """
+    return '{0}({1})'.format(name, ' '.join(format_expr(arg) for arg in args))
+
+
+def _format(obj, list_format):
+    """Format a Python object in SKILL.
+
+    Arguments:
+        obj (object): object to format.
+        list_format (str): format of the lists.
+
+    Raises:
+        TypeError: if the object has no SKILL equivalent (including the
+            infinite and NaN floats, which SKILL can't read).
+
+    Returns:
+        str: formatted object.
+    """
+    if obj is None or obj is False:
+        return 'nil'
+    if obj is True:
+        return 't'
+    if isinstance(obj, float):
+        if math.isinf(obj) or math.isnan(obj):
+            raise TypeError("Can't convert {0!r} to SKILL".format(float(obj)))
+        return repr(float(obj))
+    if isinstance(obj, numbers.Integral):
+        return str(int(obj))
+    if isinstance(obj, (list, tuple)):
+        return list_format.format(' '.join(_format(val, list_format) for val in obj))
+    if isinstance(obj, str) or type(obj).__name__ == 'unicode':
+        return '"{0}"'.format(obj.replace('\\', '\\\\').replace('"', '\\"')
+                              .replace('\n', '\\n'))
+
+    raise TypeError("Can't convert {0} to SKILL".format(type(obj).__name__))
+
+
+def parse(text):
+    """Parse a SKILL value, as printed by SKILL.
+
+    Lists may also be written as expressions, i.e. list(...) or '(...). The
+    text is scanned in a single pass, without recursion, so large values
+    (e.g. the results of a batch of simulations) are parsed quickly.
+
+    Arguments:
+        text (str): SKILL value.
+
+    Raises:
+        ValueError: if the text is not a valid SKILL value.
+
+    Returns:
+        object: Python object.
+    """
+    root = []  # Parsed values
+    current = root  # List being parsed
+    parents = []  # Lists that contain the list being parsed
+    pos = 0
+
+    for match in _TOKEN.finditer(text):
+        if match.start() != pos:
+            break
+
+        pos = match.end()
+        kind = match.lastgroup
+
+        if kind == 'open':
+            parents.append(current)
+            current.append([])
+            current = current[-1]
+        elif kind == 'close':
+            if not parents:
+                raise ValueError("Unexpected ')' at position {0}".format(pos - 1))
+            current = parents.pop()
+        elif kind == 'string':
+            current.append(_unescape(match.group(kind)[1:-1]))
+        elif kind == 'float':
+            current.append(float(match.group(kind)))
+        elif kind == 'int':
+            current.append(int(match.group(kind)))
+        else:
+            current.append(_atom(match.group(kind)))
+
+    if text[pos:].strip():
+        raise ValueError("Invalid SKILL value at position {0}: {1!r}".format(pos, text[pos:]))
+    if parents:
+        raise ValueError("Missing ')' at the end of the SKILL value")
+    if len(root) != 1:
+        raise ValueError("Expected a single SKILL value, got {0}".format(len(root)))
+
+    return root[0]
+
+
+def parse_call(text):
+    """Parse a SKILL function call.
+
+    Arguments:
+        text (str): SKILL expression, e.g. loadSimulator("file.ocn").
+
+    Raises:
+        ValueError: if the text is not a function call.
+
+    Returns:
+        tuple: function name and list of arguments.
+    """
+    match = _CALL.match(text)
+
+    if not match:
+        raise ValueError("Not a SKILL function call: {0!r}".format(text))
+
+    # The arguments are parsed as the items of a list
+    return match.group('name'), parse(text[match.end('name'):])
+
+
+def _atom(token):
+    """Convert a SKILL atom (number or symbol) to Python.
+
+    Arguments:
+        token (str): atom.
+
+    Returns:
+        object: number, True (t), None (nil) or the symbol name.
+    """
+    if token == 't':
+        return True
+    if token == 'nil':
+        return None
+
+    try:
+        return int(token)
+    except ValueError:
+        pass
+
+    try:
+        return float(token)
+    except ValueError:
+        return token
+
+
+def _unescape(text):
+    """Replace the escape sequences of a SKILL string.
+
+    Arguments:
+        text (str): string contents, without the quotes.
+
+    Returns:
+        str: unescaped string.
+    """
+    if '\\' not in text:
+        return text
+
+    return re.sub(r'\\(.)', lambda match: _ESCAPES.get(match.group(1), match.group(1)), text)
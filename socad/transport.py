@@ -0,0 +1,213 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Length-prefixed framing over a stream socket, shared by client and server.
+
+Each frame is a 4-byte header, with the payload length packed as an unsigned
+int (I) in big-endian byte order (>), followed by the payload. When both ends
+negotiated a compressor, the most significant bit of the header flags a
+compressed payload.
+"""
+
+import struct
+
+from .compression import THRESHOLD
+
+try:
+    ConnectionError = ConnectionError  # pylint: disable=redefined-builtin
+except NameError:  # Python 2
+    ConnectionError = IOError  # pylint: disable=redefined-builtin
+
+HEADER = struct.Struct('>I')
+
+# Header flag of a compressed payload
+COMPRESSED = 0x80000000
+
+# Default maximum number of bytes requested to the socket per "recv" call
+READ_SIZE = 256 * 1024
+
+
+def pack_frame(payload, compressor=None, threshold=THRESHOLD):
+    """Build the header of a frame, compressing the payload if it's worth it.
+
+    Arguments:
+        payload (bytes): data to send.
+        compressor (object, optional): negotiated compressor (default: None).
+        threshold (int, optional): minimum number of bytes of a payload to be
+            compressed (default: THRESHOLD).
+
+    Returns:
+        tuple: frame header and payload to send.
+    """
+    flags = 0
+
+    if compressor is not None and len(payload) >= threshold:
+        compressed = compressor.compress(payload)
+
+        # Incompressible data is sent as it is
+        if len(compressed) < len(payload):
+            payload = compressed
+            flags = COMPRESSED
+
+    return HEADER.pack(len(payload) | flags), payload
+
+
+def unpack_header(header, compressor=None):
+    """Get the payload length from a frame header.
+
+    Arguments:
+        header (bytearray): frame header.
+        compressor (object, optional): negotiated compressor (default: None).
+
+    Returns:
+        tuple: payload length and whether the payload is compressed.
+    """
+    msg_len = HEADER.unpack_from(header)[0]
+
+    # Without a compressor, the flag can only be part of a (huge) length
+    compressed = bool(compressor is not None and msg_len & COMPRESSED)
+    if compressed:
+        msg_len &= ~COMPRESSED
+
+    return msg_len, compressed
+
+
+class Transport:
+    """Send and receive length-prefixed frames through a socket.
+
+    Received frames are read directly into a preallocated buffer, so a large
+    frame is never copied while it's being assembled.
+
+    Arguments:
+        sock (object): connected socket.
+        read_size (int, optional): maximum number of bytes to receive per
+            socket call (default: READ_SIZE).
+        threshold (int, optional): minimum number of bytes of a payload to be
+            compressed (default: THRESHOLD).
+    """
+
+    def __init__(self, sock, read_size=READ_SIZE, threshold=THRESHOLD):
+        """Wrap the socket."""
+        self.socket = sock
+        self.read_size = read_size
+        self.threshold = threshold
+        self.compressor = None  # Set when a compressor is negotiated
+        self._header = bytearray(HEADER.size)
+
+    def send_frame(self, payload):
+        """Send a payload as a single frame.
+
+        The header and the payload are sent without being concatenated. If
+        there's a compressor, payloads above the threshold are compressed.
+
+        Arguments:
+            payload (bytes): data to send.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+        """
+        header, payload = pack_frame(payload, self.compressor, self.threshold)
+
+        if hasattr(self.socket, 'sendmsg'):
+            self._sendmsg(header, payload)
+        else:  # Python 2
+            self.socket.sendall(header)
+            self.socket.sendall(payload)
+
+    def _sendmsg(self, header, payload):
+        """Send the header and the payload with scatter/gather I/O.
+
+        Arguments:
+            header (bytes): frame header.
+            payload (bytes): frame payload.
+        """
+        buffers = [memoryview(header), memoryview(payload)]
+
+        while buffers:
+            sent = self.socket.sendmsg(buffers)
+
+            if not sent:
+                raise ConnectionError("Socket connection broken while sending data")
+
+            # Drop the buffers (or part of them) that were already sent
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            if buffers:
+                buffers[0] = buffers[0][sent:]
+
+    def recv_frame(self):
+        """Receive a frame.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+            TypeError: if a compressed payload can't be decompressed.
+
+        Returns:
+            bytearray: frame payload (bytes, if it was compressed).
+        """
+        self.recv_into(self._header)
+        msg_len, compressed = unpack_header(self._header, self.compressor)
+
+        payload = bytearray(msg_len)
+        self.recv_into(payload)
+
+        if compressed:
+            return self.compressor.decompress(payload)
+
+        return payload
+
+    def recv_bytes(self, n_bytes):
+        """Receive a specified number of bytes.
+
+        Arguments:
+            n_bytes (int): number of bytes to receive.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+
+        Returns:
+            bytearray: received bytes.
+        """
+        data = bytearray(n_bytes)
+        self.recv_into(data)
+
+        return data
+
+    def recv_into(self, buf):
+        """Fill a buffer with bytes received from the socket.
+
+        Arguments:
+            buf (bytearray): buffer to fill.
+
+        Raises:
+            ConnectionError: if the socket connection is broken.
+        """
+        view = memoryview(buf)
+        n_bytes = len(buf)
+        data_len = 0
+
+        while data_len < n_bytes:
+            received = self.socket.recv_into(view[data_len:],
+                                             min(n_bytes - data_len, self.read_size))
+
+            if not received:
+                raise ConnectionError("Socket connection broken while receiving bytes")
+
+            data_len += received
+
+    def close(self):
+        """Close the socket."""
+        self.socket.close()
@@ -0,0 +1,134 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Helpers of the tests: servers of the example, with a fake Cadence."""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from socad import Client, Server, log
+from socad.fake import FakeCadence
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example',
+                           'socad_cadence')
+
+
+def import_cadence():
+    """Import the server of the example (cadence.py).
+
+    Its project folder is a scratch copy of the example one, shared by all
+    the servers of the tests.
+
+    Returns:
+        module: cadence module.
+    """
+    if 'SOCAD_ROOT_DIR' not in os.environ:
+        root_dir = tempfile.mkdtemp(prefix='socad_test_')
+        script_dir = os.path.join(root_dir, 'script')
+        shutil.copytree(os.path.join(EXAMPLE_DIR, 'script'), script_dir)
+        os.environ['SOCAD_ROOT_DIR'] = root_dir
+        os.environ['SOCAD_SCRIPT_DIR'] = script_dir
+
+    if EXAMPLE_DIR not in sys.path:
+        sys.path.insert(0, EXAMPLE_DIR)
+
+    import cadence  # pylint: disable=import-outside-toplevel
+
+    return cadence
+
+
+def free_port():
+    """Get a local port that is not in use.
+
+    Returns:
+        int: port.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def connect(addr, timeout=5.0):
+    """Connect a client to a server, waiting for the server to listen.
+
+    Arguments:
+        addr (tuple): server address.
+        timeout (float, optional): maximum time, in seconds, to wait for the
+            server (default: 5).
+
+    Returns:
+        Client: connected client.
+    """
+    deadline = time.time() + timeout
+
+    while True:
+        client = Client()
+        try:
+            client.run(*addr)
+            return client
+        except ConnectionError:
+            client.close()
+            if time.time() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+class FakeServer:
+    """Server of the example with a fake Cadence, served in a thread.
+
+    Arguments:
+        fake (FakeCadence, optional): fake Cadence (default: None, i.e. a
+            new one).
+        multi_client (bool, optional): if the server has several clients
+            (default: True).
+        daemon (bool, optional): if the clients that leave are replaced by
+            the next ones, like cadence.main() does (default: False).
+        **kwargs: other arguments of the server.
+    """
+
+    def __init__(self, fake=None, multi_client=True, daemon=False, **kwargs):
+        """Start the server."""
+        self.cadence = import_cadence()
+        self.fake = fake or FakeCadence()
+        self.server = Server(self.fake, skill_framing=True, log_level=log.ERROR, **kwargs)
+        self.code = None  # Return code of serve()
+
+        if multi_client:
+            self.server.listen('localhost', 0)
+            self.addr = self.server.socket.getsockname()
+        else:
+            self.addr = ('localhost', free_port())
+
+        self.thread = threading.Thread(target=self._serve, args=(multi_client, daemon))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _serve(self, multi_client, daemon):
+        """Serve the clients until they exit."""
+        if not multi_client:
+            self.server.run(self.addr[0], self.addr[1], daemon)
+        self.code = self.cadence.serve(self.server, multi_client, daemon)
+
+        while daemon and self.code:
+            self.cadence.next_client(self.server, multi_client)
+            self.code = self.cadence.serve(self.server, multi_client, daemon)
@@ -0,0 +1,90 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the caches of simulation results."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from socad.cache import ApproximateCache, ResultCache
+
+
+class TestSharedResultCache(unittest.TestCase):
+    """Result caches of several workers that share the same file."""
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.path = os.path.join(tmp_dir, 'cache.db')
+
+    def open(self, max_entries=100):
+        """Open the cache file."""
+        cache = ResultCache(self.path, max_entries=max_entries)
+        self.addCleanup(cache.close)
+
+        return cache
+
+    def test_same_results_stored_twice(self):
+        first, second = self.open(), self.open()
+        self.assertIsNone(first.get({'W': 1.0}))
+        self.assertIsNone(second.get({'W': 1.0}))
+
+        # Both workers missed, so both simulate and store the results
+        first.put({'W': 1.0}, {'GAIN': 1.0})
+        second.put({'W': 1.0}, {'GAIN': 2.0})
+
+        self.assertEqual(first.get({'W': 1.0}), {'GAIN': 2.0})
+        self.assertEqual(len(first), 1)
+
+    def test_entries_of_all_the_workers(self):
+        first, second = self.open(max_entries=3), self.open(max_entries=3)
+
+        for value in range(2):
+            first.put({'W': float(value)}, {'GAIN': 1.0})
+            second.put({'W': float(value + 2)}, {'GAIN': 1.0})
+
+        # The limit is shared, so the least recently used results are evicted
+        self.assertEqual(len(first), 3)
+        self.assertEqual(second.stats()['entries'], 3)
+        self.assertIsNone(first.get({'W': 0.0}))
+        self.assertIsNotNone(second.get({'W': 3.0}))
+
+
+class TestApproximateCache(unittest.TestCase):
+    """Results of the nearby design points."""
+
+    def test_nearby_point(self):
+        cache = ApproximateCache(dict(W=0.1))
+        cache.put({'W': 1.0, 'L': 2.0}, {'GAIN': 1.0})
+
+        self.assertEqual(cache.get({'W': 1.05, 'L': 2.0}), {'GAIN': 1.0})
+        self.assertIsNone(cache.get({'W': 1.05, 'L': 2.5}))
+        self.assertIsNone(cache.get({'W': 1.5, 'L': 2.0}))
+
+    def test_list_variables(self):
+        cache = ApproximateCache(dict(W=0.1, corners=0.1))
+        cache.put({'W': 1.0, 'corners': ['tt', 'ff'], 'bias': {'vdd': [1.8]}}, {'GAIN': 1.0})
+
+        # The variables that aren't numbers must be equal
+        self.assertEqual(cache.get({'W': 1.05, 'corners': ['tt', 'ff'], 'bias': {'vdd': [1.8]}}),
+                         {'GAIN': 1.0})
+        self.assertIsNone(cache.get({'W': 1.05, 'corners': ['tt'], 'bias': {'vdd': [1.8]}}))
+        self.assertIsNone(cache.get({'W': 1.05, 'corners': ['tt', 'ff'], 'bias': {'vdd': [3.3]}}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the codecs."""
+
+import unittest
+
+from socad.codec import CODECS, PREFERENCE, negotiate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestComplex(unittest.TestCase):
+    """Round trip of complex numbers through all the codecs."""
+
+    def test_scalars_and_lists(self):
+        obj = dict(type='readResults', data=dict(gain=1.5 - 2j, out=[1 + 1j, -0.5j]))
+
+        for name, codec in CODECS.items():
+            with self.subTest(codec=name):
+                self.assertEqual(codec.decode(bytearray(codec.encode(obj))), obj)
+
+    @unittest.skipIf(numpy is None, "requires NumPy")
+    def test_arrays(self):
+        values = numpy.array([[1 + 2j, -3.5j], [0.25, 1e-9 - 1e9j]])
+
+        for name, codec in CODECS.items():
+            with self.subTest(codec=name):
+                res = codec.decode(bytearray(codec.encode(dict(data=values))))['data']
+                self.assertEqual(res.dtype, numpy.complex128)
+                numpy.testing.assert_array_equal(res, values)
+
+
+class TestNumpyScalars(unittest.TestCase):
+    """NumPy scalars are sent as Python values by all the codecs."""
+
+    @unittest.skipIf(numpy is None, "requires NumPy")
+    def test_scalars(self):
+        obj = dict(count=numpy.int64(3), ok=numpy.bool_(True), gain=numpy.float32(0.5),
+                   index=[numpy.uint8(1), numpy.int32(-2)])
+
+        for name, codec in CODECS.items():
+            with self.subTest(codec=name):
+                res = codec.decode(bytearray(codec.encode(obj)))
+                self.assertEqual(res, dict(count=3, ok=True, gain=0.5, index=[1, -2]))
+                self.assertIs(res['ok'], True)
+
+
+class TestNegotiation(unittest.TestCase):
+    """Choice of the codec of a connection."""
+
+    def test_json_is_preferred(self):
+        self.assertEqual(negotiate(PREFERENCE, PREFERENCE).name, 'json')
+
+    def test_binary_on_request(self):
+        self.assertEqual(negotiate(['binary', 'json'], PREFERENCE).name, 'binary')
+        self.assertEqual(negotiate(['binary'], ['json']).name, 'json')
+
+
+if __name__ == '__main__':
+    unittest.main()
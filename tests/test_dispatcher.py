@@ -0,0 +1,233 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the dispatcher, with workers that run a fake Cadence."""
+
+import socket
+import threading
+import time
+import unittest
+
+from socad import compression
+from socad.dispatcher import Dispatcher
+from socad.fake import FakeCadence
+from socad.server import Connection
+from socad.transport import READ_SIZE
+
+from helpers import FakeServer, connect
+
+
+def broken_send(obj):
+    """Stand-in for the send_data() of a worker whose connection is broken."""
+    raise ConnectionError("Broken pipe")
+
+
+class DispatcherTestCase(unittest.TestCase):
+    """Dispatcher served in a thread, in front of some workers."""
+
+    def start(self, backends, **kwargs):
+        """Start the dispatcher and connect a client to it.
+
+        Arguments:
+            backends (list): addresses of the workers.
+            **kwargs: arguments of the dispatcher.
+
+        Returns:
+            Client: connected client.
+        """
+        kwargs.setdefault('health_interval', None)
+        self.dispatcher = Dispatcher(backends, **kwargs)
+        self.dispatcher.connect()
+        self.dispatcher.listen('localhost', 0)
+
+        stopped = threading.Event()
+        thread = threading.Thread(target=self._serve, args=(stopped,))
+        thread.daemon = True
+        self.dispatcher.running = True
+        thread.start()
+        self.addCleanup(self._stop, stopped, thread)
+
+        client = connect(self.dispatcher.socket.getsockname())
+        self.addCleanup(client.close)
+
+        return client
+
+    def _serve(self, stopped):
+        """Serve the clients until the test ends or the dispatcher stops."""
+        while self.dispatcher.running and not stopped.is_set():
+            self.dispatcher.step(0.02)
+
+    def _stop(self, stopped, thread):
+        """Stop the dispatcher."""
+        stopped.set()
+        thread.join()
+        self.dispatcher.close()
+
+    def wait_for(self, condition, timeout=5.0):
+        """Wait until a condition is true."""
+        deadline = time.time() + timeout
+        while not condition():
+            self.assertLess(time.time(), deadline, "Timed out")
+            time.sleep(0.01)
+
+
+class TestDispatch(DispatcherTestCase):
+    """Requests spread over the workers."""
+
+    def test_simulations_are_spread(self):
+        workers = [FakeServer(FakeCadence(latency=0.05)) for _ in range(2)]
+        client = self.start([worker.addr for worker in workers])
+
+        self.assertEqual(client.request('loadSimulator', None)['type'], 'loadSimulator')
+        loaded = [worker.fake.evaluations for worker in workers]
+
+        ids = [client.submit('updateAndRun', {'W': float(i)}) for i in range(4)]
+        results = [client.recv_reply(req_id)['data']['SUM'] for req_id in ids]
+
+        self.assertEqual(results, [0.0, 1.0, 2.0, 3.0])
+        for worker, count in zip(workers, loaded):
+            self.assertGreater(worker.fake.evaluations, count)
+
+    def test_streamed_batch(self):
+        workers = [FakeServer() for _ in range(2)]
+        client = self.start([worker.addr for worker in workers])
+
+        replies = list(client.stream('batchUpdateAndRun', [{'W': float(i)} for i in range(3)]))
+
+        self.assertEqual(sorted(res['index'] for res in replies), [0, 1, 2])
+        for res in replies:
+            self.assertEqual(res['data']['SUM'], float(res['index']))
+
+    def test_invalid_requests_dont_reach_the_workers(self):
+        worker = FakeServer()
+        client = self.start([worker.addr])
+        count = worker.fake.evaluations
+
+        self.assertEqual(client.request('bogus', 1)['type'], 'error')
+        self.assertEqual(client.request('configure', dict(worker_id=5))['type'], 'error')
+        client.send_data([1])
+        self.assertEqual(client.recv_data()['type'], 'error')
+
+        self.assertEqual(client.request('updateAndRun', {'W': 1.0})['type'], 'updateAndRun')
+        self.assertEqual(worker.fake.evaluations, count + 1)
+        self.assertTrue(self.dispatcher.workers[0].alive)
+
+    def test_shutdown_is_not_forwarded(self):
+        worker = FakeServer()
+        client = self.start([worker.addr])
+
+        client.send_data(dict(type='info', data='shutdown'))
+
+        self.wait_for(lambda: not self.dispatcher.running)
+        self.assertTrue(self.dispatcher.workers[0].alive)
+        self.assertIsNone(worker.code)  # The worker is still serving
+
+    def test_slow_handshake_doesnt_block(self):
+        worker = FakeServer()
+        client = self.start([worker.addr])
+
+        # A client that connects but never finishes the handshake
+        silent = socket.create_connection(self.dispatcher.socket.getsockname())
+        self.addCleanup(silent.close)
+        other = connect(self.dispatcher.socket.getsockname())
+        self.addCleanup(other.close)
+
+        self.assertEqual(other.request('info', 'ping')['data'], 'pong')
+        self.assertEqual(client.request('info', 'ping')['data'], 'pong')
+
+
+class TestFailures(DispatcherTestCase):
+    """Workers that fail."""
+
+    def test_unsent_request_is_retried(self):
+        workers = [FakeServer() for _ in range(2)]
+        client = self.start([worker.addr for worker in workers])
+        count = workers[0].fake.evaluations
+
+        # The request is sent to the first worker (they're equally busy)
+        self.dispatcher.workers[0].client.send_data = broken_send
+
+        self.assertEqual(client.request('updateAndRun', {'W': 1.0})['data']['SUM'], 1.0)
+        self.assertFalse(self.dispatcher.workers[0].alive)
+        self.assertEqual(workers[0].fake.evaluations, count)
+
+    def test_retries_are_limited(self):
+        workers = [FakeServer() for _ in range(2)]
+        client = self.start([worker.addr for worker in workers], max_attempts=2)
+
+        for worker in self.dispatcher.workers:
+            worker.client.send_data = broken_send
+
+        res = client.request('updateAndRun', {'W': 1.0})
+        self.assertEqual(res['type'], 'error')
+        self.assertIn("Worker failed", res['data'])
+
+    def test_job_of_crashed_worker_is_not_resent(self):
+        def crash(*args):  # pylint: disable=unused-argument
+            # The worker dies while it simulates
+            for conn in list(crashing.server.clients):
+                conn.socket.shutdown(socket.SHUT_RDWR)
+            return "updateAndRun_OK"
+
+        crashing = FakeServer(FakeCadence(handlers=dict(updateAndRun=crash)))
+        healthy = FakeServer()
+        client = self.start([crashing.addr, healthy.addr])
+        count = healthy.fake.evaluations
+
+        res = client.request('updateAndRun', {'W': 1.0})
+
+        self.assertEqual(res['type'], 'error')
+        self.assertIn("Worker failed", res['data'])
+        self.assertFalse(self.dispatcher.workers[0].alive)
+        self.assertEqual(healthy.fake.evaluations, count)
+
+        # The next requests go to the other worker
+        self.assertEqual(client.request('updateAndRun', {'W': 2.0})['data']['SUM'], 2.0)
+
+    def test_health_check_timeout(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('localhost', 0))
+        listener.listen(1)
+        self.addCleanup(listener.close)
+        done = threading.Event()
+        self.addCleanup(done.set)
+
+        def hung_worker():
+            # It's configured, and then never answers (e.g. Cadence hung)
+            conn, addr = listener.accept()
+            worker = Connection(conn, addr, READ_SIZE, compression.THRESHOLD)
+            worker.handshake(['json'], [])
+            worker.recv_data()
+            worker.send_data(dict(type='configure', data=0))
+            done.wait()
+            worker.close()
+
+        thread = threading.Thread(target=hung_worker)
+        thread.daemon = True
+        thread.start()
+
+        start = time.time()
+        client = self.start([listener.getsockname()], health_interval=0.05,
+                            health_timeout=0.2)
+
+        self.wait_for(lambda: not self.dispatcher.workers[0].alive)
+        self.assertGreaterEqual(time.time() - start, 0.25)
+
+        res = client.request('updateAndRun', {'W': 1.0})
+        self.assertEqual(res, dict(type='error', data="There are no workers", id=res['id']))
+
+
+if __name__ == '__main__':
+    unittest.main()
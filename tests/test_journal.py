@@ -0,0 +1,105 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the record and replay of the sessions of a server."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from socad import Client, journal
+from socad.codec import CODECS
+
+from helpers import FakeServer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class JournalTestCase(unittest.TestCase):
+    """Journal in a scratch folder."""
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.fname = os.path.join(tmp_dir, 'session.journal')
+
+
+class TestJournal(JournalTestCase):
+    """Records of the journal."""
+
+    def test_payloads_of_each_codec(self):
+        records = journal.Journal(self.fname)
+        client = object()
+        req = dict(type='updateAndRun', data={'W': 1e-6}, id=1)
+        reply = dict(type='updateAndRun', data={'GAIN': 2.5}, id=1)
+
+        records.record(journal.REQUEST, CODECS['json'].encode(req), client, 'json')
+        records.record(journal.SKILL_SEND, 'updateAndRun("run.ocn")')
+        records.record(journal.REPLY, CODECS['binary'].encode(reply), client, 'binary')
+        records.close()
+
+        self.assertEqual([(record.kind, record.client, record.obj)
+                          for record in journal.read(self.fname)],
+                         [(journal.REQUEST, 0, req),
+                          (journal.SKILL_SEND, 0, 'updateAndRun("run.ocn")'),
+                          (journal.REPLY, 0, reply)])
+
+    @unittest.skipIf(numpy is None, "requires NumPy")
+    def test_numpy_values(self):
+        records = journal.Journal(self.fname)
+        values = numpy.linspace(0.0, 1.0, 5)
+        records.record(journal.REPLY, CODECS['binary'].encode(dict(data=values)), None, 'binary')
+        records.close()
+
+        record, = journal.read(self.fname)
+        numpy.testing.assert_array_equal(record.obj['data'], values)
+
+
+class TestCapture(JournalTestCase):
+    """Sessions recorded by a server, and replayed."""
+
+    def test_record_and_replay(self):
+        server = FakeServer(journal_file=self.fname)
+        for codec in ('json', 'binary'):
+            client = Client(codecs=[codec])
+            client.run(*server.addr)
+            self.assertEqual(client.request('info', 'ping')['data'], 'pong')
+            self.assertEqual(client.request('updateAndRun', {'W': 1.0})['data']['SUM'], 1.0)
+            client.close()
+        server.server.journal.close()
+
+        records = list(journal.read(self.fname))
+        requests = [record for record in records if record.kind == journal.REQUEST]
+        self.assertEqual([(record.client, record.obj['type']) for record in requests],
+                         [(0, 'info'), (0, 'updateAndRun'), (1, 'info'), (1, 'updateAndRun')])
+        replies = [record.obj for record in records if record.kind == journal.REPLY]
+        self.assertEqual([reply['type'] for reply in replies],
+                         [record.obj['type'] for record in requests])
+        self.assertIn(journal.SKILL_SEND, [record.kind for record in records])
+
+        other = FakeServer()
+        replayer = journal.Replayer(self.fname, speed=None)
+        res = replayer.run(*other.addr)
+
+        self.assertEqual(res['requests'], 4)
+        self.assertEqual(len(replayer.sessions), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
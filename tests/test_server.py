@@ -0,0 +1,184 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the server of the example, with a fake Cadence."""
+
+import os
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+from socad import Server, log, skill
+from socad.fake import FakeCadence, model
+
+from helpers import FakeServer, connect
+
+
+def failing_model(variables):
+    """Circuit whose simulations fail for negative variables."""
+    if any(val < 0 for val in variables.values()):
+        raise ValueError("Negative variable")
+
+    return model(variables)
+
+
+def no_results(run_file, var_file, result_file):  # pylint: disable=unused-argument
+    """updateAndRun that "succeeds" without writing the results file."""
+    fname = result_file.split('=', 1)[1]
+    if os.path.exists(fname):
+        os.remove(fname)
+
+    return "updateAndRun_OK"
+
+
+class TestMultiClient(unittest.TestCase):
+    """Server with several clients."""
+
+    def connect(self, server):
+        """Connect a client to the server."""
+        client = connect(server.addr)
+        self.addCleanup(client.close)
+
+        return client
+
+    def test_failed_simulation_fails_only_its_client(self):
+        server = FakeServer(FakeCadence(sim_model=failing_model))
+        failing, other = self.connect(server), self.connect(server)
+
+        failing_id = failing.submit('updateAndRun', {'W': -1.0})
+        other_id = other.submit('updateAndRun', {'W': 2.0})
+
+        res = failing.recv_reply(failing_id)
+        self.assertEqual(res['type'], 'error')
+        self.assertIn("Simulation failed", res['data'])
+        self.assertEqual(other.recv_reply(other_id)['data']['SUM'], 2.0)
+
+        # Both clients are still served
+        self.assertEqual(failing.request('updateAndRun', {'W': 1.0})['data']['SUM'], 1.0)
+        self.assertEqual(other.request('updateAndRun', {'W': 3.0})['data']['SUM'], 3.0)
+        self.assertIsNone(server.code)
+
+    def test_failed_simulation_of_stream(self):
+        server = FakeServer(FakeCadence(sim_model=failing_model))
+        client = self.connect(server)
+
+        replies = list(client.stream('batchUpdateAndRun', [{'W': 1.0}, {'W': -1.0}, {'W': 3.0}]))
+
+        self.assertEqual([res['index'] for res in replies], [0, 1, 2])
+        self.assertEqual([res['type'] for res in replies],
+                         ['updateAndRun', 'error', 'updateAndRun'])
+
+    def test_missing_results_file(self):
+        server = FakeServer(FakeCadence(handlers=dict(updateAndRun=no_results)))
+        client = self.connect(server)
+
+        res = client.request('updateAndRun', {'W': 1.0})
+
+        self.assertEqual(res['type'], 'error')
+        self.assertIn("Simulation failed", res['data'])
+        self.assertEqual(client.request('info', 'ping')['data'], 'pong')
+
+    def test_invalid_request(self):
+        server = FakeServer()
+        client = self.connect(server)
+
+        self.assertEqual(client.request('bogus', 1)['type'], 'error')
+        self.assertEqual(client.request('updateAndRun', {'W': 1.0})['data']['SUM'], 1.0)
+
+    def test_silent_handshake(self):
+        with mock.patch('socad.server.HANDSHAKE_TIMEOUT', 0.2):
+            server = FakeServer()
+
+            # A client that connects but never replies to the handshake
+            silent = socket.create_connection(server.addr)
+            self.addCleanup(silent.close)
+            client = self.connect(server)
+
+            start = time.time()
+            self.assertEqual(client.request('info', 'ping')['data'], 'pong')
+            self.assertLess(time.time() - start, 0.2)
+
+            # The silent client is dropped when the handshake times out
+            silent.settimeout(5.0)
+            while silent.recv(4096):
+                pass
+            self.assertFalse(server.server.handshakes)
+
+
+class TestSingleClient(unittest.TestCase):
+    """Server with a single client."""
+
+    def test_invalid_request(self):
+        server = FakeServer(multi_client=False)
+        client = connect(server.addr)
+        self.addCleanup(client.close)
+
+        res = client.request('bogus', 1)
+        self.assertEqual(res['type'], 'error')
+        self.assertIn("Invalid request", res['data'])
+        client.send_data([1])
+        self.assertEqual(client.recv_data()['type'], 'error')
+
+        self.assertEqual(client.request('updateAndRun', {'W': 1.0})['data']['SUM'], 1.0)
+        self.assertIsNone(server.code)
+
+    def test_next_client_while_cadence_is_busy(self):
+        busy = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_model(variables):
+            if variables.get('W') == 99.0:
+                busy.set()
+                release.wait()
+            return model(variables)
+
+        server = FakeServer(FakeCadence(sim_model=slow_model), multi_client=False, daemon=True)
+        client = connect(server.addr)
+        client.submit('updateAndRun', {'W': 99.0})
+        self.assertTrue(busy.wait(5.0))
+        client.close()  # It leaves without waiting for the results
+
+        # The next client doesn't wait for Cadence to answer the previous one
+        other = connect(server.addr)
+        self.addCleanup(other.close)
+        self.assertEqual(other.request('info', 'ping')['data'], 'pong')
+
+        release.set()
+        self.assertEqual(other.request('updateAndRun', {'W': 2.0})['data']['SUM'], 2.0)
+
+
+class TestSkill(unittest.TestCase):
+    """Expressions sent to Cadence."""
+
+    def test_only_answered_expressions_are_timed(self):
+        fake = FakeCadence()
+        server = Server(fake, skill_framing=True, log_level=log.ERROR)
+        self.addCleanup(server.socket.close)
+
+        # Cadence just prints a message, even if it has parentheses
+        server.send_skill("Connected to client (localhost)")
+        server.send_skill(skill.call('loadSimulator', 'sim.ocn'), answered=True)
+
+        self.assertEqual(server.recv_skill(), '"loadSimulator_OK"')
+        self.assertEqual(server.metrics.stats()['cadence']['count'], 1)
+        self.assertFalse(server._skill_sent)  # pylint: disable=protected-access
+        self.assertIn("Connected to client (localhost)", fake.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# This file is part of SOCAD
+# Copyright (C) 2018  Miguel Fernandes
+#
+# SOCAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SOCAD is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""Tests of the numbers in engineering notation."""
+
+import unittest
+
+from socad import si
+
+
+class TestParse(unittest.TestCase):
+    """Numbers with scale factors."""
+
+    def test_scale_factors(self):
+        cases = {'100u': 100e-6, '2.5k': 2.5e3, '1e-3m': 1e-6, '10uA': 10e-6, '1M': 1e6,
+                 '1P': 1e15, '1E': 1e18, '1Y': 1e24, '1a': 1e-18, '1z': 1e-21, '1y': 1e-24}
+
+        for text, value in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(si.parse(text), value)
+
+    def test_meg(self):
+        for text in ('1meg', '1MEG', '1Meg', '1megohm'):
+            with self.subTest(text=text):
+                self.assertEqual(si.parse(text), 1e6)
+        self.assertEqual(si.parse('1mA'), 1e-3)
+
+
+class TestFormat(unittest.TestCase):
+    """Numbers formatted with scale factors."""
+
+    def test_full_range(self):
+        cases = {1e15: '1P', 1e18: '1E', 2e21: '2Z', 1e24: '1Y', 1e-18: '1a', 1e-21: '1z',
+                 1e-24: '1y', 1e27: '1e27', 999.9e-9: '1u', 0.0: '0'}
+
+        for value, text in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(si.format_value(value), text)
+
+    def test_round_trip(self):
+        for exp in range(-24, 27, 3):
+            with self.subTest(exp=exp):
+                self.assertEqual(si.parse(si.format_value(1.5 * 10.0 ** exp)), float(
+                    "1.5e{0}".format(exp)))
+
+
+if __name__ == '__main__':
+    unittest.main()